@@ -0,0 +1,3 @@
+# Puts ``guardian`` on sys.path for tests/. The two scripts here need a camera or a
+# running Pi and are run by hand.
+collect_ignore = ["test_camera.py", "test_webrtc_client.py"]
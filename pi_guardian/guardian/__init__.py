@@ -1,3 +1,10 @@
 """Guardian edge stack package."""
 
-from .api import build_app  # noqa: F401
+
+def __getattr__(name: str):
+    # Importing a submodule (``guardian.storage``, ``guardian.reanalyze``) should not load the API.
+    if name == "build_app":
+        from .api import build_app
+
+        return build_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,23 +1,75 @@
 from __future__ import annotations
 
 import asyncio
+import hmac
+import importlib
+import logging
 import time
 from pathlib import Path
 
-from fastapi import Depends, FastAPI, File, HTTPException, UploadFile, Request
+from fastapi import Depends, FastAPI, File, HTTPException, UploadFile, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 
+from .cameras import CAMERAS, CameraUnit
+from .clip_trim import plan_trim
 from .config import CONFIG
+from .continuous import SEGMENTS, vod_playlist
+from .control import CONTROL
+from .detection import DETECTOR, SCHEDULER
 from .event_engine import ENGINE
-from .rolling_buffer import BUFFER
-from .hls import HLS_STREAM
+from .file_reaper import FILE_REAPER
+from .frame_bus import FRAME_READER, reader_for
+from .snapshots import file_etag
+from .live_events import LIVE_EVENTS
+from .media_crypto import is_encrypted, media_size, open_media, read_media_bytes
+from .notifications import NOTIFIER
+from .profiler import ProfilerBusy, run_profile
+from .recordings import RECORDINGS
+from .sensor_history import SENSOR_HISTORY
+from .services import SERVICES, lazy
 from .storage import STORE
-from .webrtc import WEBRTC
+from .tracks import TRACKS
+from .zip_export import forget_crcs, plan_event_export
+
+LOGGER = logging.getLogger(__name__)
 
 START_TS = time.time()
 
+# aiortc and PyAV are only imported once WebRTC is first used.
+WEBRTC = lazy("webrtc", lambda: importlib.import_module(f"{__package__}.webrtc").WebRTCManager())
+
+
+async def _serve_cached_file(path: Path, media_type: str, request: Request, max_age: int = 86400):
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="File missing")
+    etag = file_etag(path)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    if await asyncio.to_thread(is_encrypted, path):
+        # Thumbnails, sprites and previews are small; decrypt whole.
+        return Response(await asyncio.to_thread(read_media_bytes, path), media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def _parse_range(range_header: str, size: int) -> tuple[int, int]:
+    """Parse a single ``bytes=start-end`` range against ``size``; raises 416 when unusable."""
+    units, _, range_spec = range_header.partition("=")
+    if units.strip() != "bytes":
+        raise HTTPException(status_code=416, detail="Unsupported range unit")
+    start_str, _, end_str = range_spec.partition("-")
+    try:
+        start = int(start_str) if start_str else 0
+        end = int(end_str) if end_str else size - 1
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Invalid range")
+    end = min(end, size - 1)
+    if start >= size or start < 0:
+        raise HTTPException(status_code=416, detail="Range not satisfiable")
+    return start, end
+
 
 class ModeRequest(BaseModel):
     out_of_home: bool = Field(..., description="True when the porch should trigger events")
@@ -40,6 +92,12 @@ class WebRTCOffer(BaseModel):
     type: str
 
 
+class IceCandidate(BaseModel):
+    candidate: str = ""
+    sdpMid: str | None = None
+    sdpMLineIndex: int | None = None
+
+
 def build_app() -> FastAPI:
     app = FastAPI(title="Guardian Edge API", version="0.1.0", default_response_class=JSONResponse)
 
@@ -51,92 +109,364 @@ def build_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    # In split mode this process is an API worker: the capture daemon owns the engine,
+    # frames arrive over shared memory and state changes go through the control channel.
+    split = CONFIG.process.split
+
+    async def _control(op: str, **args: object) -> dict[str, object]:
+        try:
+            return await CONTROL.call(op, **args)
+        except ConnectionError as exc:
+            raise HTTPException(status_code=503, detail=str(exc))
+
+    def _out_of_home() -> bool:
+        return FRAME_READER.state().out_of_home if split else ENGINE.out_of_home
+
+    def _camera(camera_id: str) -> CameraUnit:
+        unit = CAMERAS.get(camera_id)
+        if unit is None:
+            raise HTTPException(status_code=404, detail="Unknown camera")
+        return unit
+
+    def _require_admin(request: Request) -> None:
+        token = CONFIG.admin.token
+        if not token:
+            raise HTTPException(status_code=404, detail="Not Found")
+        scheme, _, supplied = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(supplied.strip().encode(), token.encode()):
+            raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+    # Collapsed stacks of recent profiles by id, newest last.
+    profiles: dict[str, str] = {}
+
+    async def _webrtc():
+        if not SERVICES.is_built("webrtc"):
+            # Build off the event loop: the first use imports aiortc and PyAV.
+            await asyncio.to_thread(SERVICES.get, "webrtc")
+            await WEBRTC.start()
+        return WEBRTC
+
+    background: set[asyncio.Task[object]] = set()
+
+    async def _run_background(name: str, job) -> None:
+        try:
+            await job
+        except Exception:
+            LOGGER.exception("Starting %s failed", name)
+
+    def _start_background(name: str, job) -> None:
+        task = asyncio.create_task(_run_background(name, job), name=f"start-{name}")
+        background.add(task)
+        task.add_done_callback(background.discard)
+
     @app.on_event("startup")
     async def _startup() -> None:
-        await ENGINE.start()
+        CONFIG.ensure_dirs()
+        if split:
+            # The capture daemon runs the only file reaper; workers ask it to run via "reap".
+            CONTROL.start_event_relay()
+        else:
+            FILE_REAPER.start()
+            # Opening cameras and spawning ffmpeg takes seconds; serve requests meanwhile.
+            _start_background("engine", ENGINE.start())
+        if CONFIG.rtc.prewarm_pool_size > 0:
+            _start_background("webrtc", _webrtc())
 
     @app.on_event("shutdown")
     async def _shutdown() -> None:
-        await ENGINE.stop()
-        await WEBRTC.close_all()
+        for task in list(background):
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        if split:
+            await CONTROL.stop_event_relay()
+            for camera_id in CAMERAS.ids():
+                reader_for(camera_id).close()
+        elif SERVICES.is_built("engine"):
+            await ENGINE.stop()
+        if SERVICES.is_built("webrtc"):
+            await WEBRTC.close_all()
+        FILE_REAPER.stop()
 
     @app.get("/api/health")
-    async def get_health() -> dict[str, float | str]:
-        return {"uptime_s": time.time() - START_TS, "out_of_home": ENGINE.out_of_home, "version": app.version}
+    async def get_health() -> dict[str, object]:
+        health: dict[str, object] = {"uptime_s": time.time() - START_TS, "out_of_home": _out_of_home(), "version": app.version}
+        # Build time in ms per subsystem, null until it is first used.
+        health["services"] = SERVICES.status()
+        if split:
+            health["capture_alive"] = FRAME_READER.state().alive
+        return health
 
     @app.get("/api/system/state")
     async def get_state() -> dict[str, object]:
         return {
-            "out_of_home": ENGINE.out_of_home,
+            "out_of_home": _out_of_home(),
             "ice_servers": CONFIG.rtc.ice_servers,
             "storage_root": str(CONFIG.buffer.media_root),
         }
 
+    @app.get("/api/system/detection-stats")
+    async def detection_stats() -> dict[str, object]:
+        if split:
+            return await _control("detection_stats")
+        return {**DETECTOR.stats(), "cameras": SCHEDULER.stats()}
+
+    @app.post("/api/admin/profile", dependencies=[Depends(_require_admin)])
+    async def admin_profile(seconds: float = 10.0, hz: int | None = None, top: int = 25) -> dict[str, object]:
+        if not 0 < seconds <= CONFIG.admin.profile_max_seconds:
+            raise HTTPException(status_code=400, detail=f"seconds must be in (0, {CONFIG.admin.profile_max_seconds:g}]")
+        hz = min(max(1, hz or CONFIG.admin.profile_hz), 1000)
+        top = min(max(1, top), 200)
+        if split:
+            # The engine lives in the capture daemon; profile that process.
+            result = await _control("profile", seconds=seconds, hz=hz, top=top, timeout=seconds + 10)
+        else:
+            try:
+                result = await asyncio.to_thread(run_profile, seconds, hz, top)
+            except ProfilerBusy as exc:
+                raise HTTPException(status_code=409, detail=str(exc))
+        profiles[result["id"]] = result.pop("collapsed")
+        while len(profiles) > CONFIG.admin.profile_keep:
+            profiles.pop(next(iter(profiles)))
+        result["collapsed_url"] = f"/api/admin/profile/{result['id']}/collapsed"
+        return result
+
+    @app.get("/api/admin/profile/{profile_id}/collapsed", dependencies=[Depends(_require_admin)])
+    async def admin_profile_collapsed(profile_id: str):
+        collapsed = profiles.get(profile_id)
+        if collapsed is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return PlainTextResponse(collapsed, headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.collapsed.txt"'})
+
     @app.post("/api/system/mode")
     async def set_mode(payload: ModeRequest) -> dict[str, bool]:
+        if split:
+            return await _control("set_mode", out_of_home=payload.out_of_home)
         ENGINE.set_out_of_home(payload.out_of_home)
         return {"out_of_home": ENGINE.out_of_home}
 
     @app.post("/api/control/light")
     async def set_light(payload: LightRequest) -> dict[str, bool]:
+        if split:
+            return await _control("light", on=payload.on)
         ENGINE.toggle_light(payload.on)
         return {"light": payload.on}
 
     @app.post("/api/control/privacy")
     async def set_privacy(payload: LightRequest) -> dict[str, bool]:
+        if split:
+            return await _control("privacy", on=payload.on)
         ENGINE.set_privacy_led(payload.on)
         return {"privacy_led": payload.on}
 
+    async def _manual_record(unit: CameraUnit, label: str):
+        if split:
+            return await _control("manual_record", label=label, camera=unit.id)
+        return await ENGINE.record_manual(label, unit.id)
+
     @app.post("/api/events/manual-record")
     async def manual_record(payload: ManualRecordRequest):
-        clip_path = BUFFER.promote_to_clip(payload.label)
-        clip_id = Path(clip_path).stem.split("_")[0]
-        # Approximate duration using configured pre/post window
-        STORE.add_event(
-            clip_id,
-            clip_path,
-            duration=CONFIG.buffer.pre_event_seconds + CONFIG.buffer.post_event_seconds,
-            label=payload.label,
-        )
-        return {"clip": clip_path.name, "id": clip_id}
+        return await _manual_record(CAMERAS.primary, payload.label)
+
+    @app.get("/api/cameras")
+    async def list_cameras() -> list[dict[str, object]]:
+        cameras = []
+        for unit in CAMERAS:
+            armed = reader_for(unit.id).state().armed if split else ENGINE.camera_armed(unit)
+            cameras.append(
+                {
+                    "id": unit.id,
+                    "backend": unit.spec.backend,
+                    "resolution": list(unit.spec.resolution),
+                    "fps": unit.spec.fps,
+                    "sensor_armed": unit.spec.sensor_armed,
+                    "armed": armed,
+                    "snapshot_url": f"/api/cameras/{unit.id}/snapshot",
+                    "hls_url": f"/api/cameras/{unit.id}/hls/{unit.hls.playlist_path.name}",
+                }
+            )
+        return cameras
+
+    @app.post("/api/cameras/{camera_id}/manual-record")
+    async def camera_manual_record(camera_id: str, payload: ManualRecordRequest):
+        return await _manual_record(_camera(camera_id), payload.label)
+
+    @app.get("/api/events/stream")
+    async def event_stream():
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return StreamingResponse(LIVE_EVENTS.sse_stream(), media_type="text/event-stream", headers=headers)
+
+    @app.websocket("/api/events/ws")
+    async def event_socket(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_json({"type": "hello", "out_of_home": _out_of_home()})
+        try:
+            async for message in LIVE_EVENTS.subscribe():
+                await websocket.send_json(message if message is not None else {"type": "keepalive"})
+        except WebSocketDisconnect:
+            pass
 
     @app.get("/api/events/recordings")
-    async def list_recordings() -> list[dict[str, object]]:
-        items = STORE.list_events()
-        for item in items:
-            item["download_url"] = f"/api/events/recordings/{item['id']}"
-        return items
+    async def list_recordings(request: Request, camera: str | None = None):
+        listing = await asyncio.to_thread(RECORDINGS.get, camera)
+        # no-cache: clients may keep the body but must revalidate, which is a cheap 304.
+        headers = {"ETag": listing.etag, "Cache-Control": "no-cache"}
+        if request.headers.get("if-none-match") == listing.etag:
+            return Response(status_code=304, headers=headers)
+        return Response(listing.body, media_type="application/json", headers=headers)
+
+    @app.delete("/api/events/recordings")
+    async def delete_recordings(
+        ids: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        label: str | None = None,
+    ) -> dict[str, object]:
+        if ids is None and since is None and until is None and label is None:
+            raise HTTPException(status_code=400, detail="Pass ids, a since/until range or a label")
+        id_list = [clip_id for clip_id in ids.split(",") if clip_id] if ids is not None else None
+        deleted, paths = await asyncio.to_thread(STORE.delete_events, id_list, since, until, label)
+        forget_crcs(paths)
+        if deleted:
+            if split:
+                await _control("reap")
+                await _control("publish", kind="events_deleted", ids=deleted)
+            else:
+                FILE_REAPER.kick()
+                LIVE_EVENTS.publish("events_deleted", ids=deleted)
+        return {"deleted": len(deleted), "ids": deleted}
+
+    @app.get("/api/events/export.zip")
+    async def export_recordings(
+        request: Request,
+        ids: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        label: str | None = None,
+        thumbnails: bool = True,
+    ):
+        if ids is None and since is None and until is None:
+            raise HTTPException(status_code=400, detail="Pass ids or a since/until range")
+        id_list = [clip_id for clip_id in ids.split(",") if clip_id] if ids is not None else None
+        events = await asyncio.to_thread(STORE.find_events, ids=id_list, since=since, until=until, label=label)
+        if not events:
+            raise HTTPException(status_code=404, detail="No recordings match")
+        plan = await asyncio.to_thread(plan_event_export, events, thumbnails)
+        filename = time.strftime("guardian-export-%Y%m%d-%H%M%S.zip", time.localtime(events[-1]["created_ts"]))
+        headers = {
+            "ETag": plan.etag,
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        }
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        # A stale If-Range means the selection changed since the partial download: send it all again.
+        if range_header and (if_range is None or if_range == plan.etag):
+            start, end = _parse_range(range_header, plan.total_size)
+            headers["Content-Range"] = f"bytes {start}-{end}/{plan.total_size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(plan.iter_range(start, end), status_code=206, media_type="application/zip", headers=headers)
+        headers["Content-Length"] = str(plan.total_size)
+        return StreamingResponse(plan.iter_range(), media_type="application/zip", headers=headers)
+
+    @app.get("/api/events/recordings/{clip_id}/thumbnail")
+    async def clip_thumbnail(clip_id: str, request: Request):
+        event = STORE.get_event(clip_id)
+        if event is None or not event["thumbnail_path"]:
+            raise HTTPException(status_code=404, detail="Thumbnail not found")
+        return await _serve_cached_file(Path(event["thumbnail_path"]), "image/jpeg", request)
+
+    @app.get("/api/events/recordings/{clip_id}/sprite")
+    async def clip_sprite(clip_id: str, request: Request):
+        event = STORE.get_event(clip_id)
+        previews = event["metadata"].get("previews", {}) if event else {}
+        if "sprite_path" not in previews:
+            raise HTTPException(status_code=404, detail="Sprite not generated")
+        return await _serve_cached_file(Path(previews["sprite_path"]), "image/jpeg", request)
+
+    @app.get("/api/events/recordings/{clip_id}/preview")
+    async def clip_preview(clip_id: str, request: Request):
+        event = STORE.get_event(clip_id)
+        previews = event["metadata"].get("previews", {}) if event else {}
+        if "preview_path" not in previews:
+            raise HTTPException(status_code=404, detail="Preview not generated")
+        return await _serve_cached_file(Path(previews["preview_path"]), "video/mp4", request)
+
+    @app.get("/api/events/recordings/{clip_id}/track")
+    async def clip_track(clip_id: str):
+        event = STORE.get_event(clip_id)
+        if event is None:
+            raise HTTPException(status_code=404, detail="Clip not found")
+        # The clip is the rolling buffer as it stood when the event was saved.
+        until = event["created_ts"]
+        since = until - (event["duration"] or CONFIG.buffer.pre_event_seconds + CONFIG.buffer.post_event_seconds)
+        return await asyncio.to_thread(TRACKS.track, event["metadata"].get("camera", "main"), since, until + 1)
+
+    def _activity_range(since: float | None, until: float | None) -> tuple[float, float]:
+        until = time.time() if until is None else until
+        since = until - 86400 if since is None else since
+        if since >= until:
+            raise HTTPException(status_code=400, detail="since must be before until")
+        return since, until
+
+    @app.get("/api/activity/timeline")
+    async def activity_timeline(since: float | None = None, until: float | None = None, bucket: int = 3600, camera: str | None = None):
+        since, until = _activity_range(since, until)
+        buckets = await asyncio.to_thread(TRACKS.timeline, since, until, bucket, camera)
+        presence = await asyncio.to_thread(TRACKS.presence, since, until, camera)
+        return {"since": since, "until": until, "bucket_s": max(60, bucket // 60 * 60), "buckets": buckets, "presence": presence}
+
+    @app.get("/api/activity/heatmap")
+    async def activity_heatmap(since: float | None = None, until: float | None = None, camera: str | None = None):
+        since, until = _activity_range(since, until)
+        return {"since": since, "until": until, **await asyncio.to_thread(TRACKS.heatmap, since, until, camera)}
+
+    @app.get("/api/sensor/history")
+    async def sensor_history(since: float | None = None, until: float | None = None, points: int = 300):
+        since, until = _activity_range(since, until)
+        if split:
+            # The capture daemon owns the sensor and its ring.
+            series = await _control("sensor_history", since=since, until=until, points=points)
+        else:
+            series = await asyncio.to_thread(SENSOR_HISTORY.series, since, until, points)
+        return {"since": since, "until": until, **series}
+
+    async def _snapshot(unit: CameraUnit, request: Request):
+        snapshot = await unit.snapshots.latest()
+        if snapshot is None:
+            raise HTTPException(status_code=503, detail="No frames captured yet")
+        headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache", "X-Frame-Timestamp": f"{snapshot.frame_ts:.3f}"}
+        if request.headers.get("if-none-match") == snapshot.etag:
+            return Response(status_code=304, headers=headers)
+        return Response(snapshot.jpeg, media_type="image/jpeg", headers=headers)
+
+    @app.get("/api/live/snapshot")
+    async def live_snapshot(request: Request):
+        return await _snapshot(CAMERAS.primary, request)
+
+    @app.get("/api/cameras/{camera_id}/snapshot")
+    async def camera_snapshot(camera_id: str, request: Request):
+        return await _snapshot(_camera(camera_id), request)
 
     @app.get("/api/events/recordings/{clip_id}")
     async def download_clip(clip_id: str, request: Request):
-        matches = [e for e in STORE.list_events() if e["id"] == clip_id]
-        if not matches:
+        event = await asyncio.to_thread(STORE.get_event, clip_id)
+        if event is None:
             raise HTTPException(status_code=404, detail="Clip not found")
-        clip_path = Path(matches[0]["clip_path"])
-        if not clip_path.exists():
+        clip_path = Path(event["clip_path"])
+        if not await asyncio.to_thread(clip_path.exists):
             raise HTTPException(status_code=410, detail="Clip missing")
 
-        file_size = clip_path.stat().st_size
+        encrypted = await asyncio.to_thread(is_encrypted, clip_path)
+        file_size = await asyncio.to_thread(media_size, clip_path)
         range_header = request.headers.get("range")
-        if range_header:
-            # Parse Range: bytes=start-end
-            units, _, range_spec = range_header.partition("=")
-            if units.strip() != "bytes":
-                raise HTTPException(status_code=416, detail="Unsupported range unit")
-            start_str, _, end_str = range_spec.partition("-")
-            try:
-                start = int(start_str) if start_str else 0
-                end = int(end_str) if end_str else file_size - 1
-            except ValueError:
-                raise HTTPException(status_code=416, detail="Invalid range")
-            end = min(end, file_size - 1)
-            if start >= file_size or start < 0:
-                raise HTTPException(status_code=416, detail="Range not satisfiable")
+        if range_header or encrypted:
+            # Encrypted clips are always streamed; only the chunks covering the range are decrypted.
+            start, end = _parse_range(range_header, file_size) if range_header else (0, file_size - 1)
 
             chunk_size = 1024 * 1024
 
             def iter_file() -> iter[bytes]:
-                with clip_path.open("rb") as f:
+                with open_media(clip_path) as f:
                     f.seek(start)
                     remaining = end - start + 1
                     while remaining > 0:
@@ -146,35 +476,167 @@ def build_app() -> FastAPI:
                         remaining -= len(chunk)
                         yield chunk
 
-            headers = {
-                "Content-Range": f"bytes {start}-{end}/{file_size}",
-                "Accept-Ranges": "bytes",
-                "Content-Length": str(end - start + 1),
-            }
+            headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start + 1)}
+            if not range_header:
+                return StreamingResponse(iter_file(), media_type="video/mp4", headers=headers)
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
             return StreamingResponse(iter_file(), status_code=206, media_type="video/mp4", headers=headers)
 
         return FileResponse(clip_path, media_type="video/mp4")
 
+    @app.get("/api/events/recordings/{clip_id}/trim")
+    async def trim_clip(clip_id: str, request: Request, start: float = 0.0, end: float | None = None):
+        event = await asyncio.to_thread(STORE.get_event, clip_id)
+        if event is None or not event["clip_path"]:
+            raise HTTPException(status_code=404, detail="Clip not found")
+        clip_path = Path(event["clip_path"])
+        if not await asyncio.to_thread(clip_path.exists):
+            raise HTTPException(status_code=410, detail="Clip missing")
+        end = float("inf") if end is None else end
+        if start < 0 or start >= end:
+            raise HTTPException(status_code=400, detail="start must be non-negative and before end")
+        try:
+            plan = await asyncio.to_thread(plan_trim, clip_path, start, end)
+        except ValueError as exc:
+            raise HTTPException(status_code=422, detail=f"Clip cannot be trimmed: {exc}") from exc
+        if start >= plan.end_s:
+            raise HTTPException(status_code=400, detail="start is past the end of the clip")
+        headers = {
+            "ETag": plan.etag,
+            # A user's footage: browsers may keep it, shared caches must not.
+            "Cache-Control": "private, max-age=86400",
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": f'attachment; filename="{clip_id}-{plan.start_s:g}-{plan.end_s:g}.mp4"',
+            # The kept range, widened to keyframes.
+            "X-Trim-Start": f"{plan.start_s:.3f}",
+            "X-Trim-End": f"{plan.end_s:.3f}",
+        }
+        if request.headers.get("if-none-match") == plan.etag:
+            return Response(status_code=304, headers=headers)
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and (if_range is None or if_range == plan.etag):
+            first, last = _parse_range(range_header, plan.total_size)
+            headers["Content-Range"] = f"bytes {first}-{last}/{plan.total_size}"
+            headers["Content-Length"] = str(last - first + 1)
+            return StreamingResponse(plan.iter_range(first, last), status_code=206, media_type="video/mp4", headers=headers)
+        headers["Content-Length"] = str(plan.total_size)
+        return StreamingResponse(plan.iter_range(), media_type="video/mp4", headers=headers)
+
     @app.post("/api/events/live/webrtc-offer")
     async def webrtc_offer(payload: WebRTCOffer):
-        answer = await WEBRTC.handle_offer(payload.model_dump())
+        rtc = await _webrtc()
+        answer = await rtc.handle_offer(payload.model_dump())
         return answer
 
-    @app.get("/api/events/live/hls/{filename}")
-    async def hls_files(filename: str):
-        if not HLS_STREAM.enabled:
+    @app.get("/api/live/sessions")
+    async def webrtc_sessions() -> list[dict[str, object]]:
+        rtc = await _webrtc()
+        return rtc.sessions()
+
+    @app.get("/api/live/sessions/{session_id}")
+    async def webrtc_session(session_id: str) -> dict[str, object]:
+        rtc = await _webrtc()
+        session = rtc.session(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return session
+
+    @app.post("/api/live/sessions/{session_id}/candidates")
+    async def webrtc_candidate(session_id: str, payload: IceCandidate):
+        rtc = await _webrtc()
+        if not await rtc.add_candidate(session_id, payload.model_dump()):
+            raise HTTPException(status_code=404, detail="Session not found")
+        return {"added": True}
+
+    @app.post("/api/cameras/{camera_id}/webrtc-offer")
+    async def camera_webrtc_offer(camera_id: str, payload: WebRTCOffer):
+        unit = _camera(camera_id)
+        rtc = await _webrtc()
+        return await rtc.handle_offer(payload.model_dump(), unit.id)
+
+    async def _serve_ll_hls(unit: CameraUnit, filename: str, request: Request):
+        ring = unit.hls.ring
+        assert ring is not None
+        if filename == unit.hls.playlist_path.name:
+            msn = request.query_params.get("_HLS_msn")
+            part = request.query_params.get("_HLS_part")
+            if msn is not None:
+                try:
+                    msn_i = int(msn)
+                    part_i = int(part) if part is not None else None
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Invalid _HLS_msn/_HLS_part")
+                if ring.too_far_ahead(msn_i):
+                    raise HTTPException(status_code=400, detail="Requested media sequence too far ahead")
+                if not await ring.wait_for(msn_i, part_i, ring.blocking_timeout):
+                    raise HTTPException(status_code=503, detail="Timed out waiting for playlist update")
+            if not ring.has_media:
+                raise HTTPException(status_code=202, detail="HLS playlist not ready; warming up")
+            return Response(ring.playlist(), media_type="application/vnd.apple.mpegurl", headers={"Cache-Control": "no-cache"})
+
+        media = ring.media(filename)
+        if media is None:
+            raise HTTPException(status_code=404, detail="HLS asset missing")
+        msn_i, part_i = media
+        data = ring.get(msn_i, part_i)
+        if data is None and ring.is_upcoming(msn_i, part_i):
+            # Preload hint: hold the request open until the part is produced.
+            await ring.wait_for(msn_i, part_i, ring.blocking_timeout)
+            data = ring.get(msn_i, part_i)
+        if data is None:
+            raise HTTPException(status_code=404, detail="HLS asset expired or missing")
+        return Response(data, media_type="video/mp2t", headers={"Cache-Control": "public, max-age=60, immutable"})
+
+    async def _hls_file(unit: CameraUnit, filename: str, request: Request):
+        if not unit.hls.enabled:
             raise HTTPException(status_code=503, detail="HLS disabled or ffmpeg missing on Pi")
-        file_path = CONFIG.buffer.media_root / "hls" / filename
+        if unit.hls.ring is not None:
+            return await _serve_ll_hls(unit, filename, request)
+        file_path = unit.hls.asset_path(filename)
+        if file_path is None:
+            raise HTTPException(status_code=404, detail="HLS asset missing")
         if not file_path.exists():
-            if filename == "playlist.m3u8":
+            if filename == unit.hls.playlist_path.name:
                 raise HTTPException(status_code=202, detail="HLS playlist not ready; warming up")
             raise HTTPException(status_code=404, detail="HLS asset missing")
         return FileResponse(file_path)
 
+    @app.get("/api/cameras/{camera_id}/recordings/playlist.m3u8")
+    async def continuous_playlist(camera_id: str, since: float, until: float | None = None):
+        unit = _camera(camera_id)
+        until = time.time() if until is None else until
+        if since >= until:
+            raise HTTPException(status_code=400, detail="since must be before until")
+        if until - since > CONFIG.continuous.max_playlist_hours * 3600:
+            raise HTTPException(status_code=400, detail=f"Range exceeds {CONFIG.continuous.max_playlist_hours:g} hours")
+        segments = await asyncio.to_thread(SEGMENTS.find, unit.id, since, until)
+        if not segments:
+            raise HTTPException(status_code=404, detail="No recordings in range")
+        body = vod_playlist(segments, since, lambda segment_id: f"/api/cameras/{unit.id}/recordings/segments/{segment_id}.ts")
+        return Response(body, media_type="application/vnd.apple.mpegurl", headers={"Cache-Control": "no-cache"})
+
+    @app.get("/api/cameras/{camera_id}/recordings/segments/{segment_id}.ts")
+    async def continuous_segment(camera_id: str, segment_id: int, request: Request):
+        unit = _camera(camera_id)
+        path = await asyncio.to_thread(SEGMENTS.path_of, unit.id, segment_id)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Segment not found")
+        return await _serve_cached_file(path, "video/mp2t", request)
+
+    @app.get("/api/events/live/hls/{filename:path}")
+    async def hls_files(filename: str, request: Request):
+        return await _hls_file(CAMERAS.primary, filename, request)
+
+    @app.get("/api/cameras/{camera_id}/hls/{filename:path}")
+    async def camera_hls_files(camera_id: str, filename: str, request: Request):
+        return await _hls_file(_camera(camera_id), filename, request)
+
     @app.post("/api/push/register")
     async def register_push(payload: PushTokenRequest):
-        if payload.token not in CONFIG.notifications.apns_device_tokens:
-            CONFIG.notifications.apns_device_tokens.append(payload.token)
+        if split:
+            return await _control("register_push", token=payload.token)
+        NOTIFIER.register_token(payload.token)
         return {"registered": True}
 
     return app
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from .config import CONFIG, CameraSpec, HardwareConfig
+from .frame_bus import reader_for
+from .hardware import CAMERA, CameraPipeline
+from .hls import HLS_STREAM, HLSStreamService
+from .rolling_buffer import BUFFER, RollingVideoBuffer
+from .services import lazy
+from .snapshots import SNAPSHOTS, SnapshotCache
+
+
+@dataclass(slots=True)
+class CameraUnit:
+    """One camera's pipeline: capture, rolling buffer, HLS output and snapshot cache."""
+
+    spec: CameraSpec
+    camera: CameraPipeline
+    buffer: RollingVideoBuffer
+    hls: HLSStreamService
+    snapshots: SnapshotCache
+    confirm_counter: int = 0
+    last_boxes: list[tuple[int, int, int, int]] = field(default_factory=list)
+
+    @property
+    def id(self) -> str:
+        return self.spec.id
+
+
+class CameraRig:
+    """All configured cameras. The primary camera wraps the existing module singletons."""
+
+    def __init__(self, cfg: HardwareConfig | None = None):
+        cfg = cfg or CONFIG.hardware
+        self.primary = CameraUnit(cfg.primary_camera(), CAMERA, BUFFER, HLS_STREAM, SNAPSHOTS)
+        self._units: dict[str, CameraUnit] = {self.primary.id: self.primary}
+        for spec in cfg.extra_cameras:
+            if spec.id in self._units:
+                raise ValueError(f"Duplicate camera id {spec.id!r}")
+            self._units[spec.id] = self._build(spec)
+
+    @staticmethod
+    def _build(spec: CameraSpec) -> CameraUnit:
+        buffer = RollingVideoBuffer()
+        playlist = CONFIG.hls.playlist_path.parent / spec.id / CONFIG.hls.playlist_path.name
+        source = reader_for(spec.id).latest if CONFIG.process.split else buffer.latest
+        return CameraUnit(
+            spec=spec,
+            camera=CameraPipeline(spec=spec),
+            buffer=buffer,
+            hls=HLSStreamService(playlist, camera_id=spec.id),
+            snapshots=SnapshotCache(source=source),
+        )
+
+    def get(self, camera_id: str) -> CameraUnit | None:
+        return self._units.get(camera_id)
+
+    def ids(self) -> list[str]:
+        return list(self._units)
+
+    def __iter__(self) -> Iterator[CameraUnit]:
+        return iter(self._units.values())
+
+    def __len__(self) -> int:
+        return len(self._units)
+
+
+CAMERAS = lazy("cameras", CameraRig)
@@ -0,0 +1,54 @@
+"""Capture daemon for split-process mode: owns the hardware and publishes frames for the API workers."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import signal
+
+from .cameras import CAMERAS
+from .config import CONFIG
+from .control import ControlServer
+from .event_engine import ENGINE
+from .file_reaper import FILE_REAPER
+from .frame_bus import SharedFrameWriter, shm_name_for
+
+LOGGER = logging.getLogger(__name__)
+
+
+async def run_capture_daemon() -> None:
+    CONFIG.ensure_dirs()
+    # One shared-memory ring per camera; API workers started by guardian.main attach read-only.
+    writers = {camera_id: SharedFrameWriter(CONFIG.process, shm_name_for(camera_id)) for camera_id in CAMERAS.ids()}
+    server = ControlServer(CONFIG.process)
+    ENGINE.frame_sinks = writers
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+
+    # The only file reaper in split mode; API workers kick it over the control channel.
+    FILE_REAPER.start()
+    await ENGINE.start()
+    await server.start()
+    LOGGER.info("Capture daemon running (shm=%s)", ", ".join(writer.name for writer in writers.values()))
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await ENGINE.stop()
+        FILE_REAPER.stop()
+        ENGINE.frame_sinks = {}
+        for writer in writers.values():
+            writer.close()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_capture_daemon())
+
+
+if __name__ == "__main__":
+    main()
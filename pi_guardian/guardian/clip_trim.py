@@ -0,0 +1,293 @@
+"""Keyframe-aligned sub-range export of stored clips, without decoding or encoding."""
+
+from __future__ import annotations
+
+import bisect
+import struct
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from .media_crypto import open_media
+from .mp4 import VideoTrackIndex, find_box, iter_boxes, iter_file_boxes, parse_video_index, video_trak
+
+CHUNK_SIZE = 256 * 1024
+DEFAULT_FTYP = struct.pack(">I4s4sI", 28, b"ftyp", b"isom", 0x200) + b"isomiso2mp41"
+# Sample-table boxes that are rebuilt; anything else describing samples (sdtp, sgpd, sbgp, ...) is dropped.
+SAMPLE_TABLES = {b"stts", b"ctts", b"stss", b"stsz", b"stz2", b"stsc", b"stco", b"co64"}
+
+_CACHE_SIZE = 32
+_CLIPS: OrderedDict[tuple[str, int, int], _ParsedClip] = OrderedDict()
+_PLANS: OrderedDict[tuple[str, int, int, int, int], TrimPlan] = OrderedDict()
+_LOCK = threading.Lock()
+
+
+@dataclass(slots=True)
+class _ParsedClip:
+    ftyp: bytes
+    moov: bytes
+    index: VideoTrackIndex
+
+
+@dataclass(slots=True)
+class TrimPlan:
+    """Progressive MP4 of the kept samples (source ``ftyp``, rebuilt ``moov``, one ``mdat``), laid out before any sample is read."""
+
+    path: Path
+    etag: str
+    start_s: float
+    end_s: float
+    header: bytes
+    # (source offset, length) of each contiguous run of kept sample bytes, in output order.
+    runs: list[tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def total_size(self) -> int:
+        return len(self.header) + sum(length for _, length in self.runs)
+
+    def iter_range(self, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        """Yield output bytes ``start``..``end`` inclusive."""
+        end = self.total_size - 1 if end is None else end
+        if start < len(self.header):
+            yield self.header[start : end + 1]
+        pos = len(self.header)
+        with open_media(self.path) as f:
+            for offset, length in self.runs:
+                if pos > end:
+                    return
+                lo, hi = max(start, pos), min(end + 1, pos + length)
+                if lo < hi:
+                    f.seek(offset + lo - pos)
+                    remaining = hi - lo
+                    while remaining > 0:
+                        chunk = f.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            raise OSError(f"{self.path} shrank during trim")
+                        remaining -= len(chunk)
+                        yield chunk
+                pos += length
+
+
+def _box(kind: bytes, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    return struct.pack(">I4s", len(body) + 8, kind) + body
+
+
+def _full_box(kind: bytes, version: int, *payload: bytes) -> bytes:
+    return _box(kind, struct.pack(">I", version << 24), *payload)
+
+
+def _runs(values: list[int]) -> list[list[int]]:
+    """Run-length encoding as ``[count, value]`` pairs."""
+    runs: list[list[int]] = []
+    for value in values:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+    return runs
+
+
+def _with_duration(box: bytes, v0_offset: int, v1_offset: int, duration: int) -> bytes:
+    # mvhd, tkhd and mdhd keep their duration at a version-dependent offset in the payload.
+    data = bytearray(box)
+    if data[8] == 1:
+        struct.pack_into(">Q", data, 8 + v1_offset, duration)
+    else:
+        struct.pack_into(">I", data, 8 + v0_offset, min(duration, 0xFFFFFFFF))
+    return bytes(data)
+
+
+def _timescale(mvhd: bytes) -> int:
+    return struct.unpack_from(">I", mvhd, 8 + (20 if mvhd[8] == 1 else 12))[0]
+
+
+def gop_range(index: VideoTrackIndex, start_s: float, end_s: float) -> tuple[int, int]:
+    """Sample range ``[first, stop)`` covering ``[start_s, end_s)`` on keyframe boundaries."""
+    if not index.sync:
+        raise ValueError("Clip has no keyframes")
+    sync_dts = [index.dts[sample] for sample in index.sync]
+    position = max(0, bisect.bisect_right(sync_dts, start_s * index.timescale) - 1)
+    first = index.sync[position]
+    following = bisect.bisect_left(sync_dts, end_s * index.timescale, lo=position + 1)
+    stop = index.sync[following] if following < len(index.sync) else len(index.dts)
+    return first, stop
+
+
+def _sample_durations(index: VideoTrackIndex, first: int, stop: int) -> list[int]:
+    durations = [index.dts[i + 1] - index.dts[i] for i in range(first, min(stop, len(index.dts) - 1))]
+    if stop == len(index.dts):
+        # The last sample lasts until the end of the media.
+        last = index.duration - index.dts[-1]
+        durations.append(last if last > 0 else (durations[-1] if durations else 1))
+    return durations
+
+
+def _stbl(source: bytes, stbl, index: VideoTrackIndex, first: int, stop: int, chunks: list[int], chunk_offsets: list[int]) -> bytes:
+    children = []
+    tables = {}
+    for box in iter_boxes(source, stbl.payload_start, stbl.end):
+        if box.type in SAMPLE_TABLES:
+            tables[box.type] = box
+        elif box.type == b"stsd":
+            children.append(source[box.start : box.end])
+    stts = _runs(_sample_durations(index, first, stop))
+    children.append(_full_box(b"stts", 0, struct.pack(">I", len(stts)), *(struct.pack(">II", *run) for run in stts)))
+    if index.cts:
+        ctts = _runs(index.cts[first:stop])
+        version = source[tables[b"ctts"].payload_start]
+        entry = ">Ii" if version == 1 else ">II"
+        children.append(_full_box(b"ctts", version, struct.pack(">I", len(ctts)), *(struct.pack(entry, *run) for run in ctts)))
+    if b"stss" in tables:
+        sync = [sample - first + 1 for sample in index.sync if first <= sample < stop]
+        children.append(_full_box(b"stss", 0, struct.pack(f">I{len(sync)}I", len(sync), *sync)))
+    sizes = index.sizes[first:stop]
+    if len(set(sizes)) == 1:
+        children.append(_full_box(b"stsz", 0, struct.pack(">II", sizes[0], len(sizes))))
+    else:
+        children.append(_full_box(b"stsz", 0, struct.pack(f">II{len(sizes)}I", 0, len(sizes), *sizes)))
+    stsc = []
+    for number, per_chunk in enumerate(chunks, start=1):
+        if not stsc or stsc[-1][1] != per_chunk:
+            stsc.append((number, per_chunk))
+    children.append(_full_box(b"stsc", 0, struct.pack(">I", len(stsc)), *(struct.pack(">III", number, per_chunk, 1) for number, per_chunk in stsc)))
+    if chunk_offsets and chunk_offsets[-1] > 0xFFFFFFFF:
+        children.append(_full_box(b"co64", 0, struct.pack(f">I{len(chunk_offsets)}Q", len(chunk_offsets), *chunk_offsets)))
+    else:
+        children.append(_full_box(b"stco", 0, struct.pack(f">I{len(chunk_offsets)}I", len(chunk_offsets), *chunk_offsets)))
+    return _box(b"stbl", *children)
+
+
+def _trim_moov(clip: _ParsedClip, first: int, stop: int, chunks: list[int], chunk_offsets: list[int]) -> bytes:
+    moov, index = clip.moov, clip.index
+    moov_box = next(iter_boxes(moov))
+    video = video_trak(moov)
+    mvhd = find_box(moov, [b"mvhd"], moov_box.payload_start, moov_box.end)
+    if mvhd is None:
+        raise ValueError("Clip has no movie header")
+    movie_timescale = _timescale(moov[mvhd.start : mvhd.end])
+    media_duration = sum(_sample_durations(index, first, stop))
+    movie_duration = media_duration * movie_timescale // index.timescale
+    # Start presentation at the first kept frame; B-frame clips shift by its composition offset.
+    media_time = index.cts[first] if index.cts else 0
+    elst = _full_box(b"elst", 1, struct.pack(">IQqHH", 1, movie_duration, media_time, 1, 0))
+
+    def rebuild(start: int, end: int) -> list[bytes]:
+        out = []
+        for box in iter_boxes(moov, start, end):
+            raw = moov[box.start : box.end]
+            if box.type == b"mvhd":
+                out.append(_with_duration(raw, 16, 24, movie_duration))
+            elif box.type == b"tkhd":
+                # The edit list follows the track header, replacing whatever the source had.
+                out.append(_with_duration(raw, 20, 28, movie_duration))
+                out.append(_box(b"edts", elst))
+            elif box.type == b"mdhd":
+                out.append(_with_duration(raw, 16, 24, media_duration))
+            elif box.type == b"stbl":
+                out.append(_stbl(moov, box, index, first, stop, chunks, chunk_offsets))
+            elif box.type in (b"mdia", b"minf"):
+                out.append(_box(box.type, *rebuild(box.payload_start, box.end)))
+            elif box.type != b"edts":
+                out.append(raw)
+        return out
+
+    children = []
+    for box in iter_boxes(moov, moov_box.payload_start, moov_box.end):
+        if box.type == b"trak":
+            # Only the video track is kept.
+            if box.start == video.start:
+                children.append(_box(b"trak", *rebuild(box.payload_start, box.end)))
+        elif box.type == b"mvhd":
+            children.extend(rebuild(box.start, box.end))
+        elif box.type not in (b"mvex", b"meta"):
+            children.append(moov[box.start : box.end])
+    return _box(b"moov", *children)
+
+
+def _parse(path: Path) -> _ParsedClip:
+    ftyp = moov = None
+    with open_media(path) as f:
+        for box in iter_file_boxes(f):
+            if box.type in (b"ftyp", b"moov"):
+                f.seek(box.start)
+                data = f.read(box.size)
+                if box.type == b"ftyp":
+                    ftyp = data
+                else:
+                    moov = data
+            if ftyp is not None and moov is not None:
+                break
+    if moov is None:
+        raise ValueError(f"{path} has no moov box")
+    index = parse_video_index(moov)
+    if not index.sizes:
+        raise ValueError(f"{path} has no video samples")
+    return _ParsedClip(ftyp or DEFAULT_FTYP, moov, index)
+
+
+def plan_trim(path: Path, start_s: float, end_s: float) -> TrimPlan:
+    """Layout of the trimmed MP4 for ``[start_s, end_s)`` of the clip at ``path``."""
+    stat = path.stat()
+    identity = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _LOCK:
+        clip = _CLIPS.get(identity)
+        if clip is not None:
+            _CLIPS.move_to_end(identity)
+    if clip is None:
+        clip = _parse(path)
+        with _LOCK:
+            _CLIPS[identity] = clip
+            while len(_CLIPS) > _CACHE_SIZE:
+                _CLIPS.popitem(last=False)
+    index = clip.index
+    first, stop = gop_range(index, start_s, end_s)
+    key = (*identity, first, stop)
+    with _LOCK:
+        plan = _PLANS.get(key)
+        if plan is not None:
+            _PLANS.move_to_end(key)
+            return plan
+
+    # Group kept samples into runs that are contiguous in the source; each becomes one chunk.
+    runs: list[tuple[int, int]] = []
+    chunks: list[int] = []
+    for sample in range(first, stop):
+        offset, size = index.offsets[sample], index.sizes[sample]
+        if runs and runs[-1][0] + runs[-1][1] == offset:
+            runs[-1] = (runs[-1][0], runs[-1][1] + size)
+            chunks[-1] += 1
+        else:
+            runs.append((offset, size))
+            chunks.append(1)
+    payload = sum(length for _, length in runs)
+    mdat_header = struct.pack(">I4s", payload + 8, b"mdat") if payload + 8 <= 0xFFFFFFFF else struct.pack(">I4sQ", 1, b"mdat", payload + 16)
+
+    def layout(moov_size: int) -> list[int]:
+        offsets, position = [], len(clip.ftyp) + moov_size + len(mdat_header)
+        for _, length in runs:
+            offsets.append(position)
+            position += length
+        return offsets
+
+    # Chunk offsets depend on the moov's size, which does not depend on their values.
+    moov_size = len(_trim_moov(clip, first, stop, chunks, layout(0)))
+    moov = _trim_moov(clip, first, stop, chunks, layout(moov_size))
+    # The file's identity and the kept sample range, like the cache keys.
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}-{first:x}-{stop:x}"'
+    end_dts = index.dts[stop] if stop < len(index.dts) else index.duration
+    plan = TrimPlan(
+        path=path,
+        etag=etag,
+        start_s=round(index.time_of(first), 3),
+        end_s=round(end_dts / index.timescale, 3),
+        header=clip.ftyp + moov + mdat_header,
+        runs=runs,
+    )
+    with _LOCK:
+        _PLANS[key] = plan
+        while len(_PLANS) > _CACHE_SIZE:
+            _PLANS.popitem(last=False)
+    return plan
@@ -5,6 +5,17 @@ from pathlib import Path
 import os
 
 
+@dataclass(slots=True)
+class CameraSpec:
+    id: str
+    backend: str = "picamera2"  # "picamera2" (CSI) or "opencv" (USB/UVC via VideoCapture)
+    index: int = 0
+    resolution: tuple[int, int] = (1280, 720)
+    fps: int = 20
+    # True: detection is armed by the ultrasonic sensor; False: armed whenever out of home.
+    sensor_armed: bool = False
+
+
 @dataclass(slots=True)
 class HardwareConfig:
     ultrasonic_trigger_pin: int | None = 23
@@ -17,6 +28,17 @@ class HardwareConfig:
     idle_distance_cm: float = 180.0
     trigger_distance_cm: float = 120.0
     confirm_distance_cm: float = 80.0
+    # Additional cameras run alongside the primary ("main") one described above.
+    extra_cameras: list[CameraSpec] = field(default_factory=list)
+
+    def primary_camera(self) -> CameraSpec:
+        return CameraSpec(
+            id="main",
+            index=self.camera_index,
+            resolution=self.camera_resolution,
+            fps=self.camera_fps,
+            sensor_armed=True,
+        )
 
 
 @dataclass(slots=True)
@@ -25,6 +47,19 @@ class DetectionConfig:
     min_confidence: float = 0.4
     hog_win_stride: tuple[int, int] = (8, 8)
     hog_padding: tuple[int, int] = (8, 8)
+    # Reuse the last result when a frame's downsampled mean-abs-diff vs the last analyzed
+    # frame is below reuse_threshold (0-255 scale; 0 disables), at most max_reuse_frames times in a row.
+    fingerprint_size: tuple[int, int] = (32, 18)
+    reuse_threshold: float = 2.0
+    max_reuse_frames: int = 10
+    # Detector time is shared across cameras in proportion to recent activity.
+    scheduler_min_weight: float = 0.1
+    scheduler_activity_decay: float = 0.9
+    # Every analyzed frame is recorded: boxes as compressed columnar chunks, plus per-minute and hourly
+    # activity rows with a coarse heatmap grid (columns, rows) for time-range queries.
+    track_flush_seconds: float = 30.0
+    track_retention_days: int = 180
+    heatmap_grid: tuple[int, int] = (16, 9)
 
 
 @dataclass(slots=True)
@@ -34,6 +69,10 @@ class BufferConfig:
     max_disk_gb: int = 25
     media_root: Path = Path("storage/media")
     metadata_db: Path = Path("storage/events.db")
+    delete_batch_size: int = 100
+    delete_pause_seconds: float = 0.05
+    # The reaper also wakes this often, for files queued by another process or left by a failed batch.
+    delete_poll_seconds: float = 60.0
 
 
 @dataclass(slots=True)
@@ -43,14 +82,39 @@ class WebRTCConfig:
             {"urls": ["stun:stun.l.google.com:19302"]},
         ]
     )
+    # Talkback output (every viewer's audio mixed into it) and the microphone sent to viewers.
     audio_device: str | None = None
     mic_device: str | None = None
+    # The microphone is Opus-encoded once at this bitrate and the packets go to every viewer.
+    mic_bitrate: int = 32_000
+    # Talkback a viewer may run ahead of playback before its oldest audio is dropped.
+    talkback_max_delay_ms: int = 200
+    # Per-viewer adaptation ladder, best first: (max width, fps, encoder bitrate in bps).
+    abr_enabled: bool = True
+    abr_ladder: list[tuple[int, int, int]] = field(
+        default_factory=lambda: [(1280, 20, 1_500_000), (960, 15, 900_000), (640, 12, 500_000), (426, 8, 250_000)]
+    )
+    abr_interval_s: float = 1.0
+    abr_loss_down: float = 0.08
+    abr_loss_up: float = 0.02
+    abr_rtt_down_ms: float = 400.0
+    abr_hold_up_s: float = 8.0
+    prewarm_pool_size: int = 2
+    prewarm_ttl_s: float = 45.0
+    ice_gather_timeout_s: float = 1.0
 
 
 @dataclass(slots=True)
 class NotificationConfig:
     apns_topic: str = "com.example.GuardianMobile"
     apns_device_tokens: list[str] = field(default_factory=list)
+    relay_url: str = "http://localhost:9000/apns"
+    send_timeout_s: float = 5.0
+    coalesce_window_s: float = 30.0
+    max_attempts: int = 6
+    retry_base_s: float = 2.0
+    retry_max_s: float = 300.0
+    outbox_retention_s: float = 7 * 24 * 3600
 
 
 @dataclass(slots=True)
@@ -62,6 +126,163 @@ class HLSConfig:
     queue_size: int = 6
     ffmpeg_path: str = "ffmpeg"
     video_codec: str = "libx264"
+    low_latency: bool = False
+    part_seconds: float = 0.333
+    ring_segments: int = 6
+    # Multi-variant output from one ffmpeg (one decode, split, scaled per rung): (name, height,
+    # video kbps), best first, e.g. [("720p", 720, 2000), ("480p", 480, 900), ("240p", 240, 300)].
+    # Empty keeps the single full-resolution rendition. Not used with low_latency.
+    renditions: list[tuple[str, int, int]] = field(default_factory=list)
+    master_playlist_name: str = "master.m3u8"
+    # Top rungs are dropped one at a time while system CPU stays above abr_cpu_high and
+    # restored once it stays below abr_cpu_low; each change restarts the encoder.
+    abr_cpu_high: float = 85.0
+    abr_cpu_low: float = 55.0
+    abr_cpu_window_s: float = 30.0
+    abr_restore_after_s: float = 300.0
+
+
+@dataclass(slots=True)
+class ContinuousConfig:
+    # 24/7 recording from the live HLS encoder's output (no second encode); needs HLS enabled.
+    enabled: bool = False
+    root: Path = Path("storage/media/continuous")
+    segment_seconds: float = 10.0
+    retention_days: float = 14.0
+    poll_seconds: float = 0.5
+    prune_interval_s: float = 300.0
+    max_playlist_hours: float = 24.0
+
+
+@dataclass(slots=True)
+class SensorHistoryConfig:
+    # Ring of recent ultrasonic readings; about a day at the sensor loop's ~5 Hz (12 bytes each).
+    capacity: int = 432_000
+    path: Path = Path("storage/sensor_history.bin")
+    persist_interval_s: float = 300.0
+    max_points: int = 2000
+
+
+@dataclass(slots=True)
+class LiveEventsConfig:
+    queue_size: int = 64
+    keepalive_seconds: float = 15.0
+    publish_detection_boxes: bool = True
+
+
+@dataclass(slots=True)
+class SnapshotConfig:
+    min_interval_seconds: float = 0.5
+    jpeg_quality: int = 80
+    thumbnail_width: int = 320
+    thumbnail_quality: int = 70
+
+
+@dataclass(slots=True)
+class PreviewConfig:
+    enabled: bool = True
+    sprite_tiles: int = 10
+    sprite_columns: int = 5
+    tile_width: int = 160
+    sprite_quality: int = 70
+    preview_seconds: float = 3.0
+    preview_fps: int = 5
+    preview_width: int = 240
+    idle_cpu_percent: float = 60.0
+    idle_poll_seconds: float = 2.0
+    nice: int = 19
+
+
+@dataclass(slots=True)
+class TieringConfig:
+    # Clips are re-encoded as they age: (min age in days, max width, fps, x264 crf), mildest
+    # first. A rung below 1 fps keeps every frame as a keyframe, i.e. a keyframe-only clip.
+    # Off by default: re-encoding is lossy, so it is opt-in.
+    enabled: bool = False
+    tiers: list[tuple[float, int, float, int]] = field(
+        default_factory=lambda: [(7.0, 960, 10.0, 28), (30.0, 640, 5.0, 32), (90.0, 640, 0.5, 30)]
+    )
+    # After this many days only the thumbnail and sprite sheet are kept (None, the default, keeps clips).
+    thumbnail_only_days: float | None = None
+    ffmpeg_path: str = "ffmpeg"
+    encoder: str = "libx264"
+    # CPU-seconds per wall second the encoder may use; it is paused whenever it runs ahead.
+    cpu_budget: float = 0.5
+    idle_cpu_percent: float = 60.0
+    idle_poll_seconds: float = 5.0
+    scan_interval_s: float = 3600.0
+    nice: int = 19
+
+
+@dataclass(slots=True)
+class OffloadConfig:
+    # Finished clips and thumbnails are copied to an S3-compatible bucket (AWS, MinIO, ...)
+    # once one is configured. Objects are uploaded as stored: encrypted media stays encrypted.
+    enabled: bool = field(default_factory=lambda: bool(os.environ.get("GUARDIAN_S3_BUCKET")))
+    endpoint: str = field(default_factory=lambda: os.environ.get("GUARDIAN_S3_ENDPOINT", "https://s3.amazonaws.com"))
+    region: str = field(default_factory=lambda: os.environ.get("GUARDIAN_S3_REGION", "us-east-1"))
+    bucket: str = field(default_factory=lambda: os.environ.get("GUARDIAN_S3_BUCKET", ""))
+    access_key: str = field(default_factory=lambda: os.environ.get("GUARDIAN_S3_ACCESS_KEY", ""))
+    secret_key: str = field(default_factory=lambda: os.environ.get("GUARDIAN_S3_SECRET_KEY", ""))
+    prefix: str = "guardian/"
+    # Files above this go up as multipart uploads; S3 needs parts of at least 5 MiB.
+    part_size: int = 8 * 1024 * 1024
+    concurrency: int = 2
+    # Upload ceiling across all workers (0 = unlimited).
+    max_kbps: float = 2000.0
+    # Outbound traffic from anything else (live WebRTC/HLS viewers, notifications) above this
+    # makes uploads step aside until it has been quiet for yield_resume_s. A request already
+    # in flight keeps trickling at yield_trickle_kbps so the server does not time it out.
+    yield_above_kbps: float = 150.0
+    yield_resume_s: float = 10.0
+    yield_trickle_kbps: float = 32.0
+    request_timeout_s: float = 60.0
+    max_attempts: int = 12
+    retry_base_s: float = 10.0
+    retry_max_s: float = 3600.0
+    # Queue events recorded before offload was enabled (or while the queue was lost) at start.
+    backfill: bool = True
+    queue_retention_s: float = 30 * 24 * 3600
+
+
+@dataclass(slots=True)
+class ProcessConfig:
+    # "single": one process owns camera + API. "split": a capture daemon publishes frames
+    # over shared memory and any number of uvicorn workers attach read-only.
+    mode: str = field(default_factory=lambda: os.environ.get("GUARDIAN_PROCESS_MODE", "single"))
+    api_workers: int = field(default_factory=lambda: int(os.environ.get("GUARDIAN_API_WORKERS", "2")))
+    shm_name: str = "guardian-frames"
+    shm_slots: int = 4
+    control_socket: Path = Path("storage/guardian-control.sock")
+    heartbeat_timeout_s: float = 2.0
+
+    @property
+    def split(self) -> bool:
+        return self.mode == "split"
+
+
+DEV_STORAGE_KEY = b"dev-key" * 4
+
+
+@dataclass(slots=True)
+class EncryptionConfig:
+    # Clips, thumbnails and previews are sealed with storage_key in chunked AEAD containers.
+    # Stays off while GUARDIAN_STORAGE_KEY is unset: the fallback key is public.
+    enabled: bool = True
+    cipher: str = "aes-gcm"  # "chacha20-poly1305" is faster on CPUs without AES instructions (Pi 4)
+    chunk_size: int = 64 * 1024
+    # Plaintext staging for OpenCV, which can only read and write real files; keep it on tmpfs.
+    scratch_dir: Path = Path("/dev/shm")
+
+
+@dataclass(slots=True)
+class AdminConfig:
+    # Bearer token for /api/admin/*; the routes answer 404 while it is unset.
+    token: str | None = field(default_factory=lambda: os.environ.get("GUARDIAN_ADMIN_TOKEN") or None)
+    profile_max_seconds: float = 60.0
+    profile_hz: int = 100
+    # Collapsed-stack outputs kept for download, newest first.
+    profile_keep: int = 4
 
 
 @dataclass(slots=True)
@@ -72,14 +293,25 @@ class GuardianConfig:
     rtc: WebRTCConfig = field(default_factory=WebRTCConfig)
     notifications: NotificationConfig = field(default_factory=NotificationConfig)
     hls: HLSConfig = field(default_factory=HLSConfig)
-    storage_key: bytes = field(default_factory=lambda: os.environ.get("GUARDIAN_STORAGE_KEY", "dev-key" * 4).encode())
+    continuous: ContinuousConfig = field(default_factory=ContinuousConfig)
+    sensor_history: SensorHistoryConfig = field(default_factory=SensorHistoryConfig)
+    live_events: LiveEventsConfig = field(default_factory=LiveEventsConfig)
+    snapshots: SnapshotConfig = field(default_factory=SnapshotConfig)
+    previews: PreviewConfig = field(default_factory=PreviewConfig)
+    tiering: TieringConfig = field(default_factory=TieringConfig)
+    offload: OffloadConfig = field(default_factory=OffloadConfig)
+    process: ProcessConfig = field(default_factory=ProcessConfig)
+    encryption: EncryptionConfig = field(default_factory=EncryptionConfig)
+    admin: AdminConfig = field(default_factory=AdminConfig)
+    storage_key: bytes = field(default_factory=lambda: os.environ.get("GUARDIAN_STORAGE_KEY", DEV_STORAGE_KEY.decode()).encode())
     out_of_home: bool = False
 
     def ensure_dirs(self) -> None:
         self.buffer.media_root.mkdir(parents=True, exist_ok=True)
         self.buffer.metadata_db.parent.mkdir(parents=True, exist_ok=True)
         self.hls.playlist_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.continuous.enabled:
+            self.continuous.root.mkdir(parents=True, exist_ok=True)
 
 
 CONFIG = GuardianConfig()
-CONFIG.ensure_dirs()
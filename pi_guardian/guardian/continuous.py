@@ -0,0 +1,263 @@
+"""Continuous recording built on the live HLS encoder's output."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable
+
+from .config import CONFIG, ContinuousConfig
+from .media_crypto import write_media_bytes
+from .services import lazy
+
+LOGGER = logging.getLogger(__name__)
+
+SEGMENT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recording_segments (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    duration REAL NOT NULL,
+    bytes INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    discontinuity INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS recording_segments_camera_time ON recording_segments (camera, start_ts);
+CREATE INDEX IF NOT EXISTS recording_segments_time ON recording_segments (start_ts);
+"""
+
+# Gap between one segment's end and the next one's start treated as a break in the footage.
+GAP_TOLERANCE_S = 1.5
+PRUNE_BATCH = 200
+
+
+class SegmentIndex:
+    def __init__(self, cfg: ContinuousConfig | None = None):
+        self.cfg = cfg or CONFIG.continuous
+        self.db_path = CONFIG.buffer.metadata_db
+        self._ensure_db()
+
+    def _ensure_db(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executescript(SEGMENT_SCHEMA)
+        finally:
+            conn.close()
+
+    def add(self, camera: str, start_ts: float, duration: float, size: int, path: Path, discontinuity: bool) -> None:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT INTO recording_segments (camera, start_ts, duration, bytes, path, discontinuity) VALUES (?, ?, ?, ?, ?, ?)",
+                    (camera, start_ts, duration, size, str(path), int(discontinuity)),
+                )
+        finally:
+            conn.close()
+
+    def find(self, camera: str, since: float, until: float) -> list[dict[str, Any]]:
+        """Segments overlapping ``[since, until)``, oldest first."""
+        # Bounding start_ts from below keeps the lookup on the index.
+        earliest = since - self.cfg.segment_seconds * 4
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT id, start_ts, duration, discontinuity FROM recording_segments "
+                "WHERE camera = ? AND start_ts >= ? AND start_ts < ? AND start_ts + duration > ? ORDER BY start_ts",
+                (camera, earliest, until, since),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [{"id": row[0], "start_ts": row[1], "duration": row[2], "discontinuity": bool(row[3])} for row in rows]
+
+    def path_of(self, camera: str, segment_id: int) -> Path | None:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute("SELECT path FROM recording_segments WHERE id = ? AND camera = ?", (segment_id, camera)).fetchone()
+        finally:
+            conn.close()
+        return Path(row[0]) if row else None
+
+    def prune(self) -> int:
+        """Drop segments past retention, then oldest first while media_root is over its budget."""
+        cutoff = time.time() - self.cfg.retention_days * 86400
+        # Event clips come first: continuous footage only gets what they leave of max_disk_gb.
+        budget = CONFIG.buffer.max_disk_gb * 1024**3 - _event_media_bytes(CONFIG.buffer.media_root)
+        removed = 0
+        conn = sqlite3.connect(self.db_path)
+        try:
+            while True:
+                total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM recording_segments").fetchone()[0]
+                rows = conn.execute(
+                    "SELECT id, bytes, path, start_ts FROM recording_segments ORDER BY start_ts LIMIT ?",
+                    (PRUNE_BATCH,),
+                ).fetchall()
+                doomed = []
+                for segment_id, size, path, start_ts in rows:
+                    if start_ts >= cutoff and total <= budget:
+                        break
+                    doomed.append((segment_id, path))
+                    total -= size
+                if not doomed:
+                    return removed
+                for _, path in doomed:
+                    try:
+                        Path(path).unlink(missing_ok=True)
+                    except OSError as exc:
+                        LOGGER.warning("Could not remove %s: %s", path, exc)
+                with conn:
+                    conn.executemany("DELETE FROM recording_segments WHERE id = ?", [(segment_id,) for segment_id, _ in doomed])
+                removed += len(doomed)
+        finally:
+            conn.close()
+
+
+def _event_media_bytes(media_root: Path) -> int:
+    # Clips, thumbnails and previews sit directly in media_root; HLS and continuous footage live in subdirectories.
+    total = 0
+    try:
+        with os.scandir(media_root) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        pass
+    return total
+
+
+class SegmentRecorder:
+    """Concatenates one camera's live TS chunks into indexed recording segments.
+
+    ``add`` may be called from the HLS writer's reader thread or the playlist follower;
+    ``reset`` marks a break (encoder restart, missed chunks) so players resynchronize.
+    """
+
+    def __init__(self, camera_id: str, cfg: ContinuousConfig | None = None, index: Callable[[], SegmentIndex] | None = None):
+        self.camera_id = camera_id
+        self.cfg = cfg or CONFIG.continuous
+        self._index = index or (lambda: SEGMENTS)
+        self._lock = threading.Lock()
+        self._chunks: list[bytes] = []
+        self._duration = 0.0
+        self._start_ts = 0.0
+        self._discontinuity = True
+
+    def add(self, data: bytes, duration: float) -> None:
+        with self._lock:
+            if not self._chunks:
+                # Chunks are handed over as they complete, so this one started ``duration`` ago.
+                self._start_ts = time.time() - duration
+            self._chunks.append(data)
+            self._duration += duration
+            if self._duration >= self.cfg.segment_seconds:
+                self._close()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._close()
+            self._discontinuity = True
+
+    def _close(self) -> None:
+        if not self._chunks:
+            return
+        # Live chunks start on keyframes and come from one muxer, so their concatenation is
+        # itself a valid segment: nothing is encoded twice.
+        data = b"".join(self._chunks)
+        start_ts, duration, discontinuity = self._start_ts, self._duration, self._discontinuity
+        self._chunks, self._duration, self._discontinuity = [], 0.0, False
+        stamp = datetime.fromtimestamp(start_ts, timezone.utc)
+        path = self.cfg.root / self.camera_id / stamp.strftime("%Y%m%d") / f"{stamp.strftime('%H%M%S')}-{int(start_ts * 1000) % 1000:03d}.ts"
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_media_bytes(path, data)
+            self._index().add(self.camera_id, start_ts, duration, path.stat().st_size, path, discontinuity)
+        except Exception as exc:
+            LOGGER.warning("Writing recording segment for %s failed: %s", self.camera_id, exc)
+            self._discontinuity = True
+
+
+def parse_media_playlist(text: str) -> tuple[int, list[tuple[str, float]]]:
+    """Media sequence number and (uri, duration) entries of a live HLS playlist."""
+    sequence = 0
+    entries: list[tuple[str, float]] = []
+    duration: float | None = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.partition(":")[2])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.partition(":")[2].split(",")[0])
+        elif line and not line.startswith("#") and duration is not None:
+            entries.append((line, duration))
+            duration = None
+    return sequence, entries
+
+
+async def follow_playlist(source: Callable[[], Path], recorder: SegmentRecorder, poll_s: float) -> None:
+    """Feed every segment ffmpeg's HLS muxer completes into ``recorder`` before it is rotated out.
+
+    ``source`` names the playlist to follow; it may change, e.g. when the ABR ladder drops a rung.
+    """
+    next_sequence: int | None = None
+    followed: Path | None = None
+    while True:
+        await asyncio.sleep(poll_s)
+        playlist_path = source()
+        if playlist_path != followed:
+            if followed is not None:
+                await asyncio.to_thread(recorder.reset)
+            followed, next_sequence = playlist_path, None
+        try:
+            text = await asyncio.to_thread(playlist_path.read_text)
+        except OSError:
+            continue
+        sequence, entries = parse_media_playlist(text)
+        if not entries:
+            continue
+        if next_sequence is not None and not sequence <= next_sequence <= sequence + len(entries):
+            # The writer restarted (sequence went back) or we fell behind its rotation.
+            await asyncio.to_thread(recorder.reset)
+            next_sequence = None
+        start = 0 if next_sequence is None else next_sequence - sequence
+        for uri, duration in entries[start:]:
+            try:
+                data = await asyncio.to_thread((playlist_path.parent / uri).read_bytes)
+            except OSError:
+                await asyncio.to_thread(recorder.reset)
+                continue
+            await asyncio.to_thread(recorder.add, data, duration)
+        next_sequence = sequence + len(entries)
+
+
+def vod_playlist(segments: list[dict[str, Any]], since: float, segment_url: Callable[[int], str]) -> str:
+    """An HLS VOD playlist over indexed segments, starting playback at ``since``."""
+    target = max((math.ceil(segment["duration"]) for segment in segments), default=1)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:6", "#EXT-X-PLAYLIST-TYPE:VOD", f"#EXT-X-TARGETDURATION:{target}", "#EXT-X-MEDIA-SEQUENCE:0"]
+    if segments and since > segments[0]["start_ts"]:
+        # Segments are served whole; let the player skip to the requested instant.
+        lines.append(f"#EXT-X-START:TIME-OFFSET={since - segments[0]['start_ts']:.3f},PRECISE=YES")
+    previous_end: float | None = None
+    for segment in segments:
+        start_ts = segment["start_ts"]
+        broken = previous_end is not None and (segment["discontinuity"] or abs(start_ts - previous_end) > GAP_TOLERANCE_S)
+        if broken:
+            lines.append("#EXT-X-DISCONTINUITY")
+        if previous_end is None or broken:
+            stamp = datetime.fromtimestamp(start_ts, timezone.utc).isoformat(timespec="milliseconds")
+            lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{stamp}")
+        lines.append(f"#EXTINF:{segment['duration']:.3f},")
+        lines.append(segment_url(segment["id"]))
+        previous_end = start_ts + segment["duration"]
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+SEGMENTS = lazy("segments", SegmentIndex)
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from typing import Any
+
+from .config import CONFIG, ProcessConfig
+from .detection import DETECTOR, SCHEDULER
+from .event_engine import ENGINE
+from .file_reaper import FILE_REAPER
+from .live_events import LIVE_EVENTS, LiveEventHub
+from .notifications import NOTIFIER
+from .profiler import run_profile
+from .sensor_history import SENSOR_HISTORY
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ControlServer:
+    """JSON-lines control channel served by the capture daemon on a unix socket.
+
+    API workers in split mode forward state-changing requests here; a ``subscribe``
+    request turns the connection into a relay of live engine events.
+    """
+
+    def __init__(self, cfg: ProcessConfig | None = None):
+        self.cfg = cfg or CONFIG.process
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> None:
+        path = self.cfg.control_socket
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(self._handle, path=str(path))
+        os.chmod(path, 0o600)
+        LOGGER.info("Control channel listening on %s", path)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self.cfg.control_socket.unlink(missing_ok=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                op = request.pop("op", "")
+                if op == "subscribe":
+                    await self._relay_events(writer)
+                    return
+                try:
+                    reply = {"ok": True, "result": await self._dispatch(op, request)}
+                except Exception as exc:
+                    LOGGER.warning("Control op %s failed: %s", op, exc)
+                    reply = {"ok": False, "error": str(exc)}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, json.JSONDecodeError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def _relay_events(self, writer: asyncio.StreamWriter) -> None:
+        async for message in LIVE_EVENTS.subscribe():
+            if message is None:
+                if writer.is_closing():
+                    return
+                continue
+            writer.write(json.dumps(message).encode() + b"\n")
+            await writer.drain()
+
+    async def _dispatch(self, op: str, args: dict[str, Any]) -> dict[str, Any]:
+        if op == "set_mode":
+            ENGINE.set_out_of_home(bool(args["out_of_home"]))
+            return {"out_of_home": ENGINE.out_of_home}
+        if op == "light":
+            ENGINE.toggle_light(bool(args["on"]))
+            return {"light": bool(args["on"])}
+        if op == "privacy":
+            ENGINE.set_privacy_led(bool(args["on"]))
+            return {"privacy_led": bool(args["on"])}
+        if op == "manual_record":
+            return await ENGINE.record_manual(str(args.get("label", "manual")), str(args.get("camera", "main")))
+        if op == "register_push":
+            NOTIFIER.register_token(str(args["token"]))
+            return {"registered": True}
+        if op == "detection_stats":
+            return {**DETECTOR.stats(), "cameras": SCHEDULER.stats()}
+        if op == "reap":
+            FILE_REAPER.kick()
+            return {"kicked": True}
+        if op == "publish":
+            LIVE_EVENTS.publish(str(args.pop("kind")), **args)
+            return {"published": True}
+        if op == "profile":
+            return await asyncio.to_thread(run_profile, float(args["seconds"]), int(args["hz"]), int(args["top"]))
+        if op == "sensor_history":
+            return await asyncio.to_thread(SENSOR_HISTORY.series, float(args["since"]), float(args["until"]), int(args["points"]))
+        if op == "state":
+            return {"out_of_home": ENGINE.out_of_home, "armed": ENGINE.is_armed()}
+        raise ValueError(f"Unknown control op {op!r}")
+
+
+class ControlClient:
+    """Worker-side client for the capture daemon's control channel."""
+
+    def __init__(self, cfg: ProcessConfig | None = None, timeout: float = 10.0):
+        self.cfg = cfg or CONFIG.process
+        self.timeout = timeout
+        self._relay_task: asyncio.Task[None] | None = None
+
+    async def call(self, op: str, timeout: float | None = None, **args: Any) -> dict[str, Any]:
+        """Send one request; raises ConnectionError if the daemon is unreachable or fails."""
+        timeout = timeout or self.timeout
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(str(self.cfg.control_socket)), self.timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise ConnectionError(f"capture daemon unreachable: {exc}") from exc
+        try:
+            writer.write(json.dumps({"op": op, **args}).encode() + b"\n")
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout)
+        except asyncio.TimeoutError as exc:
+            raise ConnectionError(f"capture daemon timed out on {op}") from exc
+        finally:
+            writer.close()
+        if not line:
+            raise ConnectionError("capture daemon closed the control channel")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise ConnectionError(reply.get("error", "control request failed"))
+        return reply["result"]
+
+    def start_event_relay(self, hub: LiveEventHub | None = None) -> None:
+        if self._relay_task is None:
+            self._relay_task = asyncio.create_task(self._relay_loop(hub or LIVE_EVENTS), name="control-event-relay")
+
+    async def stop_event_relay(self) -> None:
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._relay_task
+            self._relay_task = None
+
+    async def _relay_loop(self, hub: LiveEventHub) -> None:
+        backoff = 0.5
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(str(self.cfg.control_socket))
+                writer.write(b'{"op": "subscribe"}\n')
+                await writer.drain()
+                backoff = 0.5
+                while line := await reader.readline():
+                    hub.forward(json.loads(line))
+                writer.close()
+            except (OSError, json.JSONDecodeError) as exc:
+                LOGGER.debug("Event relay disconnected: %s", exc)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10.0)
+
+
+CONTROL = ControlClient()
@@ -1,12 +1,24 @@
 from __future__ import annotations
 
+import asyncio
 import threading
+from dataclasses import dataclass, field
 from typing import Tuple
 
-import cv2
-import numpy as np
-
 from .config import CONFIG, DetectionConfig
+from .services import lazy, lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+@dataclass(slots=True)
+class _ReuseState:
+    fingerprint: np.ndarray | None = None
+    result: tuple[bool, list[Tuple[int, int, int, int]]] = (False, [])
+    scores: list[float] = field(default_factory=list)
+    streak: int = 0
+    reused_last: bool = False
 
 
 class PersonDetector:
@@ -17,8 +29,13 @@ class PersonDetector:
         self._hog = cv2.HOGDescriptor()
         self._hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
         self._lock = threading.Lock()
+        # Reuse cache per camera, so one stream's scene never answers for another's.
+        self._reuse: dict[str, _ReuseState] = {}
+        self.runs = 0
+        self.reused = 0
 
-    def detect(self, frame: np.ndarray) -> tuple[bool, list[Tuple[int, int, int, int]]]:
+    def detect_scored(self, frame: np.ndarray) -> list[tuple[int, int, int, int, float]]:
+        """Boxes at or above ``min_confidence`` as ``(x, y, w, h, score)``."""
         with self._lock:
             boxes, weights = self._hog.detectMultiScale(
                 frame,
@@ -26,11 +43,111 @@ class PersonDetector:
                 padding=self.cfg.hog_padding,
                 scale=1.05,
             )
-        filtered_boxes = []
-        for (x, y, w, h), weight in zip(boxes, weights):
-            if weight >= self.cfg.min_confidence:
-                filtered_boxes.append((x, y, w, h))
-        return bool(filtered_boxes), filtered_boxes
+        return [
+            (int(x), int(y), int(w), int(h), float(weight))
+            for (x, y, w, h), weight in zip(boxes, np.ravel(weights))
+            if weight >= self.cfg.min_confidence
+        ]
+
+    def detect(self, frame: np.ndarray) -> tuple[bool, list[Tuple[int, int, int, int]]]:
+        boxes = [scored[:4] for scored in self.detect_scored(frame)]
+        return bool(boxes), boxes
+
+    def fingerprint(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, self.cfg.fingerprint_size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def detect_if_changed(self, frame: np.ndarray, key: str = "main") -> tuple[bool, list[Tuple[int, int, int, int]]]:
+        """Run ``detect`` unless the frame is nearly identical to the last one analyzed for ``key``."""
+        state = self._reuse.setdefault(key, _ReuseState())
+        fp = self.fingerprint(frame)
+        last = state.fingerprint
+        if (
+            last is not None
+            and self.cfg.reuse_threshold > 0
+            and state.streak < self.cfg.max_reuse_frames
+            and float(np.mean(np.abs(fp - last))) < self.cfg.reuse_threshold
+        ):
+            state.streak += 1
+            state.reused_last = True
+            self.reused += 1
+            return state.result
+        scored = self.detect_scored(frame)
+        boxes = [box[:4] for box in scored]
+        result = (bool(boxes), boxes)
+        state.fingerprint = fp
+        state.result = result
+        state.scores = [box[4] for box in scored]
+        state.streak = 0
+        state.reused_last = False
+        self.runs += 1
+        return result
+
+    def scores(self, key: str = "main") -> list[float]:
+        """Scores for the boxes last returned by ``detect_if_changed`` for ``key``."""
+        state = self._reuse.get(key)
+        return list(state.scores) if state is not None else []
+
+    def was_reused(self, key: str = "main") -> bool:
+        state = self._reuse.get(key)
+        return state is not None and state.reused_last
+
+    def stats(self) -> dict[str, float]:
+        total = self.runs + self.reused
+        return {"runs": self.runs, "reused": self.reused, "hit_rate": self.reused / total if total else 0.0}
+
+
+class DetectionScheduler:
+    """Shares the detector between cameras in proportion to their recent activity.
+
+    Each camera holds at most one pending frame (the newest). The camera with the lowest
+    virtual time is served next and advances by ``1 / weight``, where the weight is an
+    EMA of whether its recent frames changed or contained people, floored at
+    ``scheduler_min_weight``. A quiet camera therefore gets a small share while a busy
+    one is contended, but any idle budget is still used.
+    """
+
+    def __init__(self, cfg: DetectionConfig | None = None):
+        self.cfg = cfg or CONFIG.detection
+        self._pending: dict[str, np.ndarray] = {}
+        self._activity: dict[str, float] = {}
+        self._vtime: dict[str, float] = {}
+        self._clock = 0.0
+        self._ready = asyncio.Event()
+        self.served: dict[str, int] = {}
+
+    def submit(self, camera_id: str, frame: np.ndarray) -> None:
+        # A camera returning from idle starts at the current clock rather than cashing in
+        # the share it did not use.
+        self._vtime[camera_id] = max(self._vtime.get(camera_id, self._clock), self._clock)
+        self._activity.setdefault(camera_id, 1.0)
+        self._pending[camera_id] = frame
+        self._ready.set()
+
+    def weight(self, camera_id: str) -> float:
+        return max(self.cfg.scheduler_min_weight, self._activity.get(camera_id, 1.0))
+
+    async def next_job(self) -> tuple[str, np.ndarray]:
+        while not self._pending:
+            self._ready.clear()
+            await self._ready.wait()
+        camera_id = min(self._pending, key=self._vtime.__getitem__)
+        frame = self._pending.pop(camera_id)
+        self._clock = self._vtime[camera_id]
+        self._vtime[camera_id] += 1 / self.weight(camera_id)
+        self.served[camera_id] = self.served.get(camera_id, 0) + 1
+        return camera_id, frame
+
+    def record(self, camera_id: str, active: bool) -> None:
+        decay = self.cfg.scheduler_activity_decay
+        self._activity[camera_id] = decay * self._activity.get(camera_id, 1.0) + (1 - decay) * float(active)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {
+            camera_id: {"activity": round(self._activity.get(camera_id, 1.0), 3), "weight": round(self.weight(camera_id), 3), "served": served}
+            for camera_id, served in self.served.items()
+        }
 
 
-DETECTOR = PersonDetector()
+DETECTOR = lazy("detector", PersonDetector)
+SCHEDULER = DetectionScheduler()
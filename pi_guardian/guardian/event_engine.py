@@ -1,21 +1,32 @@
 from __future__ import annotations
 
 import asyncio
+import logging
 import time
 import uuid
 from pathlib import Path
 from typing import Any
 
-import cv2
-import numpy as np
-
+from .cameras import CAMERAS, CameraUnit
 from .config import CONFIG
-from .detection import DETECTOR
-from .hardware import CAMERA, LEDS, SENSOR
-from .hls import HLS_STREAM
+from .continuous import SEGMENTS
+from .detection import DETECTOR, SCHEDULER
+from .frame_bus import SharedFrameWriter
+from .hardware import LEDS, SENSOR
+from .live_events import LIVE_EVENTS
 from .notifications import NOTIFIER
-from .rolling_buffer import BUFFER
+from .offload import UPLOADER
+from .previews import PREVIEWS
+from .sensor_history import SENSOR_HISTORY
+from .services import SERVICES, lazy, lazy_import
+from .snapshots import write_thumbnail
 from .storage import STORE
+from .tiering import TIERING
+from .tracks import TRACKS
+
+np = lazy_import("numpy")
+
+LOGGER = logging.getLogger(__name__)
 
 
 class EventEngine:
@@ -23,69 +34,189 @@ class EventEngine:
         self._tasks: set[asyncio.Task[Any]] = set()
         self._shutdown = asyncio.Event()
         self._armed_until = 0.0
-        self._confirm_counter = 0
-        self._last_boxes: list[tuple[int, int, int, int]] = []
         self.out_of_home = CONFIG.out_of_home
-        self._fps = CONFIG.hardware.camera_fps
+        # Set by the capture daemon in split mode to publish each camera's frames to API workers.
+        self.frame_sinks: dict[str, SharedFrameWriter] = {}
 
     async def start(self) -> None:
-        CAMERA.start()
-        await HLS_STREAM.start()
-        self._tasks.add(asyncio.create_task(self._frame_loop(), name="frame-loop"))
+        for unit in CAMERAS:
+            # Opening and warming up a sensor blocks for a while; keep the loop serving.
+            await asyncio.to_thread(unit.camera.start)
+            await unit.hls.start()
+        await PREVIEWS.start(busy=self.any_armed)
+        await TIERING.start(busy=self.any_armed)
+        await NOTIFIER.start()
+        await UPLOADER.start()
+        for unit in CAMERAS:
+            self._tasks.add(asyncio.create_task(self._frame_loop(unit), name=f"frame-loop-{unit.id}"))
+        self._tasks.add(asyncio.create_task(self._detection_loop(), name="detection-loop"))
         self._tasks.add(asyncio.create_task(self._sensor_loop(), name="sensor-loop"))
+        self._tasks.add(asyncio.create_task(self._tracks_loop(), name="tracks-loop"))
+        self._tasks.add(asyncio.create_task(self._sensor_history_loop(), name="sensor-history"))
+        if CONFIG.continuous.enabled:
+            self._tasks.add(asyncio.create_task(self._continuous_prune_loop(), name="continuous-prune"))
 
     async def stop(self) -> None:
         self._shutdown.set()
         for task in self._tasks:
             task.cancel()
         await asyncio.gather(*self._tasks, return_exceptions=True)
-        await HLS_STREAM.stop()
-        CAMERA.stop()
+        await asyncio.to_thread(TRACKS.flush)
+        if SERVICES.is_built("sensor_history"):
+            await asyncio.to_thread(SENSOR_HISTORY.save)
+        await PREVIEWS.stop()
+        await TIERING.stop()
+        if SERVICES.is_built("uploader"):
+            await UPLOADER.stop()
+        # Stop runs after a failed start too: never build a camera here just to stop it.
+        for unit in CAMERAS if SERVICES.is_built("cameras") else ():
+            primary = unit is CAMERAS.primary
+            try:
+                if not primary or SERVICES.is_built("hls_stream"):
+                    await unit.hls.stop()
+                if not primary or SERVICES.is_built("camera"):
+                    unit.camera.stop()
+            except Exception as exc:
+                LOGGER.warning("Stopping camera %s failed: %s", unit.id, exc)
         await NOTIFIER.close()
 
-    async def _frame_loop(self) -> None:
-        frame_period = 1 / CONFIG.hardware.camera_fps
+    def is_armed(self) -> bool:
+        return self.out_of_home and time.time() < self._armed_until
+
+    def camera_armed(self, unit: CameraUnit) -> bool:
+        # Only cameras covering the ultrasonic sensor wait for it; the rest watch whenever away.
+        return self.is_armed() if unit.spec.sensor_armed else self.out_of_home
+
+    def any_armed(self) -> bool:
+        return any(self.camera_armed(unit) for unit in CAMERAS)
+
+    async def _frame_loop(self, unit: CameraUnit) -> None:
+        fps = unit.spec.fps
+        frame_period = 1 / fps
+        sink = self.frame_sinks.get(unit.id)
         while not self._shutdown.is_set():
-            frame = await asyncio.to_thread(CAMERA.capture_frame)
-            BUFFER.add_frame(frame, CONFIG.hardware.camera_fps)
-            HLS_STREAM.publish_frame(frame, CONFIG.hardware.camera_fps)
-            if self.out_of_home and time.time() < self._armed_until:
-                await self._run_detection(frame)
+            frame = await asyncio.to_thread(unit.camera.capture_frame)
+            unit.buffer.add_frame(frame, fps)
+            unit.hls.publish_frame(frame, fps)
+            armed = self.camera_armed(unit)
+            if sink is not None:
+                sink.publish(frame, time.time(), out_of_home=self.out_of_home, armed=armed)
+            if armed:
+                SCHEDULER.submit(unit.id, frame)
             await asyncio.sleep(frame_period * 0.2)
 
+    async def _detection_loop(self) -> None:
+        while not self._shutdown.is_set():
+            camera_id, frame = await SCHEDULER.next_job()
+            unit = CAMERAS.get(camera_id)
+            # The camera may have been disarmed while its frame waited.
+            if unit is not None and self.camera_armed(unit):
+                await self._run_detection(unit, frame)
+
     async def _sensor_loop(self) -> None:
+        # Allocating the ring and loading its saved samples is kept off the loop.
+        await asyncio.to_thread(SERVICES.get, "sensor_history")
         async for distance in SENSOR.readings():
             if self._shutdown.is_set():
                 break
+            SENSOR_HISTORY.add(time.time(), distance)
             if not self.out_of_home:
                 continue
             if distance < CONFIG.hardware.trigger_distance_cm:
                 self._armed_until = time.time() + CONFIG.buffer.post_event_seconds
             await asyncio.sleep(0.1)
 
-    async def _run_detection(self, frame: np.ndarray) -> None:
-        detected, boxes = await asyncio.to_thread(DETECTOR.detect, frame)
+    async def _tracks_loop(self) -> None:
+        while not self._shutdown.is_set():
+            await asyncio.sleep(CONFIG.detection.track_flush_seconds)
+            try:
+                await asyncio.to_thread(TRACKS.flush)
+            except Exception as exc:
+                LOGGER.warning("Writing detection tracks failed: %s", exc)
+
+    async def _sensor_history_loop(self) -> None:
+        while not self._shutdown.is_set():
+            await asyncio.sleep(CONFIG.sensor_history.persist_interval_s)
+            try:
+                await asyncio.to_thread(SENSOR_HISTORY.save)
+            except Exception as exc:
+                LOGGER.warning("Saving sensor history failed: %s", exc)
+
+    async def _continuous_prune_loop(self) -> None:
+        while not self._shutdown.is_set():
+            try:
+                removed = await asyncio.to_thread(SEGMENTS.prune)
+                if removed:
+                    LOGGER.info("Pruned %s continuous recording segments", removed)
+            except Exception as exc:
+                LOGGER.warning("Pruning continuous recordings failed: %s", exc)
+            await asyncio.sleep(CONFIG.continuous.prune_interval_s)
+
+    async def _run_detection(self, unit: CameraUnit, frame: np.ndarray) -> None:
+        detected, boxes = await asyncio.to_thread(DETECTOR.detect_if_changed, frame, unit.id)
+        SCHEDULER.record(unit.id, detected or not DETECTOR.was_reused(unit.id))
+        height, width = frame.shape[:2]
+        TRACKS.record(unit.id, time.time(), boxes, DETECTOR.scores(unit.id), (width, height))
         if detected:
-            self._confirm_counter += 1
-            self._last_boxes = boxes
+            unit.confirm_counter += 1
+            unit.last_boxes = boxes
+            if CONFIG.live_events.publish_detection_boxes:
+                LIVE_EVENTS.publish("detection", camera=unit.id, boxes=boxes, frame_size=[width, height])
         else:
-            self._confirm_counter = 0
-        if self._confirm_counter >= CONFIG.detection.confirmation_frames:
-            self._confirm_counter = 0
-            await self._promote_event(frame)
-
-    async def _promote_event(self, frame: np.ndarray) -> None:
-        clip_path = BUFFER.promote_to_clip("person")
+            unit.confirm_counter = 0
+        if unit.confirm_counter >= CONFIG.detection.confirmation_frames:
+            unit.confirm_counter = 0
+            await self._promote_event(unit, frame)
+
+    async def _promote_event(self, unit: CameraUnit, frame: np.ndarray) -> None:
+        LIVE_EVENTS.publish("event_created", camera=unit.id, label="person", boxes=unit.last_boxes)
+        # Encoding and sealing the clip takes seconds; keep the loop serving meanwhile.
+        clip_path = await asyncio.to_thread(unit.buffer.promote_to_clip, "person")
+        clip_id = Path(clip_path).stem.split("_")[0]
+        thumb_path = await asyncio.to_thread(write_thumbnail, frame, clip_path.with_suffix(".jpg"))
+        await asyncio.to_thread(
+            STORE.add_event,
+            clip_id,
+            clip_path,
+            duration=CONFIG.buffer.pre_event_seconds + CONFIG.buffer.post_event_seconds,
+            label="person",
+            metadata={"boxes": unit.last_boxes, "camera": unit.id},
+            thumbnail_path=thumb_path,
+        )
+        PREVIEWS.enqueue(clip_id, clip_path)
+        await asyncio.to_thread(UPLOADER.enqueue, clip_id, [thumb_path, clip_path])
+        LIVE_EVENTS.publish("clip_ready", camera=unit.id, id=clip_id, label="person", download_url=f"/api/events/recordings/{clip_id}")
+        await asyncio.to_thread(NOTIFIER.enqueue, "Visitor detected", "Tap to open live feed", attachment=thumb_path)
+
+    async def record_manual(self, label: str, camera_id: str = "main") -> dict[str, str]:
+        unit = CAMERAS.get(camera_id)
+        if unit is None:
+            raise KeyError(camera_id)
+        LIVE_EVENTS.publish("event_created", camera=unit.id, label=label)
+        clip_path = await asyncio.to_thread(unit.buffer.promote_to_clip, label)
         clip_id = Path(clip_path).stem.split("_")[0]
-        thumb_path = clip_path.with_suffix(".jpg")
-        cv2.imwrite(str(thumb_path), frame)
-        STORE.add_event(clip_id, clip_path, duration=CONFIG.buffer.pre_event_seconds + CONFIG.buffer.post_event_seconds, label="person", metadata={"boxes": self._last_boxes})
-        await NOTIFIER.push_snapshot(thumb_path, "Visitor detected", "Tap to open live feed")
+        latest = unit.buffer.latest()
+        thumb_path = await asyncio.to_thread(write_thumbnail, latest.frame, clip_path.with_suffix(".jpg")) if latest else None
+        # Approximate duration using configured pre/post window
+        await asyncio.to_thread(
+            STORE.add_event,
+            clip_id,
+            clip_path,
+            duration=CONFIG.buffer.pre_event_seconds + CONFIG.buffer.post_event_seconds,
+            label=label,
+            metadata={"camera": unit.id},
+            thumbnail_path=thumb_path,
+        )
+        PREVIEWS.enqueue(clip_id, clip_path)
+        await asyncio.to_thread(UPLOADER.enqueue, clip_id, [thumb_path, clip_path])
+        LIVE_EVENTS.publish("clip_ready", camera=unit.id, id=clip_id, label=label, download_url=f"/api/events/recordings/{clip_id}")
+        return {"clip": clip_path.name, "id": clip_id, "camera": unit.id}
 
     def set_out_of_home(self, state: bool) -> None:
         self.out_of_home = state
         CONFIG.out_of_home = state
         LEDS.set_privacy(state)
+        LIVE_EVENTS.publish("mode_changed", out_of_home=state)
 
     def toggle_light(self, state: bool) -> None:
         LEDS.set_flood(state)
@@ -94,4 +225,4 @@ class EventEngine:
         LEDS.set_privacy(state)
 
 
-ENGINE = EventEngine()
+ENGINE = lazy("engine", EventEngine)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import logging
+import threading
+from pathlib import Path
+
+from .config import CONFIG, BufferConfig
+from .storage import STORE
+
+LOGGER = logging.getLogger(__name__)
+
+
+class FileReaper:
+    """Background thread that unlinks files queued in ``file_deletions`` by ``EventStore.delete_events``.
+
+    Work is taken in small batches with a pause between them, so a delete of thousands
+    of clips trickles out instead of saturating the SD card under the capture loop.
+    Queued paths survive restarts and are finished on the next start; besides ``kick()``
+    the queue is polled every ``delete_poll_seconds``.
+    """
+
+    def __init__(self, cfg: BufferConfig | None = None):
+        self.cfg = cfg or CONFIG.buffer
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.removed = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="file-reaper", daemon=True)
+        self._thread.start()
+        self._wake.set()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def kick(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.cfg.delete_poll_seconds)
+            self._wake.clear()
+            while not self._stop.is_set():
+                try:
+                    paths = STORE.pending_deletions(self.cfg.delete_batch_size)
+                except Exception as exc:
+                    LOGGER.warning("Reading pending deletions failed: %s", exc)
+                    break
+                if not paths:
+                    break
+                for path in paths:
+                    try:
+                        Path(path).unlink(missing_ok=True)
+                        self.removed += 1
+                    except OSError as exc:
+                        LOGGER.warning("Could not remove %s: %s", path, exc)
+                try:
+                    STORE.complete_deletions(paths)
+                except Exception as exc:
+                    # The batch stays queued; unlinking it again on the next poll is harmless.
+                    LOGGER.warning("Recording completed deletions failed: %s", exc)
+                    break
+                self._stop.wait(self.cfg.delete_pause_seconds)
+
+
+FILE_REAPER = FileReaper()
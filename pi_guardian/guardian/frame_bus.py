@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+
+from .config import CONFIG, ProcessConfig
+from .rolling_buffer import FrameRecord
+from .services import lazy_import
+
+np = lazy_import("numpy")
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = 0x47524446  # "GRDF"
+# Built into an aligned numpy dtype when a ring is mapped, so importing stays numpy-free.
+HEADER_FIELDS = [
+    ("magic", "<u4"),
+    ("slots", "<u4"),
+    ("height", "<u4"),
+    ("width", "<u4"),
+    ("channels", "<u4"),
+    ("writer_pid", "<u4"),
+    ("latest_seq", "<u8"),
+    ("heartbeat", "<f8"),
+    ("out_of_home", "u1"),
+    ("armed", "u1"),
+]
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 16  # seq (u8) + ts (f8)
+
+
+def _slot_stride(frame_nbytes: int) -> int:
+    return (SLOT_HEADER_SIZE + frame_nbytes + 63) // 64 * 64
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    # Before Python 3.13, attaching registers the segment with the resource tracker,
+    # which would unlink the daemon's ring when a worker exits.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # type: ignore[call-arg]
+    except TypeError:
+        pass
+    original = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None  # type: ignore[assignment]
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = original  # type: ignore[assignment]
+
+
+@dataclass(slots=True)
+class SharedState:
+    out_of_home: bool = False
+    armed: bool = False
+    alive: bool = False
+
+
+class _FrameRing:
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        self.header = np.ndarray((1,), dtype=np.dtype(HEADER_FIELDS, align=True), buffer=shm.buf, offset=0)
+        self._map_slots()
+
+    def _map_slots(self) -> None:
+        h = self.header[0]
+        self.slots = int(h["slots"])
+        self.shape = (int(h["height"]), int(h["width"]), int(h["channels"]))
+        nbytes = int(np.prod(self.shape))
+        stride = _slot_stride(nbytes)
+        self._seq = []
+        self._ts = []
+        self._frames = []
+        for i in range(self.slots):
+            base = HEADER_SIZE + i * stride
+            self._seq.append(np.ndarray((1,), dtype="<u8", buffer=self.shm.buf, offset=base))
+            self._ts.append(np.ndarray((1,), dtype="<f8", buffer=self.shm.buf, offset=base + 8))
+            self._frames.append(np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=base + SLOT_HEADER_SIZE))
+
+    def release(self) -> None:
+        # Drop numpy views before closing, otherwise the mmap cannot be released.
+        self.header = None  # type: ignore[assignment]
+        self._seq, self._ts, self._frames = [], [], []
+        self.shm.close()
+
+
+class SharedFrameWriter:
+    """Capture-side publisher of frames into a shared-memory seqlock ring."""
+
+    def __init__(self, cfg: ProcessConfig | None = None, name: str | None = None):
+        self.cfg = cfg or CONFIG.process
+        self.name = name or self.cfg.shm_name
+        self._ring: _FrameRing | None = None
+        self._seq = 0
+
+    def _create(self, shape: tuple[int, ...]) -> None:
+        height, width, channels = shape
+        size = HEADER_SIZE + self.cfg.shm_slots * _slot_stride(height * width * channels)
+        try:
+            shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # Stale segment from a crashed daemon.
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        header = np.ndarray((1,), dtype=np.dtype(HEADER_FIELDS, align=True), buffer=shm.buf, offset=0)
+        header[0] = (MAGIC, self.cfg.shm_slots, height, width, channels, os.getpid(), 0, time.time(), 0, 0)
+        del header
+        self._ring = _FrameRing(shm)
+        LOGGER.info("Shared frame ring %s created: %s slots of %s", self.name, self.cfg.shm_slots, shape)
+
+    def publish(self, frame: np.ndarray, ts: float, out_of_home: bool = False, armed: bool = False) -> None:
+        if self._ring is None:
+            self._create(frame.shape)
+        ring = self._ring
+        assert ring is not None
+        if frame.shape != ring.shape:
+            LOGGER.warning("Frame shape changed %s -> %s; recreating shared ring", ring.shape, frame.shape)
+            self.close()
+            self._create(frame.shape)
+            ring = self._ring
+            assert ring is not None
+        self._seq += 1
+        slot = self._seq % ring.slots
+        ring._seq[slot][0] = 0  # mark slot as being written
+        ring._frames[slot][...] = frame
+        ring._ts[slot][0] = ts
+        ring._seq[slot][0] = self._seq
+        header = ring.header[0]
+        header["latest_seq"] = self._seq
+        header["heartbeat"] = time.time()
+        header["out_of_home"] = out_of_home
+        header["armed"] = armed
+
+    def close(self) -> None:
+        if self._ring is None:
+            return
+        shm = self._ring.shm
+        self._ring.release()
+        shm.unlink()
+        self._ring = None
+
+
+class SharedFrameReader:
+    """Read-only view of the capture daemon's frame ring for API worker processes.
+
+    Shared by the worker's threads (MJPEG streams, snapshots, WebRTC tracks); ``_lock``
+    keeps one thread from releasing the mapping while another is copying out of it.
+    """
+
+    def __init__(self, cfg: ProcessConfig | None = None, name: str | None = None):
+        self.cfg = cfg or CONFIG.process
+        self.name = name or self.cfg.shm_name
+        self._ring: _FrameRing | None = None
+        self._lock = threading.Lock()
+
+    def _attach(self) -> _FrameRing | None:
+        # Caller holds _lock.
+        if self._ring is not None:
+            if time.time() - float(self._ring.header[0]["heartbeat"]) < self.cfg.heartbeat_timeout_s:
+                return self._ring
+            # Writer went quiet: it may have restarted with a fresh segment, so re-open.
+            self._release()
+        try:
+            shm = _attach_untracked(self.name)
+        except FileNotFoundError:
+            return None
+        ring = _FrameRing(shm)
+        if int(ring.header[0]["magic"]) != MAGIC:
+            ring.release()
+            return None
+        self._ring = ring
+        return ring
+
+    def state(self) -> SharedState:
+        with self._lock:
+            ring = self._attach()
+            if ring is None:
+                return SharedState()
+            header = ring.header[0]
+            return SharedState(
+                out_of_home=bool(header["out_of_home"]),
+                armed=bool(header["armed"]),
+                alive=time.time() - float(header["heartbeat"]) < self.cfg.heartbeat_timeout_s,
+            )
+
+    def read(self, seq: int | None = None) -> tuple[int, FrameRecord] | None:
+        """Copy out frame ``seq`` (default: newest). Returns None if not available."""
+        with self._lock:
+            ring = self._attach()
+            if ring is None:
+                return None
+            for _ in range(3):
+                want = int(ring.header[0]["latest_seq"]) if seq is None else seq
+                if want == 0:
+                    return None
+                slot = want % ring.slots
+                if int(ring._seq[slot][0]) != want:
+                    if seq is not None:
+                        return None
+                    continue
+                frame = ring._frames[slot].copy()
+                ts = float(ring._ts[slot][0])
+                # Seqlock check: the writer may have lapped us during the copy.
+                if int(ring._seq[slot][0]) == want:
+                    return want, FrameRecord(ts=ts, frame=frame)
+            return None
+
+    def latest(self) -> FrameRecord | None:
+        result = self.read()
+        return result[1] if result else None
+
+    def next_frame(self, after_seq: int, timeout: float = 2.0) -> tuple[int, np.ndarray]:
+        """Block until a frame newer than ``after_seq`` is published (used from worker threads)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            result = self.read()
+            if result is not None and result[0] > after_seq:
+                return result[0], result[1].frame
+            if time.monotonic() > deadline:
+                raise RuntimeError("No frames from capture daemon")
+            time.sleep(0.005)
+
+    def close(self) -> None:
+        with self._lock:
+            self._release()
+
+    def _release(self) -> None:
+        if self._ring is not None:
+            self._ring.release()
+            self._ring = None
+
+
+def shm_name_for(camera_id: str, cfg: ProcessConfig | None = None) -> str:
+    cfg = cfg or CONFIG.process
+    return cfg.shm_name if camera_id == "main" else f"{cfg.shm_name}-{camera_id}"
+
+
+FRAME_READER = SharedFrameReader()
+_READERS: dict[str, SharedFrameReader] = {"main": FRAME_READER}
+
+
+def reader_for(camera_id: str) -> SharedFrameReader:
+    if camera_id not in _READERS:
+        _READERS[camera_id] = SharedFrameReader(name=shm_name_for(camera_id))
+    return _READERS[camera_id]
@@ -4,27 +4,17 @@ import asyncio
 import contextlib
 import logging
 import time
-from typing import AsyncIterator, Optional
+from typing import Any, AsyncIterator
 
-import numpy as np
+from .config import CONFIG, CameraSpec, HardwareConfig
+from .services import lazy, lazy_import
 
-try:
-    import cv2
-except Exception:  # pragma: no cover
-    cv2 = None  # type: ignore
-
-try:
-    from picamera2 import Picamera2
-except Exception:  # pragma: no cover
-    Picamera2 = None  # type: ignore
-
-try:
-    from gpiozero import LED, DistanceSensor
-except Exception:  # pragma: no cover - dev hosts without GPIO
-    LED = None  # type: ignore
-    DistanceSensor = None  # type: ignore
-
-from .config import CONFIG, HardwareConfig
+# Camera and GPIO stacks are slow to import on a Pi; each loads on first use, and is
+# None on hosts where it is not installed.
+np = lazy_import("numpy")
+cv2 = lazy_import("cv2")
+picamera2 = lazy_import("picamera2")
+gpiozero = lazy_import("gpiozero")
 
 
 LOGGER = logging.getLogger(__name__)
@@ -35,10 +25,15 @@ class UltrasonicWatcher:
 
     def __init__(self, cfg: HardwareConfig | None = None):
         self.cfg = cfg or CONFIG.hardware
-        self.sensor: Optional[DistanceSensor] = None
-        if DistanceSensor is not None and self.cfg.ultrasonic_echo_pin is not None:
+        self.sensor: Any = None
+        self._opened = False
+
+    def _open(self) -> None:
+        # GPIO pins are claimed on first read, not at import, so API-only processes never hold them.
+        self._opened = True
+        if gpiozero is not None and self.cfg.ultrasonic_echo_pin is not None:
             try:
-                self.sensor = DistanceSensor(
+                self.sensor = gpiozero.DistanceSensor(
                     echo=self.cfg.ultrasonic_echo_pin,
                     trigger=self.cfg.ultrasonic_trigger_pin,
                     max_distance=max(1.0, self.cfg.idle_distance_cm / 100.0),
@@ -48,6 +43,8 @@ class UltrasonicWatcher:
                 self.sensor = None
 
     def _read_distance_cm(self) -> float:
+        if not self._opened:
+            self._open()
         if self.sensor is None:
             return float("inf")
         try:
@@ -64,23 +61,33 @@ class UltrasonicWatcher:
 class IndicatorLeds:
     def __init__(self, cfg: HardwareConfig | None = None):
         self.cfg = cfg or CONFIG.hardware
+        self.privacy_led = None
+        self.flood_light = None
+        self._opened = False
+
+    def _open(self) -> None:
+        self._opened = True
         self.privacy_led = self._safe_led(self.cfg.privacy_led_pin)
         self.flood_light = self._safe_led(self.cfg.flood_light_pin)
 
     def _safe_led(self, pin: int | None):
-        if LED is None or pin is None:
+        if gpiozero is None or pin is None:
             return None
         try:
-            return LED(pin)
+            return gpiozero.LED(pin)
         except Exception as exc:  # pragma: no cover - requires hardware
             LOGGER.warning("LED on pin %s unavailable: %s", pin, exc)
             return None
 
     def set_privacy(self, on: bool) -> None:
+        if not self._opened:
+            self._open()
         if self.privacy_led:
             self.privacy_led.value = 1 if on else 0
 
     def set_flood(self, on: bool) -> None:
+        if not self._opened:
+            self._open()
         if self.flood_light:
             self.flood_light.value = 1 if on else 0
 
@@ -88,27 +95,48 @@ class IndicatorLeds:
 class CameraPipeline:
     """Capture frames using Picamera2 with OpenCV VideoCapture fallback."""
 
-    def __init__(self, cfg: HardwareConfig | None = None):
+    def __init__(self, cfg: HardwareConfig | None = None, spec: CameraSpec | None = None):
         self.cfg = cfg or CONFIG.hardware
-        self.picam: Optional[Picamera2] = None
+        self.spec = spec or self.cfg.primary_camera()
+        self.picam: Any = None
+        self.cap = None
         self.started = False
         self._logged_black = False
-        if Picamera2 is not None:
-            try:
-                self.picam = Picamera2()
-            except Exception as exc:  # pragma: no cover
-                LOGGER.warning("Unable to initialize Picamera2: %s", exc)
-                self.picam = None
-
-        if self.picam is None:
+        if self.spec.backend == "opencv":
+            if cv2 is None:
+                raise RuntimeError("No camera backend available (OpenCV missing)")
+        elif picamera2 is None:
             raise RuntimeError("No camera backend available (Picamera2 missing)")
 
+    def _open(self) -> None:
+        # The sensor is opened on first start, not at import, so processes that only import
+        # this module (e.g. split-mode API workers) never grab the camera.
+        if self.spec.backend == "opencv":
+            self.cap = cv2.VideoCapture(self.spec.index)
+            if not self.cap.isOpened():
+                raise RuntimeError(f"Unable to open USB camera {self.spec.index}")
+            width, height = self.spec.resolution
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            self.cap.set(cv2.CAP_PROP_FPS, self.spec.fps)
+            return
+        try:
+            self.picam = picamera2.Picamera2(self.spec.index)
+        except Exception as exc:  # pragma: no cover
+            LOGGER.warning("Unable to initialize Picamera2: %s", exc)
+            raise RuntimeError("No camera backend available (Picamera2 init failed)") from exc
+
     def start(self) -> None:
         if self.started:
             return
+        if self.picam is None and self.cap is None:
+            self._open()
+        if self.cap is not None:
+            self.started = True
+            return
         if self.picam is not None:
-            fps = self.cfg.camera_fps
-            res = self.cfg.camera_resolution
+            fps = self.spec.fps
+            res = self.spec.resolution
             video_cfg = self.picam.create_video_configuration(
                 main={"size": res, "format": "RGB888"},
                 controls={"FrameDurationLimits": (int(1e6 / fps), int(1e6 / fps))},
@@ -137,12 +165,18 @@ class CameraPipeline:
                 self._logged_black = True
                 LOGGER.warning("Picamera2 capture appears black (mean<1); check sensor/lighting/lens cap")
             return frame
+        if self.cap is not None:
+            ok, frame = self.cap.read()
+            if not ok:
+                raise RuntimeError(f"USB camera {self.spec.index} read failed")
+            # VideoCapture yields BGR; the rest of the pipeline works in RGB
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         raise RuntimeError("Camera capture unavailable")
 
     def record_h264(self, seconds: float, output_path: str) -> None:
         if not self.started:
             self.start()
-        fps = self.cfg.camera_fps
+        fps = self.spec.fps
         if self.cap is not None and cv2 is not None:
             fourcc = cv2.VideoWriter_fourcc(*"mp4v")
             writer = None
@@ -170,6 +204,6 @@ class CameraPipeline:
             self.picam.stop_recording()
 
 
-CAMERA = CameraPipeline()
-LEDS = IndicatorLeds()
-SENSOR = UltrasonicWatcher()
+CAMERA = lazy("camera", CameraPipeline)
+LEDS = lazy("leds", IndicatorLeds)
+SENSOR = lazy("sensor", UltrasonicWatcher)
@@ -5,27 +5,87 @@ import contextlib
 import logging
 import shutil
 import subprocess
+import threading
+import time
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple
 
-import numpy as np
+import psutil
 
-from .config import CONFIG
+from .config import CONFIG, HLSConfig
+from .continuous import SegmentRecorder, follow_playlist
+from .llhls import LowLatencyHLSRing, TSPartSplitter
+from .services import lazy, lazy_import
+
+np = lazy_import("numpy")
 
 LOGGER = logging.getLogger(__name__)
 
 
+class RenditionGovernor:
+    """Decides how many of the top ladder rungs to leave out, from system CPU use over a window."""
+
+    def __init__(self, cfg: HLSConfig | None = None, cpu_times: Callable[[], object] = psutil.cpu_times) -> None:
+        self.cfg = cfg or CONFIG.hls
+        self.dropped = 0
+        self._cpu_times = cpu_times
+        self._last = cpu_times()
+        self._window_started = time.monotonic()
+        self._changed = self._window_started
+
+    def _cpu_percent(self) -> float:
+        # Own baseline rather than psutil.cpu_percent(), whose shared state other callers reset.
+        now = self._cpu_times()
+        busy = sum(now) - now.idle - (sum(self._last) - self._last.idle)  # type: ignore[attr-defined,arg-type]
+        total = sum(now) - sum(self._last)  # type: ignore[arg-type]
+        self._last = now
+        return 100.0 * busy / total if total > 0 else 0.0
+
+    def update(self, rungs: int) -> bool:
+        """Re-evaluate once per window; True when ``dropped`` changed and the encoder must restart."""
+        now = time.monotonic()
+        if now - self._window_started < self.cfg.abr_cpu_window_s:
+            return False
+        self._window_started = now
+        cpu = self._cpu_percent()
+        if cpu > self.cfg.abr_cpu_high and self.dropped < rungs - 1:
+            self.dropped += 1
+        elif cpu < self.cfg.abr_cpu_low and self.dropped > 0 and now - self._changed >= self.cfg.abr_restore_after_s:
+            self.dropped -= 1
+        else:
+            return False
+        self._changed = now
+        LOGGER.info("HLS ladder now leaves out %d top rung(s) (CPU %.0f%%)", self.dropped, cpu)
+        return True
+
+
 class HLSStreamService:
     """Feeds camera frames into ffmpeg to maintain an HLS playlist as fallback."""
 
-    def __init__(self) -> None:
+    def __init__(self, playlist_path: Path | None = None, camera_id: str = "main") -> None:
+        self._playlist_path = playlist_path or CONFIG.hls.playlist_path
+        self.camera_id = camera_id
         self._queue: asyncio.Queue[Optional[Tuple[np.ndarray, int]]] | None = None
         self._task: asyncio.Task[None] | None = None
         self._proc: subprocess.Popen[bytes] | None = None
         self._stdin: Optional[object] = None
+        # Spawning and stopping ffmpeg run in worker threads; this keeps them from interleaving.
+        self._proc_lock = threading.RLock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # The LL-HLS ring lives in the writer's memory, so it is unavailable to split-mode API workers.
+        self._ring = LowLatencyHLSRing(CONFIG.hls) if CONFIG.hls.low_latency and not CONFIG.process.split else None
         self._enabled = CONFIG.hls.enabled and shutil.which(CONFIG.hls.ffmpeg_path) is not None
         if CONFIG.hls.enabled and not self._enabled:
             LOGGER.warning("ffmpeg binary not found; disabling HLS fallback stream")
+        # Continuous recording keeps this encoder's output; only the capture side writes it.
+        self._recorder = SegmentRecorder(camera_id) if CONFIG.continuous.enabled and self._enabled else None
+        self._follow_task: asyncio.Task[None] | None = None
+        if CONFIG.continuous.enabled and not self._enabled:
+            LOGGER.warning("Continuous recording needs the HLS encoder; it is disabled for %s", camera_id)
+        self._ladder = list(CONFIG.hls.renditions) if self._ring is None else []
+        self._governor = RenditionGovernor() if self._ladder else None
+        # Rungs the running encoder produces, best first (empty for a single rendition).
+        self._active: list[tuple[str, int, int]] = []
 
     @property
     def enabled(self) -> bool:
@@ -33,29 +93,66 @@ class HLSStreamService:
 
     @property
     def playlist_path(self) -> Path:
-        return CONFIG.hls.playlist_path
+        return self._playlist_path
+
+    @property
+    def ring(self) -> LowLatencyHLSRing | None:
+        """In-memory LL-HLS ring when ``HLSConfig.low_latency`` is set, else None."""
+        return self._ring
+
+    @property
+    def recording_playlist(self) -> Path:
+        """Playlist of the best rendition being produced, which continuous recording keeps."""
+        if self._active:
+            return self._playlist_path.parent / self._active[0][0] / self._playlist_path.name
+        return self._playlist_path
 
     def playlist_ready(self) -> bool:
+        if self._ring is not None:
+            return self._ring.has_media
+        if self._ladder:
+            return (self._playlist_path.parent / CONFIG.hls.master_playlist_name).exists()
         return self.playlist_path.exists()
 
+    def asset_path(self, filename: str) -> Path | None:
+        """File for an HLS request path relative to the playlist, None if it is not one of ours."""
+        if self._ladder and filename == self._playlist_path.name:
+            # Clients that ask for the single playlist get the multi-variant one.
+            filename = CONFIG.hls.master_playlist_name
+        rendition, _, name = filename.rpartition("/")
+        if rendition and rendition not in {rung[0] for rung in self._ladder}:
+            return None
+        if not name or name.startswith("."):
+            return None
+        return self._playlist_path.parent / rendition / name if rendition else self._playlist_path.parent / name
+
     async def start(self) -> None:
         if not self._enabled or self._task is not None:
             return
-        CONFIG.hls.playlist_path.parent.mkdir(parents=True, exist_ok=True)
-        self._purge_old_segments()
+        self._loop = asyncio.get_running_loop()
+        if self._ring is None:
+            self._playlist_path.parent.mkdir(parents=True, exist_ok=True)
+            self._purge_old_segments()
         self._queue = asyncio.Queue(maxsize=CONFIG.hls.queue_size)
         self._task = asyncio.create_task(self._writer_loop(), name="hls-writer")
+        if self._recorder is not None and self._ring is None:
+            self._follow_task = asyncio.create_task(
+                follow_playlist(lambda: self.recording_playlist, self._recorder, CONFIG.continuous.poll_seconds), name=f"continuous-{self.camera_id}"
+            )
 
     async def stop(self) -> None:
         if self._queue is not None:
             with contextlib.suppress(asyncio.QueueFull):
                 await self._queue.put(None)
-        if self._task is not None:
-            self._task.cancel()
-            with contextlib.suppress(asyncio.CancelledError):
-                await self._task
-            self._task = None
-        self._shutdown_process()
+        for task in (self._task, self._follow_task):
+            if task is not None:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        self._task = self._follow_task = None
+        await asyncio.to_thread(self._shutdown_process)
+        if self._recorder is not None:
+            await asyncio.to_thread(self._recorder.reset)
         self._queue = None
 
     def publish_frame(self, frame: np.ndarray, fps: int) -> None:
@@ -85,7 +182,7 @@ class HLSStreamService:
                 continue
             height, width, _ = frame.shape
             if self._proc is None or self._proc.poll() is not None:
-                self._start_process(width, height, fps)
+                await asyncio.to_thread(self._start_process, width, height, fps)
                 if self._proc is None:
                     LOGGER.error("Unable to start ffmpeg process; stopping HLS service")
                     break
@@ -93,7 +190,10 @@ class HLSStreamService:
                 await asyncio.to_thread(self._write_frame_bytes, frame)
             except (BrokenPipeError, ValueError):
                 LOGGER.warning("HLS ffmpeg pipe closed unexpectedly; restarting")
-                self._restart_process(width, height, fps)
+                await asyncio.to_thread(self._restart_process, width, height, fps)
+                continue
+            if self._governor is not None and self._governor.update(len(self._rungs_for(height, 0))):
+                await asyncio.to_thread(self._restart_process, width, height, fps)
 
     def _write_frame_bytes(self, frame: np.ndarray) -> None:
         if self._stdin is None:
@@ -102,10 +202,16 @@ class HLSStreamService:
         self._stdin.flush()
 
     def _start_process(self, width: int, height: int, fps: int) -> None:
-        playlist = CONFIG.hls.playlist_path.resolve()
+        with self._proc_lock:
+            self._spawn(width, height, fps)
+
+    def _spawn(self, width: int, height: int, fps: int) -> None:
+        if self._ring is not None:
+            self._start_low_latency_process(width, height, fps)
+            return
+        playlist = self._playlist_path.resolve()
         playlist.parent.mkdir(parents=True, exist_ok=True)
         self._purge_old_segments()
-        segment_pattern = playlist.parent / "segment_%03d.ts"
         cmd = [
             CONFIG.hls.ffmpeg_path,
             "-hide_banner",
@@ -122,14 +228,69 @@ class HLSStreamService:
             str(fps),
             "-i",
             "-",
+        ]
+        self._active = self._rungs_for(height, self._governor.dropped if self._governor is not None else 0)
+        if self._active:
+            cmd += self._ladder_args(playlist, fps)
+        else:
+            cmd += [
+                "-c:v",
+                CONFIG.hls.video_codec,
+                "-preset",
+                "veryfast",
+                "-tune",
+                "zerolatency",
+                "-vf",
+                "format=yuv420p",
+                "-f",
+                "hls",
+                "-hls_time",
+                str(CONFIG.hls.segment_seconds),
+                "-hls_list_size",
+                str(CONFIG.hls.list_size),
+                "-hls_flags",
+                "delete_segments+append_list",
+                "-hls_segment_filename",
+                str(playlist.parent / "segment_%03d.ts"),
+                str(playlist),
+            ]
+        try:
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            self._stdin = self._proc.stdin
+            LOGGER.info("Started ffmpeg HLS writer pid=%s -> %s", self._proc.pid, playlist)
+        except FileNotFoundError:
+            LOGGER.error("ffmpeg binary not found at %s", CONFIG.hls.ffmpeg_path)
+            self._proc = None
+            self._stdin = None
+
+    def _rungs_for(self, height: int, dropped: int) -> list[tuple[str, int, int]]:
+        # Never upscale: rungs taller than the camera are skipped, but at least one always runs.
+        rungs = [rung for rung in self._ladder if rung[1] <= height] or self._ladder[-1:]
+        return rungs[min(dropped, len(rungs) - 1):]
+
+    def _ladder_args(self, playlist: Path, fps: int) -> list[str]:
+        rungs = self._active
+        # Equal, fixed GOPs on every rung keep segment boundaries aligned so players can switch.
+        gop = max(1, round(fps * CONFIG.hls.segment_seconds))
+        labels = "".join(f"[s{i}]" for i in range(len(rungs)))
+        graph = f"[0:v]format=yuv420p,split={len(rungs)}{labels}"
+        graph += "".join(f";[s{i}]scale=-2:{height}[v{i}]" for i, (_, height, _) in enumerate(rungs))
+        args = ["-filter_complex", graph]
+        for i, (_, _, kbps) in enumerate(rungs):
+            args += ["-map", f"[v{i}]", f"-b:v:{i}", f"{kbps}k", f"-maxrate:v:{i}", f"{round(kbps * 1.1)}k", f"-bufsize:v:{i}", f"{kbps * 2}k"]
+        return args + [
             "-c:v",
             CONFIG.hls.video_codec,
             "-preset",
             "veryfast",
             "-tune",
             "zerolatency",
-            "-vf",
-            "format=yuv420p",
+            "-g",
+            str(gop),
+            "-keyint_min",
+            str(gop),
+            "-sc_threshold",
+            "0",
             "-f",
             "hls",
             "-hls_time",
@@ -137,45 +298,121 @@ class HLSStreamService:
             "-hls_list_size",
             str(CONFIG.hls.list_size),
             "-hls_flags",
-            "delete_segments+append_list",
+            "delete_segments+independent_segments",
+            "-master_pl_name",
+            CONFIG.hls.master_playlist_name,
+            "-var_stream_map",
+            " ".join(f"v:{i},name:{name}" for i, (name, _, _) in enumerate(rungs)),
             "-hls_segment_filename",
-            str(segment_pattern),
-            str(playlist),
+            str(playlist.parent / "%v" / "segment_%03d.ts"),
+            str(playlist.parent / "%v" / playlist.name),
+        ]
+
+    def _start_low_latency_process(self, width: int, height: int, fps: int) -> None:
+        # One keyframe per part so every part is independently decodable.
+        gop = max(1, round(fps * CONFIG.hls.part_seconds))
+        cmd = [
+            CONFIG.hls.ffmpeg_path,
+            "-hide_banner",
+            "-loglevel",
+            "warning",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "rgb24",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            str(fps),
+            "-i",
+            "-",
+            "-c:v",
+            CONFIG.hls.video_codec,
+            "-preset",
+            "veryfast",
+            "-tune",
+            "zerolatency",
+            "-vf",
+            "format=yuv420p",
+            "-g",
+            str(gop),
+            "-keyint_min",
+            str(gop),
+            "-sc_threshold",
+            "0",
+            "-bf",
+            "0",
+            "-f",
+            "mpegts",
+            "-muxdelay",
+            "0",
+            "-muxpreload",
+            "0",
+            "-flush_packets",
+            "1",
+            "pipe:1",
         ]
         try:
-            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
             self._stdin = self._proc.stdin
-            LOGGER.info("Started ffmpeg HLS writer pid=%s -> %s", self._proc.pid, playlist)
+            LOGGER.info("Started ffmpeg LL-HLS writer pid=%s (gop=%s)", self._proc.pid, gop)
         except FileNotFoundError:
             LOGGER.error("ffmpeg binary not found at %s", CONFIG.hls.ffmpeg_path)
             self._proc = None
             self._stdin = None
+            return
+        assert self._ring is not None and self._loop is not None
+        # The ring belongs to the event loop; queued ahead of the new reader's first part.
+        self._loop.call_soon_threadsafe(self._ring.reset)
+        threading.Thread(target=self._read_parts, args=(self._proc,), name="llhls-reader", daemon=True).start()
+
+    def _read_parts(self, proc: subprocess.Popen[bytes]) -> None:
+        assert proc.stdout is not None and self._ring is not None and self._loop is not None
+        splitter = TSPartSplitter()
+        while True:
+            data = proc.stdout.read1(64 * 1024)  # type: ignore[attr-defined]
+            if not data:
+                break
+            for part, duration in splitter.feed(data):
+                with contextlib.suppress(RuntimeError):  # loop closed during shutdown
+                    self._loop.call_soon_threadsafe(self._ring.add_part, part, duration)
+                if self._recorder is not None:
+                    self._recorder.add(part, duration or CONFIG.hls.part_seconds)
 
     def _restart_process(self, width: int, height: int, fps: int) -> None:
-        self._shutdown_process()
-        self._start_process(width, height, fps)
+        with self._proc_lock:
+            self._shutdown_process()
+            if self._recorder is not None and self._ring is not None:
+                # A new encoder starts a new stream; don't splice it onto the old one.
+                self._recorder.reset()
+            self._start_process(width, height, fps)
 
     def _shutdown_process(self) -> None:
-        if self._stdin is not None:
-            try:
-                self._stdin.close()
-            except Exception:
-                pass
-            self._stdin = None
-        if self._proc is not None:
-            self._proc.terminate()
-            with contextlib.suppress(Exception):
-                self._proc.wait(timeout=2)
-            self._proc = None
+        with self._proc_lock:
+            if self._stdin is not None:
+                try:
+                    self._stdin.close()
+                except Exception:
+                    pass
+                self._stdin = None
+            if self._proc is not None:
+                self._proc.terminate()
+                with contextlib.suppress(Exception):
+                    self._proc.wait(timeout=2)
+                self._proc = None
 
     def _purge_old_segments(self) -> None:
-        playlist = CONFIG.hls.playlist_path
+        playlist = self._playlist_path
         parent = playlist.parent
         if playlist.exists():
             playlist.unlink(missing_ok=True)
         if parent.exists():
+            (parent / CONFIG.hls.master_playlist_name).unlink(missing_ok=True)
             for segment in parent.glob("*.ts"):
                 segment.unlink(missing_ok=True)
+            for name, _, _ in self._ladder:
+                for leftover in parent.glob(f"{name}/*.*"):
+                    leftover.unlink(missing_ok=True)
 
 
-HLS_STREAM = HLSStreamService()
+HLS_STREAM = lazy("hls_stream", HLSStreamService)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import time
+from typing import Any, AsyncIterator
+
+from .config import CONFIG, LiveEventsConfig
+
+LOGGER = logging.getLogger(__name__)
+
+
+class LiveEventHub:
+    """Fans out engine/state messages to subscribed clients (SSE / WebSocket)."""
+
+    def __init__(self, cfg: LiveEventsConfig | None = None):
+        self.cfg = cfg or CONFIG.live_events
+        self._subscribers: set[asyncio.Queue[dict[str, Any]]] = set()
+        self._seq = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, kind: str, **payload: Any) -> None:
+        """Queue a message for every subscriber; never blocks the caller."""
+        if not self._subscribers:
+            return
+        self._seq += 1
+        self.forward({"seq": self._seq, "type": kind, "ts": time.time(), **payload})
+
+    def forward(self, message: dict[str, Any]) -> None:
+        """Deliver an already-built message (e.g. relayed from the capture daemon)."""
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its oldest message rather than stall the engine.
+                with contextlib.suppress(asyncio.QueueEmpty):
+                    queue.get_nowait()
+                with contextlib.suppress(asyncio.QueueFull):
+                    queue.put_nowait(message)
+
+    async def subscribe(self) -> AsyncIterator[dict[str, Any] | None]:
+        """Yield messages as they arrive; yields None on keepalive timeouts."""
+        queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=self.cfg.queue_size)
+        self._subscribers.add(queue)
+        LOGGER.info("Live event subscriber added (total=%s)", len(self._subscribers))
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=self.cfg.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscribers.discard(queue)
+            LOGGER.info("Live event subscriber removed (total=%s)", len(self._subscribers))
+
+    async def sse_stream(self) -> AsyncIterator[str]:
+        async for message in self.subscribe():
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {message['seq']}\nevent: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+LIVE_EVENTS = LiveEventHub()
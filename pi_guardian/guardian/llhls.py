@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional
+
+from .config import CONFIG, HLSConfig
+
+TS_PACKET_SIZE = 188
+PTS_CLOCK = 90000
+PTS_WRAP = 1 << 33
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24}
+MEDIA_NAME_RE = re.compile(r"^(?:seg_(\d+)|part_(\d+)_(\d+))\.ts$")
+
+
+def _payload_offset(packet: bytes) -> int:
+    afc = (packet[3] >> 4) & 0x3
+    if afc & 0x2:
+        return 5 + packet[4]
+    return 4
+
+
+def _is_keyframe_start(packet: bytes) -> bool:
+    afc = (packet[3] >> 4) & 0x3
+    return bool(packet[1] & 0x40) and bool(afc & 0x2) and packet[4] > 0 and bool(packet[5] & 0x40)
+
+
+def _pes_pts(packet: bytes) -> Optional[int]:
+    p = _payload_offset(packet)
+    pes = packet[p : p + 14]
+    if len(pes) < 14 or pes[:3] != b"\x00\x00\x01" or not (pes[7] & 0x80):
+        return None
+    b = pes[9:14]
+    return ((b[0] >> 1) & 0x07) << 30 | b[1] << 22 | (b[2] >> 1) << 15 | b[3] << 7 | b[4] >> 1
+
+
+class TSPartSplitter:
+    """Cuts an MPEG-TS byte stream into independently decodable parts at video keyframes."""
+
+    def __init__(self) -> None:
+        self._pending = b""
+        self._pat: bytes | None = None
+        self._pmt: bytes | None = None
+        self._pmt_pid: int | None = None
+        self._video_pid: int | None = None
+        self._current: bytearray | None = None
+        self._current_pts: int | None = None
+
+    def feed(self, data: bytes) -> list[tuple[bytes, Optional[float]]]:
+        """Return completed parts as (bytes, duration_s or None if unknown)."""
+        buf = self._pending + data
+        done: list[tuple[bytes, Optional[float]]] = []
+        pos = 0
+        while pos + TS_PACKET_SIZE <= len(buf):
+            if buf[pos] != 0x47:
+                # Lost sync; scan forward to the next sync byte.
+                pos += 1
+                continue
+            packet = buf[pos : pos + TS_PACKET_SIZE]
+            pos += TS_PACKET_SIZE
+            self._handle_packet(packet, done)
+        self._pending = buf[pos:]
+        return done
+
+    def _handle_packet(self, packet: bytes, done: list[tuple[bytes, Optional[float]]]) -> None:
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        if pid == 0:
+            self._pat = packet
+            self._parse_pat(packet)
+        elif pid == self._pmt_pid:
+            self._pmt = packet
+            self._parse_pmt(packet)
+        elif pid == self._video_pid and _is_keyframe_start(packet):
+            pts = _pes_pts(packet)
+            if self._current is not None:
+                duration = None
+                if pts is not None and self._current_pts is not None:
+                    duration = ((pts - self._current_pts) % PTS_WRAP) / PTS_CLOCK
+                done.append((bytes(self._current), duration))
+            # Every part starts with PAT/PMT so it can be fetched and decoded on its own.
+            self._current = bytearray((self._pat or b"") + (self._pmt or b""))
+            self._current_pts = pts
+        if self._current is not None and pid not in (0, self._pmt_pid):
+            self._current += packet
+
+    def _parse_pat(self, packet: bytes) -> None:
+        p = _payload_offset(packet)
+        p += 1 + packet[p]  # pointer field
+        section_length = ((packet[p + 1] & 0x0F) << 8) | packet[p + 2]
+        entries_end = min(p + 3 + section_length - 4, TS_PACKET_SIZE)
+        for q in range(p + 8, entries_end - 3, 4):
+            program = (packet[q] << 8) | packet[q + 1]
+            if program != 0:
+                self._pmt_pid = ((packet[q + 2] & 0x1F) << 8) | packet[q + 3]
+                return
+
+    def _parse_pmt(self, packet: bytes) -> None:
+        p = _payload_offset(packet)
+        p += 1 + packet[p]
+        section_length = ((packet[p + 1] & 0x0F) << 8) | packet[p + 2]
+        end = min(p + 3 + section_length - 4, TS_PACKET_SIZE)
+        program_info_length = ((packet[p + 10] & 0x0F) << 8) | packet[p + 11]
+        q = p + 12 + program_info_length
+        while q + 5 <= end:
+            stream_type = packet[q]
+            es_pid = ((packet[q + 1] & 0x1F) << 8) | packet[q + 2]
+            es_info_length = ((packet[q + 3] & 0x0F) << 8) | packet[q + 4]
+            if stream_type in VIDEO_STREAM_TYPES:
+                self._video_pid = es_pid
+                return
+            q += 5 + es_info_length
+
+
+@dataclass(slots=True)
+class Part:
+    data: bytes
+    duration: float
+
+
+@dataclass(slots=True)
+class Segment:
+    msn: int
+    parts: list[Part] = field(default_factory=list)
+    complete: bool = False
+    discontinuity: bool = False
+    # Discontinuity sequence number, counting this segment's own tag.
+    discontinuity_seq: int = 0
+    program_date: float = field(default_factory=time.time)
+
+    @property
+    def duration(self) -> float:
+        return sum(p.duration for p in self.parts)
+
+    @property
+    def data(self) -> bytes:
+        return b"".join(p.data for p in self.parts)
+
+
+class LowLatencyHLSRing:
+    """In-memory ring of recent LL-HLS segments/parts plus playlist rendering."""
+
+    def __init__(self, cfg: HLSConfig | None = None):
+        # Only touched on the event loop: the ffmpeg reader thread hands parts over with
+        # call_soon_threadsafe, so there is no lock.
+        self.cfg = cfg or CONFIG.hls
+        self.parts_per_segment = max(1, round(self.cfg.segment_seconds / self.cfg.part_seconds))
+        self._segments: Deque[Segment] = deque(maxlen=max(self.cfg.ring_segments, self.cfg.list_size + 1))
+        self._next_msn = 0
+        self._discontinuity = False
+        self._discontinuity_seq = 0
+        self._changed: asyncio.Event | None = None
+
+    @property
+    def has_media(self) -> bool:
+        return any(seg.complete for seg in self._segments)
+
+    @property
+    def part_target(self) -> float:
+        return self.cfg.part_seconds
+
+    @property
+    def blocking_timeout(self) -> float:
+        return 3 * max(1, math.ceil(self.cfg.segment_seconds))
+
+    def _event(self) -> asyncio.Event:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _notify(self) -> None:
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def reset(self) -> None:
+        """Called when the encoder restarts; the next segment is marked as a discontinuity."""
+        if not self._segments:
+            return
+        # Close a partly written segment short instead of dropping it: its parts may already
+        # have been served, and MSNs and part names must never be reused.
+        self._segments[-1].complete = True
+        self._discontinuity = True
+        self._notify()
+
+    def add_part(self, data: bytes, duration: Optional[float]) -> None:
+        if not self._segments or self._segments[-1].complete:
+            self._discontinuity_seq += self._discontinuity
+            self._segments.append(Segment(msn=self._next_msn, discontinuity=self._discontinuity, discontinuity_seq=self._discontinuity_seq))
+            self._next_msn += 1
+            self._discontinuity = False
+        segment = self._segments[-1]
+        segment.parts.append(Part(data=data, duration=duration if duration else self.cfg.part_seconds))
+        if len(segment.parts) >= self.parts_per_segment:
+            segment.complete = True
+        self._notify()
+
+    def _find(self, msn: int) -> Segment | None:
+        for seg in self._segments:
+            if seg.msn == msn:
+                return seg
+        return None
+
+    def _available(self, msn: int, part: Optional[int]) -> bool:
+        seg = self._find(msn)
+        if seg is None:
+            return bool(self._segments) and self._segments[-1].msn > msn
+        if part is None:
+            return seg.complete
+        return seg.complete or len(seg.parts) > part
+
+    def is_upcoming(self, msn: int, part: Optional[int]) -> bool:
+        """True for media a client may legitimately block on (next segment or preload hint)."""
+        last = self._segments[-1] if self._segments else None
+        if last is None:
+            return msn == 0
+        if last.complete:
+            return msn == last.msn + 1 and (part is None or part == 0)
+        return msn == last.msn and (part is None or part == len(last.parts))
+
+    def too_far_ahead(self, msn: int) -> bool:
+        last_msn = self._segments[-1].msn if self._segments else 0
+        return msn > last_msn + 2
+
+    async def wait_for(self, msn: int, part: Optional[int], timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self._available(msn, part):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._event().wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    def media(self, filename: str) -> tuple[int, Optional[int]] | None:
+        match = MEDIA_NAME_RE.match(filename)
+        if match is None:
+            return None
+        if match.group(1) is not None:
+            return int(match.group(1)), None
+        return int(match.group(2)), int(match.group(3))
+
+    def get(self, msn: int, part: Optional[int]) -> bytes | None:
+        seg = self._find(msn)
+        if seg is None:
+            return None
+        if part is None:
+            return seg.data if seg.complete else None
+        if part < len(seg.parts):
+            return seg.parts[part].data
+        return None
+
+    def playlist(self) -> str:
+        complete = [seg for seg in self._segments if seg.complete][-self.cfg.list_size :]
+        partial = [seg for seg in self._segments if not seg.complete]
+        listed = complete + partial
+        target = max([math.ceil(self.cfg.segment_seconds)] + [math.ceil(seg.duration) for seg in complete])
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:9",
+            f"#EXT-X-TARGETDURATION:{target}",
+            f"#EXT-X-PART-INF:PART-TARGET={self.part_target:.3f}",
+            f"#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * self.part_target:.3f}",
+            f"#EXT-X-MEDIA-SEQUENCE:{listed[0].msn if listed else 0}",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+        ]
+        if listed and listed[0].discontinuity_seq - listed[0].discontinuity:
+            lines.insert(6, f"#EXT-X-DISCONTINUITY-SEQUENCE:{listed[0].discontinuity_seq - listed[0].discontinuity}")
+        # Parts only need to be advertised for the last few segments.
+        with_parts = {seg.msn for seg in listed[-3:]}
+        for seg in listed:
+            if seg.discontinuity:
+                lines.append("#EXT-X-DISCONTINUITY")
+            if seg.msn in with_parts:
+                for idx, part in enumerate(seg.parts):
+                    lines.append(f'#EXT-X-PART:DURATION={part.duration:.3f},URI="part_{seg.msn}_{idx}.ts",INDEPENDENT=YES')
+            if seg.complete:
+                lines.append(f"#EXTINF:{seg.duration:.3f},")
+                lines.append(f"seg_{seg.msn}.ts")
+        if listed and listed[-1].complete:
+            next_msn, next_part = listed[-1].msn + 1, 0
+        elif listed:
+            next_msn, next_part = listed[-1].msn, len(listed[-1].parts)
+        else:
+            next_msn, next_part = 0, 0
+        lines.append(f'#EXT-X-PRELOAD-HINT:TYPE=PART,URI="part_{next_msn}_{next_part}.ts"')
+        return "\n".join(lines) + "\n"
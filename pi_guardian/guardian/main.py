@@ -1,14 +1,41 @@
 from __future__ import annotations
 
+import multiprocessing
+import os
+
 import uvicorn
 
+from . import capture
 from .api import build_app
+from .config import CONFIG
 
 
 def main() -> None:
+    if CONFIG.process.split:
+        _run_split()
+        return
     app = build_app()
     uvicorn.run(app, host="0.0.0.0", port=9001, reload=False)
 
 
+def _run_split() -> None:
+    # Workers are spawned fresh by uvicorn and read their mode from the environment.
+    os.environ["GUARDIAN_PROCESS_MODE"] = CONFIG.process.mode
+    daemon = multiprocessing.Process(target=capture.main, name="guardian-capture", daemon=True)
+    daemon.start()
+    try:
+        uvicorn.run(
+            "guardian.api:build_app",
+            factory=True,
+            host="0.0.0.0",
+            port=9001,
+            workers=CONFIG.process.api_workers,
+            reload=False,
+        )
+    finally:
+        daemon.terminate()
+        daemon.join(timeout=5)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,290 @@
+"""Chunked authenticated encryption for clips and images at rest."""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import logging
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+except Exception:  # pragma: no cover - optional
+    AESGCM = None  # type: ignore
+
+from .config import CONFIG, DEV_STORAGE_KEY, EncryptionConfig
+
+LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"GENC"
+VERSION = 1
+# Header, then sealed chunks (the last may be short or empty); integers big-endian:
+# b"GENC" | version u8 | cipher u8 | reserved u16 | chunk_size u32 | salt (16 bytes)
+HEADER = struct.Struct(">4sBBHI16s")
+TAG_SIZE = 16
+CIPHERS = {"aes-gcm": 1, "chacha20-poly1305": 2}
+_warned_unavailable = False
+_warned_dev_key = False
+
+
+def encryption_enabled(cfg: EncryptionConfig | None = None) -> bool:
+    global _warned_unavailable, _warned_dev_key
+    cfg = cfg or CONFIG.encryption
+    if not cfg.enabled:
+        return False
+    if CONFIG.storage_key == DEV_STORAGE_KEY:
+        # Sealing under a key published in the source would only look like protection.
+        if not _warned_dev_key:
+            LOGGER.error("GUARDIAN_STORAGE_KEY is not set; media will be stored UNENCRYPTED until a storage key is configured")
+            _warned_dev_key = True
+        return False
+    if AESGCM is None:
+        if not _warned_unavailable:
+            LOGGER.warning("cryptography is not installed; media will be stored unencrypted")
+            _warned_unavailable = True
+        return False
+    return True
+
+
+def _aead(cipher_id: int, salt: bytes):
+    if AESGCM is None:
+        raise RuntimeError("cryptography is required to read encrypted media")
+    # Every file gets its own key, derived from the storage key and the file's salt.
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b"guardian-media-v1").derive(CONFIG.storage_key)
+    if cipher_id == CIPHERS["aes-gcm"]:
+        return AESGCM(key)
+    if cipher_id == CIPHERS["chacha20-poly1305"]:
+        return ChaCha20Poly1305(key)
+    raise ValueError(f"Unknown media cipher {cipher_id}")
+
+
+# Chunk index plus a last-chunk flag, sealed with the header as associated data: chunks
+# cannot be reordered, moved between files or truncated unnoticed, yet each decrypts on
+# its own, so a Range read costs only the chunks it touches.
+def _nonce(index: int, last: bool) -> bytes:
+    return index.to_bytes(11, "big") + (b"\x01" if last else b"\x00")
+
+
+class EncryptedWriter(io.RawIOBase):
+    """Write-only stream that seals data chunk by chunk into ``path``.
+
+    Output goes to ``<path>.part`` and is renamed into place on close, so readers
+    never observe a half-written container.
+    """
+
+    def __init__(self, path: Path, cfg: EncryptionConfig | None = None):
+        super().__init__()
+        cfg = cfg or CONFIG.encryption
+        self.path = path
+        self._part = path.with_name(path.name + ".part")
+        self._chunk_size = cfg.chunk_size
+        salt = os.urandom(16)
+        cipher_id = CIPHERS[cfg.cipher]
+        self._header = HEADER.pack(MAGIC, VERSION, cipher_id, 0, self._chunk_size, salt)
+        self._aead = _aead(cipher_id, salt)
+        self._file = self._part.open("wb")
+        self._file.write(self._header)
+        self._buffer = bytearray()
+        self._index = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes | bytearray | memoryview) -> int:
+        self._buffer += data
+        # Hold back at least one byte so the final chunk, which carries the last flag,
+        # is only sealed on close.
+        while len(self._buffer) > self._chunk_size:
+            self._seal(bytes(self._buffer[: self._chunk_size]), last=False)
+            del self._buffer[: self._chunk_size]
+        return len(data)
+
+    def _seal(self, chunk: bytes, last: bool) -> None:
+        self._file.write(self._aead.encrypt(_nonce(self._index, last), chunk, self._header))
+        self._index += 1
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            self._seal(bytes(self._buffer), last=True)
+            self._buffer.clear()
+            self._file.close()
+            os.replace(self._part, self.path)
+        finally:
+            if not self._file.closed:
+                self._file.close()
+            super().close()
+
+    def abort(self) -> None:
+        self._file.close()
+        self._part.unlink(missing_ok=True)
+        super().close()
+
+
+class EncryptedReader(io.RawIOBase):
+    """Seekable, read-only plaintext view of an encrypted container."""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self._file = path.open("rb")
+        self._header = self._file.read(HEADER.size)
+        magic, version, cipher_id, _, chunk_size, salt = HEADER.unpack(self._header)
+        if magic != MAGIC or version != VERSION:
+            self._file.close()
+            raise ValueError(f"{path} is not an encrypted media container")
+        self._aead = _aead(cipher_id, salt)
+        self.chunk_size = chunk_size
+        body = os.fstat(self._file.fileno()).st_size - HEADER.size
+        sealed = chunk_size + TAG_SIZE
+        self._chunks = max(1, -(-body // sealed))
+        # The plaintext size follows from the file size.
+        self.size = body - self._chunks * TAG_SIZE
+        if self.size < 0:
+            self._file.close()
+            raise ValueError(f"{path} is truncated")
+        self._pos = 0
+        self._cached: tuple[int, bytes] | None = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def _chunk(self, index: int) -> bytes:
+        if self._cached is not None and self._cached[0] == index:
+            return self._cached[1]
+        self._file.seek(HEADER.size + index * (self.chunk_size + TAG_SIZE))
+        sealed = self._file.read(self.chunk_size + TAG_SIZE)
+        plain = self._aead.decrypt(_nonce(index, index == self._chunks - 1), sealed, self._header)
+        self._cached = (index, plain)
+        return plain
+
+    def readinto(self, buffer) -> int:  # type: ignore[override]
+        view = memoryview(buffer).cast("B")
+        written = 0
+        while written < len(view) and self._pos < self.size:
+            index, offset = divmod(self._pos, self.chunk_size)
+            chunk = self._chunk(index)
+            take = min(len(chunk) - offset, len(view) - written)
+            view[written : written + take] = chunk[offset : offset + take]
+            written += take
+            self._pos += take
+        return written
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+            self._cached = None
+        super().close()
+
+
+# Files without the magic are plaintext, e.g. clips recorded before encryption was enabled.
+def is_encrypted(path: Path) -> bool:
+    with path.open("rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_media(path: Path) -> BinaryIO:
+    """Open a stored clip or image for reading plaintext, encrypted or not."""
+    if is_encrypted(path):
+        reader = EncryptedReader(path)
+        # Buffer one chunk of this file, not the configured chunk_size (which may have
+        # changed since it was sealed), so a small read decrypts at most two chunks.
+        return io.BufferedReader(reader, buffer_size=reader.chunk_size)  # type: ignore[return-value]
+    return path.open("rb")
+
+
+def media_size(path: Path) -> int:
+    """Plaintext size without decrypting anything."""
+    if not is_encrypted(path):
+        return path.stat().st_size
+    with EncryptedReader(path) as reader:
+        return reader.size
+
+
+def read_media_bytes(path: Path) -> bytes:
+    with open_media(path) as f:
+        return f.read()
+
+
+def write_media_bytes(path: Path, data: bytes) -> None:
+    if not encryption_enabled():
+        path.write_bytes(data)
+        return
+    writer = EncryptedWriter(path)
+    try:
+        writer.write(data)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def encrypt_file(src: Path, dst: Path) -> None:
+    """Stream ``src`` into an encrypted container at ``dst``."""
+    writer = EncryptedWriter(dst)
+    try:
+        with src.open("rb") as f:
+            while chunk := f.read(CONFIG.encryption.chunk_size * 4):
+                writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def _scratch_file(suffix: str) -> Path:
+    scratch = CONFIG.encryption.scratch_dir
+    directory = scratch if scratch.is_dir() and os.access(scratch, os.W_OK) else None
+    fd, name = tempfile.mkstemp(suffix=suffix, prefix="guardian-", dir=directory)
+    os.close(fd)
+    return Path(name)
+
+
+@contextlib.contextmanager
+def sealed_output(path: Path) -> Iterator[Path]:
+    """Yield a path for a library that can only write to files (OpenCV), then seal it into ``path``.
+
+    The plaintext lives in ``scratch_dir`` (tmpfs by default), never on the SD card.
+    """
+    if not encryption_enabled():
+        yield path
+        return
+    scratch = _scratch_file(path.suffix)
+    try:
+        yield scratch
+        encrypt_file(scratch, path)
+    finally:
+        scratch.unlink(missing_ok=True)
+
+
+@contextlib.contextmanager
+def plaintext_path(path: Path) -> Iterator[Path]:
+    """Yield a readable plaintext path for ``path``, decrypting to scratch only when needed."""
+    if not is_encrypted(path):
+        yield path
+        return
+    scratch = _scratch_file(path.suffix)
+    try:
+        with open_media(path) as src, scratch.open("wb") as dst:
+            while chunk := src.read(CONFIG.encryption.chunk_size * 4):
+                dst.write(chunk)
+        yield scratch
+    finally:
+        scratch.unlink(missing_ok=True)
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from .media_crypto import open_media
+
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts", b"dinf"}
+
+
+@dataclass(slots=True)
+class Box:
+    type: bytes
+    start: int
+    header_size: int
+    size: int
+
+    @property
+    def payload_start(self) -> int:
+        return self.start + self.header_size
+
+    @property
+    def end(self) -> int:
+        return self.start + self.size
+
+
+@dataclass(slots=True)
+class VideoTrackIndex:
+    """Sample table of the first video track in an MP4 file."""
+
+    timescale: int
+    duration: int
+    offsets: list[int] = field(default_factory=list)
+    sizes: list[int] = field(default_factory=list)
+    dts: list[int] = field(default_factory=list)
+    sync: list[int] = field(default_factory=list)
+    # Composition offsets (ctts); empty when presentation order equals decode order.
+    cts: list[int] = field(default_factory=list)
+
+    @property
+    def duration_s(self) -> float:
+        return self.duration / self.timescale if self.timescale else 0.0
+
+    def time_of(self, sample: int) -> float:
+        return self.dts[sample] / self.timescale
+
+    def keyframes(self) -> list[tuple[float, int]]:
+        """(time_s, byte_offset) for every sync sample."""
+        return [(round(self.time_of(i), 3), self.offsets[i]) for i in self.sync]
+
+
+def iter_boxes(data: bytes | memoryview, start: int = 0, end: int | None = None) -> Iterator[Box]:
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", data, pos + 8)
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            break
+        yield Box(kind, pos, header, size)
+        pos += size
+
+
+def iter_file_boxes(f: BinaryIO) -> Iterator[Box]:
+    """Walk top-level boxes without reading payloads (mdat can be huge)."""
+    f.seek(0, 2)
+    file_size = f.tell()
+    pos = 0
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        header = f.read(16)
+        size, kind = struct.unpack_from(">I4s", header, 0)
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", header, 8)
+            header_size = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header_size:
+            break
+        yield Box(kind, pos, header_size, size)
+        pos += size
+
+
+def read_moov(path: Path) -> bytes:
+    with open_media(path) as f:
+        for box in iter_file_boxes(f):
+            if box.type == b"moov":
+                f.seek(box.start)
+                return f.read(box.size)
+    raise ValueError(f"{path} has no moov box")
+
+
+def find_box(data: bytes | memoryview, path: list[bytes], start: int = 0, end: int | None = None) -> Box | None:
+    for box in iter_boxes(data, start, end):
+        if box.type != path[0]:
+            continue
+        if len(path) == 1:
+            return box
+        found = find_box(data, path[1:], box.payload_start, box.end)
+        if found is not None:
+            return found
+    return None
+
+
+def video_trak(moov: bytes) -> Box:
+    moov_box = next(iter_boxes(moov))
+    for trak in iter_boxes(moov, moov_box.payload_start, moov_box.end):
+        if trak.type != b"trak":
+            continue
+        hdlr = find_box(moov, [b"mdia", b"hdlr"], trak.payload_start, trak.end)
+        if hdlr is not None and moov[hdlr.payload_start + 8 : hdlr.payload_start + 12] == b"vide":
+            return trak
+    raise ValueError("No video track found")
+
+
+def parse_video_index(moov: bytes) -> VideoTrackIndex:
+    trak = video_trak(moov)
+    mdhd = find_box(moov, [b"mdia", b"mdhd"], trak.payload_start, trak.end)
+    stbl = find_box(moov, [b"mdia", b"minf", b"stbl"], trak.payload_start, trak.end)
+    if mdhd is None or stbl is None:
+        raise ValueError("Incomplete video track")
+    p = mdhd.payload_start
+    if moov[p] == 1:
+        timescale, duration = struct.unpack_from(">IQ", moov, p + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", moov, p + 12)
+
+    tables = {box.type: box.payload_start for box in iter_boxes(moov, stbl.payload_start, stbl.end)}
+
+    # stsz: per-sample sizes
+    p = tables[b"stsz"]
+    uniform, count = struct.unpack_from(">II", moov, p + 4)
+    sizes = [uniform] * count if uniform else list(struct.unpack_from(f">{count}I", moov, p + 12))
+
+    # stts: decode deltas
+    p = tables[b"stts"]
+    (entries,) = struct.unpack_from(">I", moov, p + 4)
+    dts: list[int] = []
+    t = 0
+    for i in range(entries):
+        n, delta = struct.unpack_from(">II", moov, p + 8 + i * 8)
+        for _ in range(n):
+            dts.append(t)
+            t += delta
+
+    # stco/co64: chunk offsets
+    if b"stco" in tables:
+        p = tables[b"stco"]
+        (n,) = struct.unpack_from(">I", moov, p + 4)
+        chunk_offsets = list(struct.unpack_from(f">{n}I", moov, p + 8))
+    else:
+        p = tables[b"co64"]
+        (n,) = struct.unpack_from(">I", moov, p + 4)
+        chunk_offsets = list(struct.unpack_from(f">{n}Q", moov, p + 8))
+
+    # stsc: samples-per-chunk runs
+    p = tables[b"stsc"]
+    (entries,) = struct.unpack_from(">I", moov, p + 4)
+    runs = [struct.unpack_from(">III", moov, p + 8 + i * 12)[:2] for i in range(entries)]
+    offsets: list[int] = []
+    sample = 0
+    for r, (first_chunk, per_chunk) in enumerate(runs):
+        last_chunk = runs[r + 1][0] - 1 if r + 1 < len(runs) else len(chunk_offsets)
+        for chunk in range(first_chunk, last_chunk + 1):
+            offset = chunk_offsets[chunk - 1]
+            for _ in range(per_chunk):
+                if sample >= len(sizes):
+                    break
+                offsets.append(offset)
+                offset += sizes[sample]
+                sample += 1
+
+    # stss: sync samples (absent means every sample is a keyframe)
+    if b"stss" in tables:
+        p = tables[b"stss"]
+        (n,) = struct.unpack_from(">I", moov, p + 4)
+        sync = [s - 1 for s in struct.unpack_from(f">{n}I", moov, p + 8)]
+    else:
+        sync = list(range(len(sizes)))
+
+    # ctts: composition offsets (version 1 stores them signed)
+    cts: list[int] = []
+    if b"ctts" in tables:
+        p = tables[b"ctts"]
+        (entries,) = struct.unpack_from(">I", moov, p + 4)
+        signed = moov[p] == 1
+        for i in range(entries):
+            n, offset = struct.unpack_from(">Ii" if signed else ">II", moov, p + 8 + i * 8)
+            cts.extend([offset] * n)
+
+    count = min(len(sizes), len(offsets), len(dts))
+    return VideoTrackIndex(
+        timescale=timescale,
+        duration=duration,
+        offsets=offsets[:count],
+        sizes=sizes[:count],
+        dts=dts[:count],
+        sync=[s for s in sync if s < count],
+        cts=cts[:count],
+    )
+
+
+def read_video_index(path: Path) -> VideoTrackIndex:
+    return parse_video_index(read_moov(path))
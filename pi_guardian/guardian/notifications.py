@@ -1,35 +1,213 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
 import json
+import logging
+import sqlite3
+import time
 from pathlib import Path
-from typing import Iterable
-
-import httpx
+from typing import Any
 
 from .config import CONFIG, NotificationConfig
+from .media_crypto import read_media_bytes
+from .services import lazy, lazy_import
+
+httpx = lazy_import("httpx")
+h2 = lazy_import("h2")  # enables httpx HTTP/2 support (negotiated over TLS only)
+
+LOGGER = logging.getLogger(__name__)
+
+
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    coalesce_key TEXT NOT NULL,
+    created_ts REAL NOT NULL,
+    not_before REAL NOT NULL,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    attachment_path TEXT,
+    event_count INTEGER NOT NULL DEFAULT 1,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    sent_ts REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS notification_outbox_due ON notification_outbox (status, not_before);
+"""
 
 
 class Notifier:
-    """Placeholder APNs integration via a lightweight HTTP relay."""
+    """APNs integration via a lightweight HTTP relay, fed from a persistent outbox.
+
+    ``enqueue`` only writes a row; a background sender drains due rows with a pooled
+    client, retries with exponential backoff and coalesces bursts per ``coalesce_key``.
+    """
 
     def __init__(self, cfg: NotificationConfig | None = None):
         self.cfg = cfg or CONFIG.notifications
-        self._client = httpx.AsyncClient(timeout=5.0)
+        self.db_path = CONFIG.buffer.metadata_db
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._wake: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._inflight_id = -1
+        self._ensure_db()
 
-    async def push_snapshot(self, image_path: Path, title: str, body: str) -> None:
+    def _ensure_db(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executescript(OUTBOX_SCHEMA)
+        finally:
+            conn.close()
+
+    def register_token(self, token: str) -> None:
+        if token not in self.cfg.apns_device_tokens:
+            self.cfg.apns_device_tokens.append(token)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=self.cfg.send_timeout_s,
+            # httpx speaks HTTP/2 only through ALPN; a plain http:// relay stays on HTTP/1.1.
+            http2=h2 is not None and self.cfg.relay_url.startswith("https://"),
+            limits=httpx.Limits(max_connections=2, max_keepalive_connections=2),
+        )
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._sender_loop(), name="notification-sender")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+            self._wake = self._loop = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def enqueue(self, title: str, body: str, attachment: Path | None = None, coalesce_key: str = "visitor") -> None:
+        """Record an alert for delivery. Alerts within ``coalesce_window_s`` of the last send merge.
+
+        Blocks on SQLite, so call it from a worker thread.
+        """
+        if not self.cfg.apns_device_tokens:
+            return
+        now = time.time()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                # A row in retry backoff (attempts > 0) keeps its own alert; new ones get a fresh row.
+                pending = conn.execute(
+                    "SELECT id FROM notification_outbox WHERE coalesce_key = ? AND status = 'pending' AND attempts = 0 AND id != ? "
+                    "ORDER BY id DESC LIMIT 1",
+                    (coalesce_key, self._inflight_id),
+                ).fetchone()
+                if pending is not None:
+                    conn.execute(
+                        "UPDATE notification_outbox SET event_count = event_count + 1, attachment_path = COALESCE(?, attachment_path), title = ? WHERE id = ?",
+                        (str(attachment) if attachment else None, title, pending[0]),
+                    )
+                else:
+                    last_sent = conn.execute(
+                        "SELECT MAX(sent_ts) FROM notification_outbox WHERE coalesce_key = ? AND status = 'sent'",
+                        (coalesce_key,),
+                    ).fetchone()[0]
+                    # First alert goes out immediately; later ones in the window wait and merge.
+                    not_before = now if last_sent is None else max(now, last_sent + self.cfg.coalesce_window_s)
+                    conn.execute(
+                        "INSERT INTO notification_outbox (coalesce_key, created_ts, not_before, title, body, attachment_path) VALUES (?, ?, ?, ?, ?, ?)",
+                        (coalesce_key, now, not_before, title, body, str(attachment) if attachment else None),
+                    )
+        finally:
+            conn.close()
+        if self._wake is not None and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _next_due(self) -> tuple[dict[str, Any] | None, float | None]:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT id, title, body, attachment_path, event_count, attempts, not_before, created_ts FROM notification_outbox "
+                "WHERE status = 'pending' ORDER BY not_before LIMIT 1"
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None, None
+        if row[6] > time.time():
+            return None, row[6]
+        return {"id": row[0], "title": row[1], "body": row[2], "attachment_path": row[3], "event_count": row[4], "attempts": row[5], "created_ts": row[7]}, None
+
+    def _mark(self, job_id: int, status: str, **fields: Any) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute(
+                    f"UPDATE notification_outbox SET status = ?{', ' + assignments if assignments else ''} WHERE id = ?",
+                    (status, *fields.values(), job_id),
+                )
+                conn.execute(
+                    "DELETE FROM notification_outbox WHERE status != 'pending' AND created_ts < ?",
+                    (time.time() - self.cfg.outbox_retention_s,),
+                )
+        finally:
+            conn.close()
+
+    async def _sender_loop(self) -> None:
+        assert self._wake is not None
+        while True:
+            self._wake.clear()
+            job, wake_at = await asyncio.to_thread(self._next_due)
+            if job is None:
+                timeout = max(0.05, wake_at - time.time()) if wake_at else None
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                continue
+            self._inflight_id = job["id"]
+            try:
+                await self._send(job)
+            except Exception as exc:
+                attempts = job["attempts"] + 1
+                if attempts >= self.cfg.max_attempts:
+                    LOGGER.warning("Dropping notification %s after %s attempts: %s", job["id"], attempts, exc)
+                    await asyncio.to_thread(self._mark, job["id"], "failed", attempts=attempts, last_error=str(exc))
+                else:
+                    delay = min(self.cfg.retry_base_s * 2 ** (attempts - 1), self.cfg.retry_max_s)
+                    await asyncio.to_thread(
+                        self._mark, job["id"], "pending", attempts=attempts, last_error=str(exc), not_before=time.time() + delay
+                    )
+                continue
+            finally:
+                self._inflight_id = -1
+            await asyncio.to_thread(self._mark, job["id"], "sent", sent_ts=time.time())
+
+    async def _send(self, job: dict[str, Any]) -> None:
         if not self.cfg.apns_device_tokens:
             return
+        assert self._client is not None
+        body = job["body"]
+        if job["event_count"] > 1:
+            body = f"{job['event_count']} detections in the last {int(self.cfg.coalesce_window_s)}s. {body}"
         payload = {
             "topic": self.cfg.apns_topic,
             "tokens": self.cfg.apns_device_tokens,
-            "alert": {"title": title, "body": body},
+            "alert": {"title": job["title"], "body": body},
             "mutable-content": 1,
+            "created_ts": job["created_ts"],
         }
-        files = {"snapshot": image_path.read_bytes()} if image_path.exists() else None
-        await self._client.post("http://localhost:9000/apns", data={"payload": json.dumps(payload)}, files=files)
-
-    async def close(self) -> None:
-        await self._client.aclose()
+        files = None
+        attachment = Path(job["attachment_path"]) if job["attachment_path"] else None
+        if attachment is not None and attachment.exists():
+            files = {"snapshot": await asyncio.to_thread(read_media_bytes, attachment)}
+        response = await self._client.post(self.cfg.relay_url, data={"payload": json.dumps(payload)}, files=files)
+        response.raise_for_status()
 
 
-NOTIFIER = Notifier()
+NOTIFIER = lazy("notifier", Notifier)
@@ -0,0 +1,358 @@
+"""Background offload of finished clips and thumbnails to an S3-compatible bucket."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+import psutil
+
+from .config import CONFIG, OffloadConfig
+from .media_crypto import is_encrypted
+from .s3 import Credentials, S3Client, S3Error
+from .services import lazy, lazy_import
+from .storage import STORE
+
+httpx = lazy_import("httpx")
+
+LOGGER = logging.getLogger(__name__)
+
+UPLOAD_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT NOT NULL,
+    event_ts REAL NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    object_key TEXT NOT NULL,
+    not_before REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    size INTEGER,
+    mtime REAL,
+    upload_id TEXT,
+    etags TEXT NOT NULL DEFAULT '[]',
+    done_ts REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS upload_queue_due ON upload_queue (status, not_before);
+"""
+
+# Granularity of pacing; also how much a request sends between checks of the uplink.
+CHUNK_BYTES = 64 * 1024
+# Bytes on the wire per payload byte (TCP/IP and TLS framing), so our own traffic is not
+# mistaken for someone else's.
+WIRE_OVERHEAD = 1.06
+_SAMPLE_S = 2.0
+
+CONTENT_TYPES = {".mp4": "video/mp4", ".jpg": "image/jpeg"}
+
+
+class SkipUpload(Exception):
+    """The file or its event is gone; nothing left to upload."""
+
+
+def _sent_bytes() -> int:
+    # Loopback is local traffic (API workers, a local stand-in server), not uplink.
+    return sum(counters.bytes_sent for name, counters in psutil.net_io_counters(pernic=True).items() if name != "lo")
+
+
+class UplinkShaper:
+    """Paces upload bytes with a token bucket and steps aside for other outbound traffic.
+
+    Other traffic is the interfaces' ``bytes_sent`` minus what the uploader itself handed
+    to the network; above ``yield_above_kbps`` new requests wait until it has been quiet
+    for ``yield_resume_s``, and requests in flight drop to ``yield_trickle_kbps``.
+    """
+
+    def __init__(self, cfg: OffloadConfig):
+        self.cfg = cfg
+        self._allowance = 0.0
+        self._stamp = time.monotonic()
+        self._own = 0
+        self._sample: tuple[float, int, int] | None = None
+        self._busy_until = 0.0
+        self.yields = 0
+
+    def _poll(self) -> None:
+        now = time.monotonic()
+        if self._sample is not None and now - self._sample[0] < _SAMPLE_S:
+            return
+        sent = _sent_bytes()
+        if self._sample is not None:
+            stamp, last_sent, last_own = self._sample
+            other = (sent - last_sent) - (self._own - last_own) * WIRE_OVERHEAD
+            if other * 8 / 1000 / (now - stamp) > self.cfg.yield_above_kbps:
+                if now >= self._busy_until:
+                    self.yields += 1
+                    LOGGER.info("Uplink busy (%.0f kbps from others); uploads stepping aside", other * 8 / 1000 / (now - stamp))
+                self._busy_until = now + self.cfg.yield_resume_s
+        self._sample = (now, sent, self._own)
+
+    def stepping_aside(self) -> bool:
+        self._poll()
+        return time.monotonic() < self._busy_until
+
+    async def wait_clear(self) -> None:
+        while self.stepping_aside():
+            await asyncio.sleep(1.0)
+
+    async def acquire(self, size: int) -> None:
+        kbps = self.cfg.yield_trickle_kbps if self.stepping_aside() else self.cfg.max_kbps
+        if kbps > 0:
+            rate = kbps * 125  # bytes per second
+            now = time.monotonic()
+            # At most one second of burst; going negative makes later callers wait their turn too.
+            self._allowance = min(rate, self._allowance + (now - self._stamp) * rate) - size
+            self._stamp = now
+            if self._allowance < 0:
+                await asyncio.sleep(-self._allowance / rate)
+        self._own += size
+
+
+class Uploader:
+    """Drains ``upload_queue`` newest event first, mirroring each object's state into ``metadata["offload"]``."""
+
+    def __init__(self, cfg: OffloadConfig | None = None):
+        self.cfg = cfg or CONFIG.offload
+        self.db_path = CONFIG.buffer.metadata_db
+        self.shaper = UplinkShaper(self.cfg)
+        self._client: httpx.AsyncClient | None = None
+        self._s3: S3Client | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+        self._wake: asyncio.Event | None = None
+        # Serializes the read-modify-write of metadata["offload"] across workers.
+        self._metadata_lock = threading.Lock()
+        self._ensure_db()
+
+    def _ensure_db(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executescript(UPLOAD_SCHEMA)
+        finally:
+            conn.close()
+
+    async def start(self) -> None:
+        if not self.cfg.enabled or self._tasks:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=self.cfg.request_timeout_s,
+            limits=httpx.Limits(max_connections=self.cfg.concurrency, max_keepalive_connections=self.cfg.concurrency),
+        )
+        creds = Credentials(self.cfg.access_key, self.cfg.secret_key, self.cfg.region)
+        self._s3 = S3Client(self._client, self.cfg.endpoint, self.cfg.bucket, creds)
+        self._wake = asyncio.Event()
+        await asyncio.to_thread(self._recover)
+        self._tasks = [asyncio.create_task(self._worker_loop(), name=f"s3-upload-{index}") for index in range(self.cfg.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _recover(self) -> None:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                # Uploads interrupted by a restart carry on from their last recorded part.
+                conn.execute("UPDATE upload_queue SET status = 'pending' WHERE status = 'active'")
+                conn.execute(
+                    "DELETE FROM upload_queue WHERE status IN ('done', 'failed', 'skipped') AND done_ts < ?",
+                    (time.time() - self.cfg.queue_retention_s,),
+                )
+        finally:
+            conn.close()
+        if self.cfg.backfill:
+            missing = [event for event in STORE.list_events() if "offload" not in event["metadata"]]
+            for event in missing:
+                paths = [Path(path) for path in (event["thumbnail_path"], event["clip_path"]) if path and Path(path).exists()]
+                self.enqueue(event["id"], paths)
+            if missing:
+                LOGGER.info("Queued %s earlier events for offload", len(missing))
+
+    def object_key(self, event: dict[str, Any], path: Path) -> str:
+        day = datetime.fromtimestamp(event["created_ts"], timezone.utc).strftime("%Y/%m/%d")
+        return f"{self.cfg.prefix}{event['metadata'].get('camera', 'main')}/{day}/{path.name}"
+
+    def enqueue(self, event_id: str, paths: list[Path | None]) -> None:
+        """Queue an event's files for upload, in the order given; files already queued are left alone."""
+        if not self.cfg.enabled:
+            return
+        event = STORE.get_event(event_id)
+        paths = [Path(path) for path in paths if path]
+        if event is None or not paths:
+            return
+        now = time.time()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO upload_queue (event_id, event_ts, path, object_key, not_before) VALUES (?, ?, ?, ?, ?)",
+                    [(event_id, event["created_ts"], str(path), self.object_key(event, path), now) for path in paths],
+                )
+        finally:
+            conn.close()
+        for path in paths:
+            self._record(event_id, path, {"state": "pending", "key": self.object_key(event, path)})
+        if self._wake is not None:
+            self._wake.set()
+
+    def _claim(self) -> tuple[dict[str, Any] | None, float | None]:
+        now = time.time()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT id, event_id, path, object_key, attempts, size, mtime, upload_id, etags FROM upload_queue "
+                    "WHERE status = 'pending' AND not_before <= ? ORDER BY event_ts DESC, id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    wake_at = conn.execute("SELECT MIN(not_before) FROM upload_queue WHERE status = 'pending'").fetchone()[0]
+                    return None, wake_at
+                conn.execute("UPDATE upload_queue SET status = 'active' WHERE id = ?", (row[0],))
+        finally:
+            conn.close()
+        return {
+            "id": row[0],
+            "event_id": row[1],
+            "path": row[2],
+            "key": row[3],
+            "attempts": row[4],
+            "size": row[5],
+            "mtime": row[6],
+            "upload_id": row[7],
+            "etags": json.loads(row[8]),
+        }, None
+
+    def _mark(self, job_id: int, status: str, **fields: Any) -> None:
+        assignments = "".join(f", {name} = ?" for name in fields)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute(f"UPDATE upload_queue SET status = ?{assignments} WHERE id = ?", (status, *fields.values(), job_id))
+        finally:
+            conn.close()
+
+    def _record(self, event_id: str, path: Path, state: dict[str, Any]) -> None:
+        with self._metadata_lock:
+            event = STORE.get_event(event_id)
+            if event is None:
+                return
+            offload = event["metadata"].get("offload", {})
+            objects = {**offload.get("objects", {}), path.name: state}
+            states = {entry["state"] for entry in objects.values()}
+            overall = "uploaded" if states <= {"uploaded", "skipped"} else "failed" if "failed" in states else "pending"
+            STORE.update_metadata(event_id, {"offload": {"state": overall, "objects": objects}})
+
+    async def _worker_loop(self) -> None:
+        assert self._wake is not None
+        while True:
+            # Never open a new request while someone else needs the uplink.
+            await self.shaper.wait_clear()
+            self._wake.clear()
+            job, wake_at = await asyncio.to_thread(self._claim)
+            if job is None:
+                timeout = max(0.05, wake_at - time.time()) if wake_at else None
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                continue
+            path = Path(job["path"])
+            try:
+                etag, size = await self._upload(job)
+            except asyncio.CancelledError:
+                # Leave the row active; the next start resumes it.
+                raise
+            except SkipUpload as exc:
+                await asyncio.to_thread(self._mark, job["id"], "skipped", done_ts=time.time(), last_error=str(exc))
+                await asyncio.to_thread(self._record, job["event_id"], path, {"state": "skipped", "key": job["key"], "reason": str(exc)})
+                continue
+            except Exception as exc:
+                attempts = job["attempts"] + 1
+                if attempts >= self.cfg.max_attempts:
+                    LOGGER.warning("Giving up uploading %s after %s attempts: %s", path.name, attempts, exc)
+                    await asyncio.to_thread(self._mark, job["id"], "failed", attempts=attempts, done_ts=time.time(), last_error=str(exc))
+                    await asyncio.to_thread(self._record, job["event_id"], path, {"state": "failed", "key": job["key"], "error": str(exc)})
+                else:
+                    delay = min(self.cfg.retry_base_s * 2 ** (attempts - 1), self.cfg.retry_max_s)
+                    LOGGER.info("Upload of %s failed (%s); retrying in %.0fs", path.name, exc, delay)
+                    await asyncio.to_thread(
+                        self._mark, job["id"], "pending", attempts=attempts, last_error=str(exc), not_before=time.time() + delay
+                    )
+                continue
+            await asyncio.to_thread(self._mark, job["id"], "done", done_ts=time.time(), last_error=None)
+            await asyncio.to_thread(
+                self._record, job["event_id"], path, {"state": "uploaded", "key": job["key"], "etag": etag, "bytes": size, "ts": time.time()}
+            )
+
+    async def _upload(self, job: dict[str, Any]) -> tuple[str, int]:
+        assert self._s3 is not None
+        path = Path(job["path"])
+        if await asyncio.to_thread(STORE.get_event, job["event_id"]) is None:
+            raise SkipUpload("event was deleted")
+        try:
+            stat = await asyncio.to_thread(path.stat)
+        except FileNotFoundError:
+            raise SkipUpload("file was removed") from None
+        # Files go up as stored: encrypted media stays encrypted.
+        encrypted = await asyncio.to_thread(is_encrypted, path)
+        content_type = "application/octet-stream" if encrypted else CONTENT_TYPES.get(path.suffix, "application/octet-stream")
+        if stat.st_size <= self.cfg.part_size:
+            data = await asyncio.to_thread(_read_range, path, 0, stat.st_size)
+            etag = await self._s3.put_object(job["key"], self._paced(data), len(data), hashlib.sha256(data).hexdigest(), content_type)
+            return etag, stat.st_size
+
+        upload_id, etags = job["upload_id"], job["etags"]
+        if upload_id and (job["size"], job["mtime"]) != (stat.st_size, stat.st_mtime):
+            # The file was replaced (e.g. re-encoded by tiering) since the parts went up.
+            with contextlib.suppress(S3Error):
+                await self._s3.abort_multipart_upload(job["key"], upload_id)
+            upload_id, etags = None, []
+        if not upload_id:
+            upload_id = await self._s3.create_multipart_upload(job["key"], content_type)
+            etags = []
+            await asyncio.to_thread(self._mark, job["id"], "active", upload_id=upload_id, etags="[]", size=stat.st_size, mtime=stat.st_mtime)
+        try:
+            # Every part's ETag is recorded as it lands, so a restart resumes from the next part.
+            for offset in range(len(etags) * self.cfg.part_size, stat.st_size, self.cfg.part_size):
+                await self.shaper.wait_clear()
+                data = await asyncio.to_thread(_read_range, path, offset, self.cfg.part_size)
+                etags.append(await self._s3.upload_part(job["key"], upload_id, len(etags) + 1, self._paced(data), len(data), hashlib.sha256(data).hexdigest()))
+                await asyncio.to_thread(self._mark, job["id"], "active", etags=json.dumps(etags))
+            etag = await self._s3.complete_multipart_upload(job["key"], upload_id, etags)
+        except S3Error as exc:
+            if exc.code == "NoSuchUpload":
+                # Expired or aborted server side (lifecycle rules); start over next attempt.
+                await asyncio.to_thread(self._mark, job["id"], "active", upload_id=None, etags="[]")
+            raise
+        return etag, stat.st_size
+
+    async def _paced(self, data: bytes) -> AsyncIterator[bytes]:
+        view = memoryview(data)
+        for offset in range(0, len(data), CHUNK_BYTES):
+            chunk = view[offset : offset + CHUNK_BYTES]
+            await self.shaper.acquire(len(chunk))
+            yield bytes(chunk)
+
+
+def _read_range(path: Path, offset: int, size: int) -> bytes:
+    with path.open("rb") as handle:
+        handle.seek(offset)
+        return handle.read(size)
+
+
+UPLOADER = lazy("uploader", Uploader)
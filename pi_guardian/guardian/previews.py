@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
+
+import psutil
+
+from .config import CONFIG, PreviewConfig
+from .live_events import LIVE_EVENTS
+from .media_crypto import plaintext_path, sealed_output, write_media_bytes
+from .mp4 import read_video_index
+from .services import lazy_import
+from .storage import STORE
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+LOGGER = logging.getLogger(__name__)
+
+
+def lower_thread_priority(nice: int) -> None:
+    # On Linux, setpriority on a thread id only affects that thread.
+    with contextlib.suppress(Exception):
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), nice)
+
+
+def generate_previews(clip_path: Path, cfg: PreviewConfig | None = None) -> dict[str, Any]:
+    """Decode a finished clip once and emit a sprite sheet, keyframe index and short preview."""
+    cfg = cfg or CONFIG.previews
+    keyframes: list[tuple[float, int]] = []
+    try:
+        keyframes = read_video_index(clip_path).keyframes()
+    except (ValueError, KeyError, OSError) as exc:
+        LOGGER.warning("No keyframe index for %s: %s", clip_path.name, exc)
+
+    with plaintext_path(clip_path) as plain:
+        return _render_previews(clip_path, plain, keyframes, cfg)
+
+
+def _render_previews(clip_path: Path, plain: Path, keyframes: list[tuple[float, int]], cfg: PreviewConfig) -> dict[str, Any]:
+    cap = cv2.VideoCapture(str(plain))
+    if not cap.isOpened():
+        raise RuntimeError(f"Unable to open {clip_path}")
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or float(CONFIG.hardware.camera_fps)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if total <= 0 or width <= 0:
+            raise RuntimeError(f"{clip_path} has no frames")
+
+        tiles = max(1, min(cfg.sprite_tiles, total))
+        tile_frames = sorted({round(i * (total - 1) / max(1, tiles - 1)) for i in range(tiles)})
+        tile_w = cfg.tile_width
+        tile_h = max(1, round(height * tile_w / width))
+        # The buffer is promoted at confirmation time, so the interesting part is the tail.
+        step = max(1, round(fps / cfg.preview_fps))
+        preview_start = max(0, total - int(cfg.preview_seconds * fps))
+        preview_frames = set(range(preview_start, total, step))
+        preview_w = cfg.preview_width
+        preview_h = max(2, round(height * preview_w / width) // 2 * 2)
+
+        columns = min(cfg.sprite_columns, len(tile_frames))
+        rows = math.ceil(len(tile_frames) / columns)
+        sheet = np.zeros((rows * tile_h, columns * tile_w, 3), dtype=np.uint8)
+        preview_path = clip_path.with_name(f"{clip_path.stem}_preview.mp4")
+        wanted_tiles = {idx: n for n, idx in enumerate(tile_frames)}
+        with sealed_output(preview_path) as preview_target:
+            writer = cv2.VideoWriter(str(preview_target), cv2.VideoWriter_fourcc(*"mp4v"), cfg.preview_fps, (preview_w, preview_h))
+            try:
+                for idx in range(total):
+                    if not cap.grab():
+                        break
+                    if idx not in wanted_tiles and idx not in preview_frames:
+                        continue
+                    ok, frame = cap.retrieve()
+                    if not ok:
+                        continue
+                    if idx in wanted_tiles:
+                        n = wanted_tiles[idx]
+                        r, c = divmod(n, columns)
+                        sheet[r * tile_h : (r + 1) * tile_h, c * tile_w : (c + 1) * tile_w] = cv2.resize(frame, (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+                    if idx in preview_frames:
+                        writer.write(cv2.resize(frame, (preview_w, preview_h), interpolation=cv2.INTER_AREA))
+            finally:
+                writer.release()
+    finally:
+        cap.release()
+
+    sprite_path = clip_path.with_name(f"{clip_path.stem}_sprite.jpg")
+    ok, sprite = cv2.imencode(".jpg", sheet, [cv2.IMWRITE_JPEG_QUALITY, cfg.sprite_quality])
+    if not ok:
+        raise RuntimeError("Sprite encode failed")
+    write_media_bytes(sprite_path, sprite.tobytes())
+    return {
+        "keyframes": [list(k) for k in keyframes],
+        "previews": {
+            "sprite_path": str(sprite_path),
+            "sprite_columns": columns,
+            "sprite_rows": rows,
+            "tile_size": [tile_w, tile_h],
+            "tile_times": [round(idx / fps, 3) for idx in tile_frames],
+            "preview_path": str(preview_path),
+            "frame_count": total,
+            "fps": fps,
+        },
+    }
+
+
+class PreviewGenerator:
+    """Low-priority, idle-aware queue that post-processes finalized clips."""
+
+    def __init__(self, cfg: PreviewConfig | None = None):
+        self.cfg = cfg or CONFIG.previews
+        self._queue: asyncio.Queue[Tuple[str, Path]] | None = None
+        self._task: asyncio.Task[None] | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._busy: Callable[[], bool] = lambda: False
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self, busy: Optional[Callable[[], bool]] = None) -> None:
+        if not self.cfg.enabled or self._task is not None:
+            return
+        self._busy = busy or (lambda: False)
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="preview",
+            initializer=lower_thread_priority,
+            initargs=(self.cfg.nice,),
+        )
+        # Backfill clips finalized while we were not running.
+        for event in await asyncio.to_thread(STORE.list_events):
+            if "previews" not in event["metadata"]:
+                self._queue.put_nowait((event["id"], Path(event["clip_path"])))
+        self._task = asyncio.create_task(self._worker_loop(), name="preview-worker")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._queue = None
+
+    def enqueue(self, event_id: str, clip_path: Path) -> None:
+        if self._queue is None:
+            return
+        self._queue.put_nowait((event_id, Path(clip_path)))
+
+    async def _wait_for_idle(self) -> None:
+        while self._busy() or psutil.cpu_percent(interval=None) > self.cfg.idle_cpu_percent:
+            await asyncio.sleep(self.cfg.idle_poll_seconds)
+
+    async def _worker_loop(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            event_id, clip_path = await self._queue.get()
+            if not clip_path.exists():
+                continue
+            await self._wait_for_idle()
+            try:
+                result = await loop.run_in_executor(self._executor, generate_previews, clip_path, self.cfg)
+            except Exception as exc:
+                LOGGER.warning("Preview generation failed for %s: %s", event_id, exc)
+                result = {"previews": {"error": str(exc)}}
+            if not await asyncio.to_thread(STORE.update_metadata, event_id, result):
+                # The event was deleted while we worked on it; don't leave its previews behind.
+                for key in ("sprite_path", "preview_path"):
+                    if key in result["previews"]:
+                        Path(result["previews"][key]).unlink(missing_ok=True)
+                continue
+            if "error" not in result["previews"]:
+                LIVE_EVENTS.publish("previews_ready", id=event_id)
+
+
+PREVIEWS = PreviewGenerator()
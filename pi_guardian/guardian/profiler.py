@@ -0,0 +1,142 @@
+"""Sampling CPU profiler for the running process."""
+
+from __future__ import annotations
+
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any
+
+# Leaf frames that mean "this thread is blocked, not burning CPU".
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+    ("socket.py", "readinto"),
+}
+
+_LOCK = threading.Lock()
+_WORKER_SUFFIX = re.compile(r"_\d+$")
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+class _Labels:
+    """Caches a readable label per code object; building strings is most of a sample's cost."""
+
+    def __init__(self) -> None:
+        self._labels: dict[Any, str] = {}
+        self._idle: dict[Any, bool] = {}
+
+    def label(self, code: Any) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = Path(code.co_filename)
+            label = self._labels[code] = f"{code.co_name} ({path.parent.name}/{path.name}:{code.co_firstlineno})"
+        return label
+
+    def idle(self, code: Any) -> bool:
+        idle = self._idle.get(code)
+        if idle is None:
+            idle = self._idle[code] = (Path(code.co_filename).name, code.co_name) in IDLE_LEAVES
+        return idle
+
+
+def _thread_names() -> dict[int, str]:
+    # Pool workers (asyncio_3, tiering_0, ...) are folded into one name per pool.
+    return {thread.ident: _WORKER_SUFFIX.sub("", thread.name) for thread in threading.enumerate() if thread.ident is not None}
+
+
+def sample_stacks(seconds: float, hz: int) -> tuple[Counter[str], dict[str, Any]]:
+    """Collapsed stacks with sample counts, and sampler statistics."""
+    labels = _Labels()
+    stacks: Counter[str] = Counter()
+    own = threading.get_ident()
+    names = _thread_names()
+    names_refreshed = time.monotonic()
+    interval = 1.0 / hz
+    started = time.perf_counter()
+    deadline = started + seconds
+    next_sample = started
+    ticks = idle = 0
+    spent = 0.0
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        if next_sample > now:
+            time.sleep(next_sample - now)
+        tick_started = time.perf_counter()
+        if time.monotonic() - names_refreshed >= 1.0:
+            names = _thread_names()
+            names_refreshed = time.monotonic()
+        # Reading stacks from a separate thread instruments nothing, so profiled code runs at full speed.
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if labels.idle(frame.f_code):
+                idle += 1
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(labels.label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(stack))] += 1
+        ticks += 1
+        spent += time.perf_counter() - tick_started
+        # Fall behind rather than burst when a tick overran.
+        next_sample = max(next_sample + interval, time.perf_counter())
+    elapsed = time.perf_counter() - started
+    return stacks, {
+        "seconds": round(elapsed, 3),
+        "hz": hz,
+        "ticks": ticks,
+        "idle_samples": idle,
+        "overhead_pct": round(100 * spent / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def summarize(stacks: Counter[str], top: int) -> dict[str, Any]:
+    total_samples = sum(stacks.values())
+    self_counts: Counter[str] = Counter()
+    total_counts: Counter[str] = Counter()
+    threads: Counter[str] = Counter()
+    for stack, count in stacks.items():
+        thread, *frames = stack.split(";")
+        threads[thread] += count
+        if frames:
+            self_counts[frames[-1]] += count
+        for function in set(frames):
+            total_counts[function] += count
+
+    def table(counts: Counter[str]) -> list[dict[str, Any]]:
+        return [
+            {"function": function, "samples": count, "percent": round(100 * count / total_samples, 1)}
+            for function, count in counts.most_common(top)
+        ]
+
+    return {"samples": total_samples, "threads": dict(threads.most_common()), "top_self": table(self_counts), "top_total": table(total_counts)}
+
+
+def run_profile(seconds: float, hz: int, top: int) -> dict[str, Any]:
+    """Profile the whole process for ``seconds``; blocks the calling thread, one profile at a time."""
+    if not _LOCK.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        started_ts = time.time()
+        stacks, stats = sample_stacks(seconds, hz)
+    finally:
+        _LOCK.release()
+    # "thread;outer;...;leaf count" per line, the input format of flamegraph.pl and speedscope.
+    collapsed = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    return {"id": uuid.uuid4().hex[:12], "started_ts": started_ts, **stats, **summarize(stacks, top), "collapsed": collapsed}
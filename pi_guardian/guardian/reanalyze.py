@@ -0,0 +1,178 @@
+"""Re-run person detection over the stored clip archive, e.g. ``python -m guardian.reanalyze --workers 3``."""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
+
+import cv2
+
+from .config import CONFIG, DetectionConfig
+from .detection import PersonDetector
+from .media_crypto import plaintext_path
+from .storage import STORE
+
+LOGGER = logging.getLogger(__name__)
+
+_WORKER_DETECTOR: PersonDetector | None = None
+
+
+def detector_signature(cfg: DetectionConfig, sample_fps: float) -> str:
+    return f"hog-v1:stride={cfg.hog_win_stride}:pad={cfg.hog_padding}:min={cfg.min_confidence}:fps={sample_fps:g}"
+
+
+def _init_worker(cfg: DetectionConfig, nice: int) -> None:
+    global _WORKER_DETECTOR
+    if nice:
+        os.nice(nice)
+    cv2.setNumThreads(1)
+    _WORKER_DETECTOR = PersonDetector(cfg)
+
+
+def analyze_clip(event_id: str, clip_path: str, sample_fps: float) -> tuple[str, dict[str, Any]]:
+    with plaintext_path(Path(clip_path)) as plain:
+        return event_id, _analyze_file(str(plain), sample_fps)
+
+
+def _analyze_file(clip_path: str, sample_fps: float) -> dict[str, Any]:
+    assert _WORKER_DETECTOR is not None
+    cap = cv2.VideoCapture(clip_path)
+    if not cap.isOpened():
+        return {"error": "unreadable clip"}
+    fps = cap.get(cv2.CAP_PROP_FPS) or float(CONFIG.hardware.camera_fps)
+    step = max(1, round(fps / sample_fps))
+    analyzed = positive = max_people = 0
+    first_seen: float | None = None
+    last_seen: float | None = None
+    peak_boxes: list[tuple[int, int, int, int]] = []
+    idx = 0
+    try:
+        while cap.grab():
+            if idx % step == 0:
+                ok, frame = cap.retrieve()
+                if ok:
+                    detected, boxes = _WORKER_DETECTOR.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    analyzed += 1
+                    if detected:
+                        t = round(idx / fps, 3)
+                        positive += 1
+                        first_seen = t if first_seen is None else first_seen
+                        last_seen = t
+                        if len(boxes) > max_people:
+                            max_people, peak_boxes = len(boxes), boxes
+            idx += 1
+    finally:
+        cap.release()
+    return {
+        "detected": positive > 0,
+        "frames_decoded": idx,
+        "frames_analyzed": analyzed,
+        "positive_frames": positive,
+        "first_seen_s": first_seen,
+        "last_seen_s": last_seen,
+        "max_people": max_people,
+        "peak_boxes": peak_boxes,
+    }
+
+
+def _pending_events(signature: str, force: bool, label: str | None, limit: int | None) -> list[dict[str, Any]]:
+    events = []
+    for event in STORE.list_events():
+        if label and event["label"] != label:
+            continue
+        # Already analyzed with this detector signature, so an interrupted run resumes.
+        if not force and event["metadata"].get("reanalysis", {}).get("signature") == signature:
+            continue
+        if not Path(event["clip_path"]).exists():
+            continue
+        events.append(event)
+    # Oldest first so progress is stable across resumed runs.
+    events.reverse()
+    return events[:limit] if limit else events
+
+
+def run(workers: int, sample_fps: float, batch_size: int, force: bool = False, label: str | None = None, limit: int | None = None, nice: int = 10, progress_every: float = 10.0) -> dict[str, float]:
+    cfg = CONFIG.detection
+    signature = detector_signature(cfg, sample_fps)
+    events = _pending_events(signature, force, label, limit)
+    total = len(events)
+    LOGGER.info("Re-analyzing %s clips with %s workers (%s)", total, workers, signature)
+    started = time.monotonic()
+    last_report = started
+    done = frames = 0
+    batch: list[tuple[str, dict[str, Any]]] = []
+
+    def flush() -> None:
+        if batch:
+            STORE.update_metadata_many(batch)
+            batch.clear()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cfg, nice)) as pool:
+        queue = iter(events)
+        in_flight: set[Future[tuple[str, dict[str, Any]]]] = set()
+        # Bounded submission keeps memory flat for very large archives.
+        for event in queue:
+            in_flight.add(pool.submit(analyze_clip, event["id"], event["clip_path"], sample_fps))
+            if len(in_flight) >= workers * 2:
+                break
+        try:
+            while in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    try:
+                        event_id, summary = future.result()
+                    except Exception as exc:
+                        LOGGER.warning("Clip analysis failed: %s", exc)
+                        continue
+                    summary.update(signature=signature, analyzed_ts=time.time())
+                    batch.append((event_id, {"reanalysis": summary}))
+                    done += 1
+                    frames += summary.get("frames_analyzed", 0)
+                    next_event = next(queue, None)
+                    if next_event is not None:
+                        in_flight.add(pool.submit(analyze_clip, next_event["id"], next_event["clip_path"], sample_fps))
+                if len(batch) >= batch_size:
+                    flush()
+                now = time.monotonic()
+                if now - last_report >= progress_every:
+                    last_report = now
+                    rate = done / (now - started)
+                    eta = (total - done) / rate if rate else float("inf")
+                    LOGGER.info("%s/%s clips, %.2f clips/s, %.1f frames/s, ETA %.0fs", done, total, rate, frames / (now - started), eta)
+        finally:
+            # Anything already analyzed is persisted so a resumed run skips it.
+            flush()
+
+    elapsed = time.monotonic() - started
+    stats = {"clips": done, "frames": frames, "elapsed_s": elapsed, "clips_per_s": done / elapsed if elapsed else 0.0}
+    LOGGER.info("Done: %s", stats)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-run person detection over stored clips.")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--sample-fps", type=float, default=2.0, help="frames per second of video to run the detector on")
+    parser.add_argument("--batch-size", type=int, default=50, help="clip summaries per database transaction")
+    parser.add_argument("--label", help="only clips with this label")
+    parser.add_argument("--limit", type=int, help="stop after this many clips")
+    parser.add_argument("--force", action="store_true", help="ignore existing summaries for the current signature")
+    parser.add_argument("--nice", type=int, default=10, help="niceness increment for worker processes")
+    parser.add_argument("--progress-every", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--min-confidence", type=float, help="override DetectionConfig.min_confidence")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.min_confidence is not None:
+        CONFIG.detection.min_confidence = args.min_confidence
+    LOGGER.info("Detection config: %s", asdict(CONFIG.detection))
+    run(args.workers, args.sample_fps, args.batch_size, args.force, args.label, args.limit, args.nice, args.progress_every)
+
+
+if __name__ == "__main__":
+    main()
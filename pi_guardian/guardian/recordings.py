@@ -0,0 +1,91 @@
+"""Cached JSON body for ``GET /api/events/recordings``."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+try:
+    import orjson
+except Exception:  # pragma: no cover - optional
+    orjson = None  # type: ignore
+
+from .storage import STORE, EventStore
+
+# Rendered bodies kept per version: the full list plus one per ?camera= value seen.
+_MAX_LISTINGS = 16
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+@dataclass(slots=True, frozen=True)
+class RecordingsListing:
+    etag: str
+    body: bytes
+
+
+@dataclass(slots=True, frozen=True)
+class _EncodedRow:
+    camera: str
+    json: bytes
+
+
+class RecordingsListCache:
+    def __init__(self, store: EventStore | None = None):
+        self._store = store or STORE
+        self._lock = threading.Lock()
+        self._version: str | None = None
+        self._order: list[_EncodedRow] = []
+        self._rows: dict[tuple[Any, ...], _EncodedRow] = {}
+        self._listings: dict[str | None, RecordingsListing] = {}
+        self.rebuilds = 0
+
+    def get(self, camera: str | None = None) -> RecordingsListing:
+        # A poll that finds nothing new costs one single-row query (and with If-None-Match a 304).
+        version = self._store.version()
+        with self._lock:
+            if version != self._version:
+                self._refresh()
+            listing = self._listings.get(camera)
+            if listing is None:
+                if len(self._listings) >= _MAX_LISTINGS:
+                    self._listings.clear()
+                listing = self._listings[camera] = self._render(camera)
+            return listing
+
+    def _refresh(self) -> None:
+        version, rows = self._store.raw_events()
+        # Rows keep their encoded JSON keyed by the raw row, so only changed rows are re-encoded.
+        encoded = {row: self._rows.get(row) or self._encode(row) for row in rows}
+        self._rows = encoded
+        self._order = [encoded[row] for row in rows]
+        self._version = version
+        self._listings = {}
+        self.rebuilds += 1
+
+    def _render(self, camera: str | None) -> RecordingsListing:
+        rows = self._order if camera is None else [row for row in self._order if row.camera == camera]
+        body = b"[" + b",".join(row.json for row in rows) + b"]"
+        scope = hashlib.sha1(camera.encode()).hexdigest()[:8] if camera is not None else "all"
+        return RecordingsListing(etag=f'"{self._version}-{scope}"', body=body)
+
+    @staticmethod
+    def _encode(row: tuple[Any, ...]) -> _EncodedRow:
+        item = EventStore._row_to_event(row)
+        item["download_url"] = f"/api/events/recordings/{item['id']}"
+        if item["thumbnail_path"]:
+            item["thumbnail_url"] = f"/api/events/recordings/{item['id']}/thumbnail"
+        if "sprite_path" in item["metadata"].get("previews", {}):
+            item["sprite_url"] = f"/api/events/recordings/{item['id']}/sprite"
+            item["preview_url"] = f"/api/events/recordings/{item['id']}/preview"
+        return _EncodedRow(camera=item["metadata"].get("camera", "main"), json=dumps(item))
+
+
+RECORDINGS = RecordingsListCache()
@@ -0,0 +1,69 @@
+"""Local stand-in for the APNs relay so the notification outbox can be tested offline."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Form, HTTPException, UploadFile
+
+
+def build_relay(fail_rate: float = 0.0, latency_ms: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Guardian APNs relay stub")
+    stats: dict[str, float] = {"received": 0, "rejected": 0, "attachment_bytes": 0, "first_ts": 0.0, "last_ts": 0.0, "latency_sum_s": 0.0, "latency_max_s": 0.0}
+    recent: list[dict[str, object]] = []
+
+    @app.post("/apns")
+    async def apns(payload: str = Form(...), snapshot: UploadFile | None = None):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if random.random() < fail_rate:
+            stats["rejected"] += 1
+            raise HTTPException(status_code=503, detail="simulated relay failure")
+        now = time.time()
+        data = json.loads(payload)
+        size = len(await snapshot.read()) if snapshot is not None else 0
+        stats["received"] += 1
+        stats["attachment_bytes"] += size
+        stats["first_ts"] = stats["first_ts"] or now
+        stats["last_ts"] = now
+        latency = now - float(data.get("created_ts", now))
+        stats["latency_sum_s"] += latency
+        stats["latency_max_s"] = max(stats["latency_max_s"], latency)
+        recent.append({"ts": now, "alert": data.get("alert"), "tokens": len(data.get("tokens", [])), "attachment_bytes": size})
+        del recent[:-50]
+        return {"ok": True}
+
+    # Throughput and enqueue-to-receipt latency, measured from the payload's created_ts.
+    @app.get("/stats")
+    async def get_stats() -> dict[str, object]:
+        elapsed = stats["last_ts"] - stats["first_ts"]
+        return {
+            **stats,
+            "per_second": stats["received"] / elapsed if elapsed > 0 else None,
+            "latency_avg_s": stats["latency_sum_s"] / stats["received"] if stats["received"] else None,
+            "recent": recent[-10:],
+        }
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog="Point NotificationConfig.relay_url at http://HOST:PORT/apns; GET /stats reports throughput and latency.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="artificial per-request latency")
+    args = parser.parse_args()
+    uvicorn.run(build_relay(args.fail_rate, args.latency_ms), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
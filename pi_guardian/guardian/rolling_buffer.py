@@ -8,10 +8,12 @@ import threading
 import time
 import uuid
 
-import cv2
-import numpy as np
-
 from .config import CONFIG, BufferConfig
+from .media_crypto import sealed_output
+from .services import lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
 
 
 @dataclass(slots=True)
@@ -35,6 +37,10 @@ class RollingVideoBuffer:
             self._fps_hint = fps or self._fps_hint
             self.buffer.append(FrameRecord(ts=time.time(), frame=frame.copy()))
 
+    def latest(self) -> FrameRecord | None:
+        with self._lock:
+            return self.buffer[-1] if self.buffer else None
+
     def snapshot(self) -> list[FrameRecord]:
         with self._lock:
             return list(self.buffer)
@@ -47,13 +53,14 @@ class RollingVideoBuffer:
         out_path = self.cfg.media_root / f"{clip_id}_{label}.mp4"
         fourcc = cv2.VideoWriter_fourcc(*"mp4v")
         height, width, _ = frames[0].frame.shape
-        writer = cv2.VideoWriter(str(out_path), fourcc, self._fps_hint, (width, height))
-        try:
-            for rec in frames:
-                # frames stored as RGB; VideoWriter expects BGR
-                writer.write(cv2.cvtColor(rec.frame, cv2.COLOR_RGB2BGR))
-        finally:
-            writer.release()
+        with sealed_output(out_path) as target:
+            writer = cv2.VideoWriter(str(target), fourcc, self._fps_hint, (width, height))
+            try:
+                for rec in frames:
+                    # frames stored as RGB; VideoWriter expects BGR
+                    writer.write(cv2.cvtColor(rec.frame, cv2.COLOR_RGB2BGR))
+            finally:
+                writer.release()
         return out_path
 
 
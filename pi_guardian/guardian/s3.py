@@ -0,0 +1,122 @@
+"""Minimal S3 client (single PUT and multipart upload) signed with AWS Signature V4."""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import hmac
+import re
+from dataclasses import dataclass
+from typing import AsyncIterator, Mapping
+from urllib.parse import quote, unquote, urlsplit
+
+from .services import lazy_import
+
+httpx = lazy_import("httpx")
+
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class S3Error(RuntimeError):
+    def __init__(self, status: int, code: str, message: str):
+        super().__init__(f"{status} {code}: {message}")
+        self.status = status
+        self.code = code
+
+
+@dataclass(slots=True, frozen=True)
+class Credentials:
+    access_key: str
+    secret_key: str
+    region: str = "us-east-1"
+    service: str = "s3"
+
+
+def _uri_encode(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+def sign_v4(method: str, url: str, headers: Mapping[str, str], payload_hash: str, creds: Credentials, now: datetime.datetime | None = None) -> dict[str, str]:
+    """Headers to add to a request so S3 accepts it: x-amz-date, x-amz-content-sha256, Authorization."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    scope_date = now.strftime("%Y%m%d")
+    parts = urlsplit(url)
+    signed = {name.lower(): " ".join(str(value).split()) for name, value in headers.items()}
+    signed["host"] = parts.netloc
+    signed["x-amz-date"] = amz_date
+    signed["x-amz-content-sha256"] = payload_hash
+    # The URL arrives already encoded; canonical form encodes every component exactly once.
+    query = sorted(
+        (_uri_encode(unquote(key)), _uri_encode(unquote(value)))
+        for key, _, value in (pair.partition("=") for pair in parts.query.split("&") if pair)
+    )
+    canonical_headers = "".join(f"{name}:{signed[name]}\n" for name in sorted(signed))
+    signed_names = ";".join(sorted(signed))
+    canonical = "\n".join(
+        [method, _uri_encode(unquote(parts.path) or "/", safe="/-_.~"), "&".join(f"{k}={v}" for k, v in query), canonical_headers, signed_names, payload_hash]
+    )
+    scope = f"{scope_date}/{creds.region}/{creds.service}/aws4_request"
+    to_sign = "\n".join(["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+    key = f"AWS4{creds.secret_key}".encode()
+    for part in (scope_date, creds.region, creds.service, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+    return {
+        "x-amz-date": amz_date,
+        "x-amz-content-sha256": payload_hash,
+        "Authorization": f"AWS4-HMAC-SHA256 Credential={creds.access_key}/{scope}, SignedHeaders={signed_names}, Signature={signature}",
+    }
+
+
+class S3Client:
+    def __init__(self, client: httpx.AsyncClient, endpoint: str, bucket: str, creds: Credentials):
+        self._client = client
+        # Path-style URLs work with AWS and MinIO-style servers alike.
+        self._base = f"{endpoint.rstrip('/')}/{_uri_encode(bucket)}"
+        self._creds = creds
+
+    def object_url(self, key: str, query: str = "") -> str:
+        return f"{self._base}/{_uri_encode(key, safe='/-_.~')}" + (f"?{query}" if query else "")
+
+    async def _request(self, method: str, url: str, content: bytes | AsyncIterator[bytes] = b"", payload_hash: str = EMPTY_SHA256, headers: dict[str, str] | None = None) -> httpx.Response:
+        headers = dict(headers or {})
+        headers.update(sign_v4(method, url, headers, payload_hash, self._creds))
+        response = await self._client.request(method, url, content=content, headers=headers)
+        if response.status_code >= 300:
+            text = response.text
+            code = re.search(r"<Code>(.*?)</Code>", text)
+            message = re.search(r"<Message>(.*?)</Message>", text)
+            raise S3Error(response.status_code, code.group(1) if code else "HTTPError", message.group(1) if message else text[:200])
+        return response
+
+    async def put_object(self, key: str, body: AsyncIterator[bytes], size: int, sha256: str, content_type: str = "application/octet-stream") -> str:
+        response = await self._request("PUT", self.object_url(key), body, sha256, {"Content-Length": str(size), "Content-Type": content_type})
+        return response.headers.get("etag", "")
+
+    async def create_multipart_upload(self, key: str, content_type: str = "application/octet-stream") -> str:
+        response = await self._request("POST", self.object_url(key, "uploads="), headers={"Content-Type": content_type})
+        match = re.search(r"<UploadId>(.*?)</UploadId>", response.text)
+        if match is None:
+            raise S3Error(response.status_code, "MalformedResponse", "no UploadId in CreateMultipartUpload response")
+        return match.group(1)
+
+    async def upload_part(self, key: str, upload_id: str, number: int, body: AsyncIterator[bytes], size: int, sha256: str) -> str:
+        url = self.object_url(key, f"partNumber={number}&uploadId={_uri_encode(upload_id)}")
+        response = await self._request("PUT", url, body, sha256, {"Content-Length": str(size)})
+        return response.headers.get("etag", "")
+
+    async def complete_multipart_upload(self, key: str, upload_id: str, etags: list[str]) -> str:
+        parts = "".join(f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>" for number, etag in enumerate(etags, start=1))
+        body = f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode()
+        response = await self._request("POST", self.object_url(key, f"uploadId={_uri_encode(upload_id)}"), body, hashlib.sha256(body).hexdigest())
+        # S3 can answer 200 and still report a failure in the body.
+        if b"<Error>" in response.content:
+            code = re.search(r"<Code>(.*?)</Code>", response.text)
+            raise S3Error(response.status_code, code.group(1) if code else "InternalError", "CompleteMultipartUpload failed")
+        etag = re.search(r"<ETag>(.*?)</ETag>", response.text)
+        return etag.group(1).replace("&quot;", '"') if etag else ""
+
+    async def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        await self._request("DELETE", self.object_url(key, f"uploadId={_uri_encode(upload_id)}"))
@@ -0,0 +1,153 @@
+"""Local S3-compatible stand-in so clip offload can be tested offline."""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from .s3 import Credentials, sign_v4
+
+
+def _error(status: int, code: str, message: str) -> Response:
+    body = f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code><Message>{message}</Message></Error>"
+    return Response(body, status_code=status, media_type="application/xml")
+
+
+def build_s3(root: Path, access_key: str, secret_key: str, region: str = "us-east-1", fail_rate: float = 0.0, latency_ms: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Guardian S3 stub")
+    creds = Credentials(access_key, secret_key, region)
+    uploads_root = root / ".uploads"
+    stats: dict[str, float] = {"requests": 0, "rejected": 0, "objects": 0, "parts": 0, "bytes": 0, "first_ts": 0.0, "last_ts": 0.0}
+
+    def _authorized(request: Request, body: bytes) -> Response | None:
+        auth = request.headers.get("authorization", "")
+        match = re.fullmatch(r"AWS4-HMAC-SHA256 Credential=([^/]+)/[^,]+, SignedHeaders=([^,]+), Signature=[0-9a-f]+", auth)
+        if match is None or match.group(1) != access_key:
+            return _error(403, "InvalidAccessKeyId", "unknown access key")
+        payload_hash = request.headers.get("x-amz-content-sha256", "")
+        if payload_hash != "UNSIGNED-PAYLOAD" and payload_hash != hashlib.sha256(body).hexdigest():
+            return _error(400, "XAmzContentSHA256Mismatch", "payload hash does not match the body")
+        try:
+            now = datetime.strptime(request.headers.get("x-amz-date", ""), "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        except ValueError:
+            return _error(403, "AccessDenied", "missing or malformed x-amz-date")
+        if abs(now.timestamp() - time.time()) > 900:
+            return _error(403, "RequestTimeTooSkewed", "request time too far from server time")
+        # Re-sign with exactly the headers the client signed, from the URL as it arrived.
+        names = [name for name in match.group(2).split(";") if name not in ("host", "x-amz-date", "x-amz-content-sha256")]
+        query = request.scope.get("query_string", b"").decode()
+        url = f"http://{request.headers['host']}{request.scope['raw_path'].decode()}" + (f"?{query}" if query else "")
+        expected = sign_v4(request.method, url, {name: request.headers.get(name, "") for name in names}, payload_hash, creds, now)
+        if expected["Authorization"] != auth:
+            return _error(403, "SignatureDoesNotMatch", "the request signature we calculated does not match")
+        return None
+
+    @app.get("/stats")
+    async def get_stats() -> dict[str, object]:
+        elapsed = stats["last_ts"] - stats["first_ts"]
+        return {**stats, "kbps": stats["bytes"] * 8 / 1000 / elapsed if elapsed > 0 else None}
+
+    # Only the calls the uploader makes (PUT, multipart create/part/complete/abort) plus GET;
+    # objects are plain files under ``root``.
+    @app.api_route("/{bucket}/{key:path}", methods=["GET", "PUT", "POST", "DELETE"])
+    async def objects(bucket: str, key: str, request: Request) -> Response:
+        body = await request.body()
+        now = time.time()
+        stats["requests"] += 1
+        stats["first_ts"] = stats["first_ts"] or now
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        denied = _authorized(request, body)
+        if denied is not None:
+            stats["rejected"] += 1
+            return denied
+        if request.method != "GET" and random.random() < fail_rate:
+            stats["rejected"] += 1
+            return _error(503, "SlowDown", "simulated failure")
+        stats["bytes"] += len(body)
+        stats["last_ts"] = time.time()
+        params = request.query_params
+        target = root / bucket / key
+        if ".." in Path(key).parts:
+            return _error(400, "InvalidArgument", "bad key")
+        upload_id = params.get("uploadId")
+        upload_dir = uploads_root / upload_id if upload_id and re.fullmatch(r"[0-9a-f]{32}", upload_id) else None
+        if upload_id and (upload_dir is None or not upload_dir.is_dir()):
+            return _error(404, "NoSuchUpload", "the specified upload does not exist")
+
+        if request.method == "GET":
+            if not target.is_file():
+                return _error(404, "NoSuchKey", "the specified key does not exist")
+            return Response(target.read_bytes(), media_type="application/octet-stream")
+        if request.method == "PUT" and upload_dir is not None:
+            (upload_dir / f"{int(params['partNumber']):05d}").write_bytes(body)
+            stats["parts"] += 1
+            return Response(headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if request.method == "PUT":
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(body)
+            stats["objects"] += 1
+            return Response(headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if request.method == "POST" and "uploads" in params:
+            upload_id = uuid.uuid4().hex
+            (uploads_root / upload_id).mkdir(parents=True)
+            xml = f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            return Response(xml, media_type="application/xml")
+        if request.method == "POST" and upload_dir is not None:
+            listed = re.findall(r"<PartNumber>(\d+)</PartNumber><ETag>(.*?)</ETag>", body.decode())
+            digests = []
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with target.open("wb") as out:
+                for number, etag in listed:
+                    part = upload_dir / f"{int(number):05d}"
+                    data = part.read_bytes() if part.is_file() else b""
+                    if etag.strip('"') != hashlib.md5(data).hexdigest():
+                        return _error(400, "InvalidPart", f"part {number} missing or its ETag does not match")
+                    out.write(data)
+                    digests.append(hashlib.md5(data).digest())
+            shutil.rmtree(upload_dir)
+            stats["objects"] += 1
+            etag = f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+            return Response(f"<CompleteMultipartUploadResult><Key>{key}</Key><ETag>&quot;{etag}&quot;</ETag></CompleteMultipartUploadResult>", media_type="application/xml")
+        if request.method == "DELETE" and upload_dir is not None:
+            shutil.rmtree(upload_dir)
+            return Response(status_code=204)
+        if request.method == "DELETE":
+            target.unlink(missing_ok=True)
+            return Response(status_code=204)
+        return _error(400, "InvalidRequest", "unsupported operation")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog="Point GUARDIAN_S3_ENDPOINT at this server and set GUARDIAN_S3_BUCKET, GUARDIAN_S3_ACCESS_KEY and GUARDIAN_S3_SECRET_KEY to match.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--root", type=Path, default=Path("storage/s3-stub"))
+    parser.add_argument("--access-key", default="guardian")
+    parser.add_argument("--secret-key", default="guardian-secret")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of writes answered with 503 SlowDown")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="artificial per-request latency")
+    args = parser.parse_args()
+    args.root.mkdir(parents=True, exist_ok=True)
+    uvicorn.run(build_s3(args.root, args.access_key, args.secret_key, args.region, args.fail_rate, args.latency_ms), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Fixed-size history of ultrasonic readings, for tuning ``trigger_distance_cm``."""
+
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import threading
+import zlib
+from typing import Any
+
+from .config import CONFIG, SensorHistoryConfig
+from .services import lazy, lazy_import
+
+np = lazy_import("numpy")
+
+LOGGER = logging.getLogger(__name__)
+
+# magic, format version, sample count, first sample ts; then zlib-compressed columns of
+# time since the previous sample in 10 ms units (u4) and distance in tenths of a cm (u2),
+# 6 bytes a sample, so a steady, idle sensor compresses to almost nothing.
+HEADER = struct.Struct("<4sHId")
+MAGIC = b"GSNH"
+VERSION = 1
+NO_ECHO = 0xFFFF
+
+
+class SensorHistory:
+    """Preallocated ring of ``capacity`` samples; the oldest are overwritten, so memory never grows."""
+
+    def __init__(self, cfg: SensorHistoryConfig | None = None):
+        self.cfg = cfg or CONFIG.sensor_history
+        self._ts = np.zeros(self.cfg.capacity, dtype=np.float64)
+        self._cm = np.zeros(self.cfg.capacity, dtype=np.float32)
+        self._next = 0
+        self._count = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def add(self, ts: float, distance_cm: float) -> None:
+        with self._lock:
+            self._ts[self._next] = ts
+            self._cm[self._next] = distance_cm
+            self._next = (self._next + 1) % self.cfg.capacity
+            self._count = min(self._count + 1, self.cfg.capacity)
+            self._dirty = True
+
+    def _spans(self) -> list[slice]:
+        # The ring as chronological contiguous slices: the older tail, then the head.
+        if self._count < self.cfg.capacity:
+            return [slice(0, self._count)]
+        return [slice(self._next, self.cfg.capacity), slice(0, self._next)]
+
+    def window(self, since: float, until: float) -> tuple[np.ndarray, np.ndarray]:
+        """Copies of the samples in ``[since, until)``, oldest first."""
+        with self._lock:
+            ts_parts, cm_parts = [], []
+            for span in self._spans():
+                ts = self._ts[span]
+                lo, hi = np.searchsorted(ts, [since, until])
+                ts_parts.append(ts[lo:hi].copy())
+                cm_parts.append(self._cm[span][lo:hi].copy())
+        return np.concatenate(ts_parts), np.concatenate(cm_parts)
+
+    def series(self, since: float, until: float, points: int) -> dict[str, Any]:
+        """``points`` equal buckets over the window; empty buckets are omitted."""
+        # Charts get per-bucket aggregates and never move raw samples.
+        points = max(1, min(points, self.cfg.max_points))
+        bucket_s = (until - since) / points
+        ts, cm = self.window(since, until)
+        index = np.minimum(((ts - since) / bucket_s).astype(np.int64), points - 1)
+        echo = np.isfinite(cm)
+        trigger = CONFIG.hardware.trigger_distance_cm
+        count = np.bincount(index, minlength=points)
+        echoes = np.bincount(index[echo], minlength=points)
+        below = np.bincount(index[echo & (cm < trigger)], minlength=points)
+        total = np.bincount(index[echo], weights=cm[echo], minlength=points)
+        low = np.zeros(points)
+        high = np.zeros(points)
+        seen_index, seen_cm = index[echo], cm[echo]
+        if len(seen_index):
+            # Samples are in time order, so each bucket is one contiguous run.
+            starts = np.flatnonzero(np.r_[True, seen_index[1:] != seen_index[:-1]])
+            low[seen_index[starts]] = np.minimum.reduceat(seen_cm, starts)
+            high[seen_index[starts]] = np.maximum.reduceat(seen_cm, starts)
+        buckets = []
+        for bucket in np.flatnonzero(count):
+            seen = int(echoes[bucket])
+            buckets.append(
+                {
+                    "ts": round(since + bucket * bucket_s, 3),
+                    "count": int(count[bucket]),
+                    "min": round(float(low[bucket]), 1) if seen else None,
+                    "max": round(float(high[bucket]), 1) if seen else None,
+                    "mean": round(float(total[bucket] / seen), 1) if seen else None,
+                    "below_trigger": int(below[bucket]),
+                    "no_echo": int(count[bucket]) - seen,
+                }
+            )
+        return {
+            "bucket_s": bucket_s,
+            "samples": len(ts),
+            "trigger_distance_cm": trigger,
+            "confirm_distance_cm": CONFIG.hardware.confirm_distance_cm,
+            "buckets": buckets,
+        }
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            ts = np.concatenate([self._ts[span] for span in self._spans()])
+            cm = np.concatenate([self._cm[span] for span in self._spans()])
+            self._dirty = False
+        first = float(ts[0]) if len(ts) else 0.0
+        steps = np.clip(np.diff(np.round((ts - first) * 100), prepend=0.0), 0, 0xFFFFFFFF).astype("<u4")
+        tenths = np.where(np.isfinite(cm), np.clip(np.round(cm * 10), 0, NO_ECHO - 1), NO_ECHO).astype("<u2")
+        body = zlib.compress(steps.tobytes() + tenths.tobytes(), 6)
+        tmp = self.cfg.path.with_suffix(".tmp")
+        self.cfg.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_bytes(HEADER.pack(MAGIC, VERSION, len(ts), first) + body)
+        os.replace(tmp, self.cfg.path)
+
+    def _load(self) -> None:
+        try:
+            raw = self.cfg.path.read_bytes()
+            magic, version, count, first = HEADER.unpack_from(raw)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"unrecognized header {magic!r} v{version}")
+            data = zlib.decompress(raw[HEADER.size :])
+            steps = np.frombuffer(data, dtype="<u4", count=count)
+            tenths = np.frombuffer(data, dtype="<u2", count=count, offset=count * 4)
+        except FileNotFoundError:
+            return
+        except (ValueError, struct.error, zlib.error) as exc:
+            LOGGER.warning("Ignoring unreadable sensor history %s: %s", self.cfg.path, exc)
+            return
+        keep = min(count, self.cfg.capacity)
+        self._ts[:keep] = (first + np.cumsum(steps, dtype=np.float64) / 100)[count - keep :]
+        self._cm[:keep] = np.where(tenths[count - keep :] == NO_ECHO, np.inf, tenths[count - keep :] / 10)
+        self._count = keep
+        self._next = keep % self.cfg.capacity
+
+
+SENSOR_HISTORY = lazy("sensor_history", SensorHistory)
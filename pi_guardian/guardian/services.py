@@ -0,0 +1,110 @@
+"""Lazily constructed singletons and deferred heavy imports."""
+
+from __future__ import annotations
+
+import importlib.util
+import logging
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any, Callable, Iterator
+
+LOGGER = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class LazyService:
+    """Stand-in for a singleton that builds the real object on first use and forwards to it."""
+
+    __slots__ = ("_name", "_factory", "_instance", "_lock", "_build_ms")
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", _UNSET)
+        object.__setattr__(self, "_lock", threading.RLock())
+        object.__setattr__(self, "_build_ms", None)
+
+    def _resolve(self) -> Any:
+        instance = self._instance
+        if instance is _UNSET:
+            with self._lock:
+                if self._instance is _UNSET:
+                    started = time.perf_counter()
+                    built = self._factory()
+                    object.__setattr__(self, "_build_ms", (time.perf_counter() - started) * 1000)
+                    object.__setattr__(self, "_instance", built)
+                    LOGGER.debug("Built %s in %.1f ms", self._name, self._build_ms)
+                instance = self._instance
+        return instance
+
+    @property
+    def _built(self) -> bool:
+        return self._instance is not _UNSET
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._resolve(), item)
+
+    def __setattr__(self, item: str, value: Any) -> None:
+        setattr(self._resolve(), item, value)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._resolve())
+
+    def __len__(self) -> int:
+        return len(self._resolve())
+
+    def __repr__(self) -> str:
+        return f"<lazy {self._name}: {self._instance!r}>" if self._built else f"<lazy {self._name}: not built>"
+
+
+class ServiceRegistry:
+    def __init__(self) -> None:
+        self._services: dict[str, LazyService] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]) -> LazyService:
+        if name in self._services:
+            raise ValueError(f"Service {name!r} is already registered")
+        service = LazyService(name, factory)
+        self._services[name] = service
+        return service
+
+    def get(self, name: str) -> Any:
+        return self._services[name]._resolve()
+
+    def is_built(self, name: str) -> bool:
+        return self._services[name]._built
+
+    def status(self) -> dict[str, float | None]:
+        """Build time in ms per service, ``None`` for services not built yet."""
+        return {name: (round(service._build_ms, 1) if service._built else None) for name, service in self._services.items()}
+
+
+SERVICES = ServiceRegistry()
+
+
+def lazy(name: str, factory: Callable[[], Any]) -> Any:
+    """Register ``factory`` under ``name`` and return a proxy that builds it on first use."""
+    # Importing a module (a CLI tool, a test, an API worker) then no longer opens SQLite,
+    # loads the HOG model or grabs the camera.
+    return SERVICES.register(name, factory)
+
+
+def lazy_import(name: str) -> ModuleType | None:
+    """Return ``name`` as a module that executes on first attribute access, or None if absent."""
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None or spec.loader is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
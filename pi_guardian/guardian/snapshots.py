@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from .config import CONFIG, SnapshotConfig
+from .frame_bus import FRAME_READER
+from .media_crypto import write_media_bytes
+from .rolling_buffer import BUFFER, FrameRecord
+from .services import lazy, lazy_import
+
+cv2 = lazy_import("cv2")
+np = lazy_import("numpy")
+
+
+def encode_jpeg(frame: np.ndarray, quality: int, width: int | None = None) -> bytes:
+    """Encode an RGB frame as JPEG, optionally downscaled to ``width`` pixels wide."""
+    if width and frame.shape[1] > width:
+        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    # frames stored as RGB; imencode expects BGR
+    ok, buf = cv2.imencode(".jpg", cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("JPEG encode failed")
+    return buf.tobytes()
+
+
+def write_thumbnail(frame: np.ndarray, path: Path, cfg: SnapshotConfig | None = None) -> Path:
+    cfg = cfg or CONFIG.snapshots
+    write_media_bytes(path, encode_jpeg(frame, cfg.thumbnail_quality, cfg.thumbnail_width))
+    return path
+
+
+def file_etag(path: Path) -> str:
+    stat = path.stat()
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+@dataclass(slots=True)
+class Snapshot:
+    jpeg: bytes
+    etag: str
+    frame_ts: float
+
+
+class SnapshotCache:
+    """Encodes the newest buffered frame at most once per interval and shares it."""
+
+    def __init__(self, cfg: SnapshotConfig | None = None, source: Callable[[], FrameRecord | None] | None = None):
+        self.cfg = cfg or CONFIG.snapshots
+        self._source = source or (FRAME_READER.latest if CONFIG.process.split else BUFFER.latest)
+        self._lock = asyncio.Lock()
+        self._current: Snapshot | None = None
+        self._checked_at = 0.0
+
+    def _fresh(self) -> bool:
+        return self._current is not None and time.monotonic() - self._checked_at < self.cfg.min_interval_seconds
+
+    async def latest(self) -> Snapshot | None:
+        if self._fresh():
+            return self._current
+        async with self._lock:
+            # Another caller may have refreshed while we waited on the lock.
+            if self._fresh():
+                return self._current
+            record = self._source()
+            self._checked_at = time.monotonic()
+            if record is None:
+                return self._current
+            if self._current is not None and self._current.frame_ts == record.ts:
+                return self._current
+            jpeg = await asyncio.to_thread(encode_jpeg, record.frame, self.cfg.jpeg_quality)
+            self._current = Snapshot(jpeg=jpeg, etag=f'"{int(record.ts * 1000):x}"', frame_ts=record.ts)
+            return self._current
+
+
+SNAPSHOTS = lazy("snapshots", SnapshotCache)
@@ -0,0 +1,122 @@
+"""Measure import cost per module and cold start to the first ``/api/health`` response."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+MODULES = [
+    "guardian.config",
+    "guardian.storage",
+    "guardian.zip_export",
+    "guardian.cameras",
+    "guardian.event_engine",
+    "guardian.api",
+    "guardian.webrtc",
+]
+# Libraries reported when an import actually executed them; with lazy subsystems,
+# importing guardian.api should load none of them.
+HEAVY = ["numpy", "cv2", "httpx", "av", "aiortc", "picamera2", "gpiozero"]
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+# A lazily imported module is a _LazyModule until its first attribute access.
+loaded = [name for name in {heavy!r} if name in sys.modules and type(sys.modules[name]).__name__ == "module"]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def _env() -> dict[str, str]:
+    env = dict(os.environ)
+    package_root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    return env
+
+
+# Every sample runs in a fresh interpreter so nothing is served from a warm sys.modules.
+def measure_import(module: str, runs: int, workdir: Path) -> dict[str, object]:
+    samples = []
+    loaded: list[str] = []
+    for _ in range(runs):
+        code = _IMPORT_PROBE.format(module=module, heavy=HEAVY)
+        result = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=_env(), capture_output=True, text=True)
+        if result.returncode != 0:
+            return {"module": module, "error": result.stderr.strip().splitlines()[-1:]}
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(probe["seconds"])
+        loaded = probe["loaded"]
+    return {"module": module, "median_ms": round(statistics.median(samples) * 1000, 1), "loaded": loaded}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_cold_start(runs: int, workdir: Path, timeout: float) -> dict[str, object]:
+    samples = []
+    for _ in range(runs):
+        port = _free_port()
+        command = [sys.executable, "-m", "uvicorn", "guardian.api:build_app", "--factory", "--port", str(port), "--log-level", "warning"]
+        started = time.perf_counter()
+        proc = subprocess.Popen(command, cwd=workdir, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if proc.poll() is not None:
+                    return {"error": f"uvicorn exited with {proc.returncode}"}
+                if time.perf_counter() - started > timeout:
+                    return {"error": f"no /api/health response within {timeout}s"}
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1) as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    time.sleep(0.01)
+            samples.append(time.perf_counter() - started)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return {"median_ms": round(statistics.median(samples) * 1000, 1), "min_ms": round(min(samples) * 1000, 1), "runs": runs}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark module import time and cold start to /api/health.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", action="append", help="module to time (repeatable); defaults to the main subsystems")
+    parser.add_argument("--skip-cold-start", action="store_true")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for /api/health")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix="guardian-bench-") as scratch:
+        workdir = Path(scratch)
+        for module in args.module or MODULES:
+            result = measure_import(module, args.runs, workdir)
+            if "error" in result:
+                print(f"{module:<24} failed: {result['error']}")
+            else:
+                print(f"{module:<24} {result['median_ms']:>8.1f} ms  loaded: {', '.join(result['loaded']) or '-'}")
+        if not args.skip_cold_start:
+            result = measure_cold_start(args.runs, workdir, args.timeout)
+            if "error" in result:
+                print(f"cold start               failed: {result['error']}")
+            else:
+                print(f"cold start to /api/health {result['median_ms']:>7.1f} ms  (min {result['min_ms']} ms over {result['runs']} runs)")
+
+
+if __name__ == "__main__":
+    main()
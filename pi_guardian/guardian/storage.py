@@ -7,6 +7,7 @@ from pathlib import Path
 from typing import Any
 
 from .config import CONFIG, BufferConfig
+from .services import lazy
 
 
 SCHEMA = """
@@ -19,6 +20,25 @@ CREATE TABLE IF NOT EXISTS events (
     duration REAL,
     metadata TEXT
 );
+CREATE TABLE IF NOT EXISTS file_deletions (
+    path TEXT PRIMARY KEY,
+    queued_ts REAL NOT NULL
+);
+-- Bumped by triggers on every change to events, from any process, so readers can
+-- cache derived views and revalidate with a single-row lookup. The token tells a
+-- recreated database apart from the old one.
+CREATE TABLE IF NOT EXISTS events_version (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL,
+    token TEXT NOT NULL
+);
+INSERT OR IGNORE INTO events_version (id, version, token) VALUES (0, 0, lower(hex(randomblob(8))));
+CREATE TRIGGER IF NOT EXISTS events_version_insert AFTER INSERT ON events
+BEGIN UPDATE events_version SET version = version + 1 WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS events_version_update AFTER UPDATE ON events
+BEGIN UPDATE events_version SET version = version + 1 WHERE id = 0; END;
+CREATE TRIGGER IF NOT EXISTS events_version_delete AFTER DELETE ON events
+BEGIN UPDATE events_version SET version = version + 1 WHERE id = 0; END;
 """
 
 
@@ -29,6 +49,7 @@ class EventStore:
         self._ensure_db()
 
     def _ensure_db(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
         conn = sqlite3.connect(self.db_path)
         try:
             conn.executescript(SCHEMA)
@@ -58,22 +79,170 @@ class EventStore:
         conn = sqlite3.connect(self.db_path)
         try:
             rows = conn.execute("SELECT id, created_ts, label, clip_path, thumbnail_path, duration, metadata FROM events ORDER BY created_ts DESC").fetchall()
-            events = []
-            for row in rows:
-                events.append(
-                    {
-                        "id": row[0],
-                        "created_ts": row[1],
-                        "label": row[2],
-                        "clip_path": row[3],
-                        "thumbnail_path": row[4],
-                        "duration": row[5],
-                        "metadata": json.loads(row[6]) if row[6] else {},
-                    }
-                )
-            return events
+            return [self._row_to_event(row) for row in rows]
+        finally:
+            conn.close()
+
+    def version(self) -> str:
+        """Opaque stamp that changes whenever the events table does."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            token, version = conn.execute("SELECT token, version FROM events_version WHERE id = 0").fetchone()
+            return f"{token}-{version}"
+        finally:
+            conn.close()
+
+    def raw_events(self) -> tuple[str, list[tuple[Any, ...]]]:
+        """The version stamp and all rows, newest first, with metadata left as stored JSON text."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            # One read transaction, so the stamp matches the rows.
+            conn.execute("BEGIN")
+            token, version = conn.execute("SELECT token, version FROM events_version WHERE id = 0").fetchone()
+            rows = conn.execute("SELECT id, created_ts, label, clip_path, thumbnail_path, duration, metadata FROM events ORDER BY created_ts DESC").fetchall()
+            conn.commit()
+            return f"{token}-{version}", rows
         finally:
             conn.close()
 
+    def get_event(self, event_id: str) -> dict[str, Any] | None:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute(
+                "SELECT id, created_ts, label, clip_path, thumbnail_path, duration, metadata FROM events WHERE id = ?",
+                (event_id,),
+            ).fetchone()
+            return self._row_to_event(row) if row else None
+        finally:
+            conn.close()
+
+    def find_events(self, ids: list[str] | None = None, since: float | None = None, until: float | None = None, label: str | None = None) -> list[dict[str, Any]]:
+        """Events matching every given filter, oldest first."""
+        where, params = self._filter_clause(ids, since, until, label)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                f"SELECT id, created_ts, label, clip_path, thumbnail_path, duration, metadata FROM events{where} ORDER BY created_ts, id",
+                params,
+            ).fetchall()
+            return [self._row_to_event(row) for row in rows]
+        finally:
+            conn.close()
+
+    def delete_events(self, ids: list[str] | None = None, since: float | None = None, until: float | None = None, label: str | None = None) -> tuple[list[str], list[str]]:
+        """Delete matching rows and queue their files for removal, in one transaction.
+
+        Returns the deleted ids and the queued paths. Files are only recorded in ``file_deletions``; the
+        reaper unlinks them later so the caller never waits on the filesystem.
+        """
+        where, params = self._filter_clause(ids, since, until, label)
+        if not where:
+            raise ValueError("Refusing to delete without a filter")
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute(f"SELECT id, clip_path, thumbnail_path, metadata FROM events{where}", params).fetchall()
+                now = time.time()
+                paths: list[tuple[str, float]] = []
+                for _, clip_path, thumbnail_path, metadata in rows:
+                    previews = json.loads(metadata).get("previews", {}) if metadata else {}
+                    for path in (clip_path, thumbnail_path, previews.get("sprite_path"), previews.get("preview_path")):
+                        if path:
+                            paths.append((path, now))
+                conn.executemany("INSERT OR IGNORE INTO file_deletions (path, queued_ts) VALUES (?, ?)", paths)
+                conn.execute(f"DELETE FROM events{where}", params)
+            return [row[0] for row in rows], [path for path, _ in paths]
+        finally:
+            conn.close()
+
+    def discard_files(self, event_id: str, paths: list[str], updates: dict[str, Any]) -> bool:
+        """Queue some of an event's files for removal and merge ``updates`` into its metadata, atomically."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT metadata FROM events WHERE id = ?", (event_id,)).fetchone()
+                if row is None:
+                    return False
+                metadata = json.loads(row[0]) if row[0] else {}
+                metadata.update(updates)
+                now = time.time()
+                conn.executemany("INSERT OR IGNORE INTO file_deletions (path, queued_ts) VALUES (?, ?)", [(path, now) for path in paths])
+                conn.execute("UPDATE events SET metadata = ? WHERE id = ?", (json.dumps(metadata), event_id))
+            return True
+        finally:
+            conn.close()
+
+    def pending_deletions(self, limit: int) -> list[str]:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return [row[0] for row in conn.execute("SELECT path FROM file_deletions ORDER BY queued_ts LIMIT ?", (limit,))]
+        finally:
+            conn.close()
+
+    def complete_deletions(self, paths: list[str]) -> None:
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany("DELETE FROM file_deletions WHERE path = ?", [(path,) for path in paths])
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _filter_clause(ids: list[str] | None, since: float | None, until: float | None, label: str | None) -> tuple[str, list[Any]]:
+        clauses: list[str] = []
+        params: list[Any] = []
+        if ids is not None:
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})" if ids else "0")
+            params.extend(ids)
+        if since is not None:
+            clauses.append("created_ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_ts < ?")
+            params.append(until)
+        if label is not None:
+            clauses.append("label = ?")
+            params.append(label)
+        return (f" WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def update_metadata(self, event_id: str, updates: dict[str, Any]) -> bool:
+        return self.update_metadata_many([(event_id, updates)]) == 1
+
+    def update_metadata_many(self, updates: list[tuple[str, dict[str, Any]]]) -> int:
+        """Merge metadata patches for several events in a single transaction."""
+        conn = sqlite3.connect(self.db_path)
+        updated = 0
+        try:
+            with conn:
+                # Take the write lock before reading: previews, tiering, offload and reanalysis
+                # patch metadata from other threads and processes, and a deferred transaction
+                # would let one of them write back a stale copy over another's keys.
+                conn.execute("BEGIN IMMEDIATE")
+                for event_id, patch in updates:
+                    row = conn.execute("SELECT metadata FROM events WHERE id = ?", (event_id,)).fetchone()
+                    if row is None:
+                        continue
+                    metadata = json.loads(row[0]) if row[0] else {}
+                    metadata.update(patch)
+                    conn.execute("UPDATE events SET metadata = ? WHERE id = ?", (json.dumps(metadata), event_id))
+                    updated += 1
+            return updated
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_event(row: tuple[Any, ...]) -> dict[str, Any]:
+        return {
+            "id": row[0],
+            "created_ts": row[1],
+            "label": row[2],
+            "clip_path": row[3],
+            "thumbnail_path": row[4],
+            "duration": row[5],
+            "metadata": json.loads(row[6]) if row[6] else {},
+        }
+
 
-STORE = EventStore()
+STORE = lazy("store", EventStore)
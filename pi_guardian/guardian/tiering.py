@@ -0,0 +1,242 @@
+"""Age-based re-compression of stored clips down the ``TieringConfig.tiers`` ladder."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import psutil
+
+from .config import CONFIG, TieringConfig
+from .file_reaper import FILE_REAPER
+from .media_crypto import plaintext_path, sealed_output
+from .mp4 import read_video_index
+from .previews import lower_thread_priority
+from .storage import STORE
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds between checks of the encoder's CPU use.
+_BUDGET_POLL_S = 0.25
+
+
+def target_tier(age_s: float, cfg: TieringConfig) -> int:
+    """Rung a clip of this age belongs on: -1 is the original, ``len(cfg.tiers)`` thumbnail only."""
+    age_days = age_s / 86400
+    if cfg.thumbnail_only_days is not None and age_days >= cfg.thumbnail_only_days:
+        return len(cfg.tiers)
+    level = -1
+    for index, (min_days, *_) in enumerate(cfg.tiers):
+        if age_days >= min_days:
+            level = index
+    return level
+
+
+def current_tier(event: dict[str, Any]) -> int:
+    return event["metadata"].get("tier", {}).get("level", -1)
+
+
+def encode_command(src: Path, dst: Path, tier: tuple[float, int, float, int], cfg: TieringConfig) -> list[str]:
+    _, max_width, fps, crf = tier
+    # Two-second GOPs keep seeking cheap; below 1 fps every frame is a keyframe.
+    gop = max(1, round(fps * 2))
+    return [
+        cfg.ffmpeg_path,
+        "-hide_banner",
+        "-loglevel", "error",
+        "-nostdin",
+        "-y",
+        "-i", str(src),
+        "-an",
+        "-vf", f"fps={fps:g},scale='min({max_width},iw)':-2",
+        "-c:v", cfg.encoder,
+        "-preset", "veryfast",
+        "-crf", str(crf),
+        "-g", str(gop),
+        "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        str(dst),
+    ]
+
+
+def run_budgeted(cmd: list[str], cfg: TieringConfig, stop: threading.Event, busy: Callable[[], bool]) -> None:
+    """Run ``cmd`` at ``cfg.nice``, suspending it while over budget or while ``busy()``; raise on failure."""
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    ps = psutil.Process(proc.pid)
+    with contextlib.suppress(psutil.Error):
+        ps.nice(cfg.nice)
+    started = time.monotonic()
+    try:
+        while proc.poll() is None:
+            if stop.wait(_BUDGET_POLL_S):
+                raise RuntimeError("stopped")
+            try:
+                cpu = ps.cpu_times()
+            except psutil.Error:
+                break
+            # Seconds to sit out until CPU used is back within budget of wall time elapsed.
+            owed = (cpu.user + cpu.system) / cfg.cpu_budget - (time.monotonic() - started) if cfg.cpu_budget > 0 else 0.0
+            if owed <= 0 and not busy():
+                continue
+            ps.suspend()
+            try:
+                pause_until = time.monotonic() + owed
+                while not stop.is_set() and (time.monotonic() < pause_until or busy()):
+                    stop.wait(_BUDGET_POLL_S)
+            finally:
+                with contextlib.suppress(psutil.Error):
+                    ps.resume()
+        _, stderr = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(stderr.decode(errors="replace").strip()[-300:] or f"ffmpeg exited with {proc.returncode}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+
+def recompress_clip(clip_path: Path, tier: tuple[float, int, float, int], cfg: TieringConfig, stop: threading.Event, busy: Callable[[], bool]) -> Optional[Path]:
+    """Encode ``clip_path`` at ``tier`` next to it; None when that would not save space."""
+    staged = clip_path.with_name(f"{clip_path.stem}.tier{clip_path.suffix}")
+    try:
+        with plaintext_path(clip_path) as plain, sealed_output(staged) as target:
+            run_budgeted(encode_command(plain, target, tier, cfg), cfg, stop, busy)
+        if staged.stat().st_size >= clip_path.stat().st_size:
+            staged.unlink()
+            return None
+        return staged
+    except BaseException:
+        staged.unlink(missing_ok=True)
+        raise
+
+
+class ClipTiering:
+    """Periodically moves aged clips down the tier ladder in a low-priority worker."""
+
+    def __init__(self, cfg: TieringConfig | None = None):
+        self.cfg = cfg or CONFIG.tiering
+        self._task: asyncio.Task[None] | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._stop = threading.Event()
+        self._busy: Callable[[], bool] = lambda: False
+        self._can_encode = shutil.which(self.cfg.ffmpeg_path) is not None
+        self.bytes_saved = 0
+
+    async def start(self, busy: Optional[Callable[[], bool]] = None) -> None:
+        if not self.cfg.enabled or self._task is not None:
+            return
+        if not self._can_encode:
+            LOGGER.warning("ffmpeg binary not found; clips will only be reduced to thumbnails")
+        self._busy = busy or (lambda: False)
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix="tiering",
+            initializer=lower_thread_priority,
+            initargs=(self.cfg.nice,),
+        )
+        self._task = asyncio.create_task(self._scan_loop(), name="clip-tiering")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def candidates(self, now: float | None = None) -> list[tuple[dict[str, Any], int]]:
+        """(event, target level) for clips below their rung, oldest first."""
+        now = time.time() if now is None else now
+        ages = [tier[0] for tier in self.cfg.tiers]
+        if self.cfg.thumbnail_only_days is not None:
+            ages.append(self.cfg.thumbnail_only_days)
+        if not ages:
+            return []
+        pending = []
+        for event in STORE.find_events(until=now - min(ages) * 86400):
+            level = target_tier(now - event["created_ts"], self.cfg)
+            tier = event["metadata"].get("tier", {})
+            if level <= current_tier(event) or tier.get("failed_level") == level:
+                continue
+            if level < len(self.cfg.tiers) and not self._can_encode:
+                continue
+            pending.append((event, level))
+        return pending
+
+    async def _wait_for_idle(self) -> None:
+        # busy() is true while any camera is armed.
+        while self._busy() or psutil.cpu_percent(interval=None) > self.cfg.idle_cpu_percent:
+            await asyncio.sleep(self.cfg.idle_poll_seconds)
+
+    async def _scan_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                pending = await asyncio.to_thread(self.candidates)
+            except Exception as exc:
+                LOGGER.warning("Listing clips for tiering failed: %s", exc)
+                pending = []
+            for event, level in pending:
+                await self._wait_for_idle()
+                try:
+                    await loop.run_in_executor(self._executor, self.apply, event, level)
+                except Exception as exc:
+                    LOGGER.warning("Re-tiering %s failed: %s", event["id"], exc)
+                    await asyncio.to_thread(STORE.update_metadata, event["id"], {"tier": {**event["metadata"].get("tier", {}), "failed_level": level, "error": str(exc)}})
+            await asyncio.sleep(self.cfg.scan_interval_s)
+
+    def apply(self, event: dict[str, Any], level: int) -> None:
+        """Move one event's media to ``level``, updating the store."""
+        clip_path = Path(event["clip_path"])
+        previews = event["metadata"].get("previews", {})
+        before = clip_path.stat().st_size if clip_path.exists() else 0
+        if level >= len(self.cfg.tiers):
+            # The sprite sheet and thumbnail stay; the clip and its moving preview go.
+            paths = [str(clip_path)] + ([previews["preview_path"]] if previews.get("preview_path") else [])
+            tier = {"level": level, "name": "thumbnail", "bytes": 0, "original_bytes": self._original_bytes(event, before), "ts": time.time()}
+            if STORE.discard_files(event["id"], paths, {"tier": tier, "keyframes": []}):
+                FILE_REAPER.kick()
+                self.bytes_saved += before
+                LOGGER.info("Reduced %s to its thumbnail (%d bytes freed)", event["id"], before)
+            return
+        if not clip_path.exists():
+            return
+        staged = recompress_clip(clip_path, self.cfg.tiers[level], self.cfg, self._stop, self._busy)
+        tier = {"level": level, "name": f"tier{level}", "original_bytes": self._original_bytes(event, before), "ts": time.time()}
+        if staged is None:
+            # Already smaller than this rung would make it; just record that it was considered.
+            STORE.update_metadata(event["id"], {"tier": {**tier, "bytes": before}})
+            return
+        after = staged.stat().st_size
+        keyframes: list[tuple[float, int]] = []
+        with contextlib.suppress(ValueError, KeyError, OSError):
+            keyframes = read_video_index(staged).keyframes()
+        # A rename, so a download that already has the clip open keeps reading the old bytes.
+        os.replace(staged, clip_path)
+        if not STORE.update_metadata(event["id"], {"tier": {**tier, "bytes": after}, "keyframes": [list(k) for k in keyframes]}):
+            # Deleted while we encoded; the reaper may already have removed the original.
+            clip_path.unlink(missing_ok=True)
+            return
+        self.bytes_saved += before - after
+        LOGGER.info("Re-encoded %s at tier %d: %d -> %d bytes", event["id"], level, before, after)
+
+    @staticmethod
+    def _original_bytes(event: dict[str, Any], current: int) -> int:
+        return event["metadata"].get("tier", {}).get("original_bytes", current)
+
+
+TIERING = ClipTiering()
@@ -0,0 +1,331 @@
+"""Per-frame detection history and time-range activity queries."""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any
+
+from .config import CONFIG, DetectionConfig
+from .services import lazy, lazy_import
+
+np = lazy_import("numpy")
+
+LOGGER = logging.getLogger(__name__)
+
+# detection_tracks: one row per camera per flush with every box seen in that span, as
+# compressed COLUMNS; this is what replays a clip's detections.
+# detection_activity(_hourly): one row per camera per minute (per hour) with frame and box
+# counts and a heatmap_grid of box-centre counts (u2).
+TRACK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS detection_tracks (
+    camera TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    boxes INTEGER NOT NULL,
+    frame_width INTEGER NOT NULL,
+    frame_height INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS detection_tracks_camera_time ON detection_tracks (camera, start_ts);
+CREATE INDEX IF NOT EXISTS detection_tracks_time ON detection_tracks (start_ts);
+CREATE TABLE IF NOT EXISTS detection_activity (
+    camera TEXT NOT NULL,
+    bucket_ts INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    people_frames INTEGER NOT NULL,
+    boxes INTEGER NOT NULL,
+    max_people INTEGER NOT NULL,
+    heat BLOB,
+    PRIMARY KEY (camera, bucket_ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS detection_activity_time ON detection_activity (bucket_ts);
+CREATE TABLE IF NOT EXISTS detection_activity_hourly (
+    camera TEXT NOT NULL,
+    bucket_ts INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    people_frames INTEGER NOT NULL,
+    boxes INTEGER NOT NULL,
+    max_people INTEGER NOT NULL,
+    heat BLOB,
+    PRIMARY KEY (camera, bucket_ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS detection_activity_hourly_time ON detection_activity_hourly (bucket_ts);
+"""
+
+# Column order inside a chunk; every column holds one value per box (14 bytes a box before zlib).
+COLUMNS = (("dt", "<f4"), ("x", "<u2"), ("y", "<u2"), ("w", "<u2"), ("h", "<u2"), ("score", "<f2"))
+MINUTE = 60
+HOUR = 3600
+PRUNE_INTERVAL_S = 3600.0
+
+
+@dataclass(slots=True)
+class _Minute:
+    frames: int = 0
+    people_frames: int = 0
+    boxes: int = 0
+    max_people: int = 0
+
+
+@dataclass(slots=True)
+class _Pending:
+    frame_size: tuple[int, int]
+    start_ts: float
+    end_ts: float = 0.0
+    ts: list[float] = field(default_factory=list)
+    boxes: list[tuple[int, int, int, int]] = field(default_factory=list)
+    scores: list[float] = field(default_factory=list)
+    minutes: dict[int, _Minute] = field(default_factory=dict)
+
+
+def pack_boxes(start_ts: float, ts: list[float], boxes: list[tuple[int, int, int, int]], scores: list[float]) -> bytes:
+    xywh = np.asarray(boxes, dtype=np.int64).reshape(-1, 4).clip(0, 0xFFFF)
+    columns = [np.asarray(ts, dtype=np.float64) - start_ts, *xywh.T, np.asarray(scores)]
+    return zlib.compress(b"".join(np.asarray(column, dtype=dtype).tobytes() for column, (_, dtype) in zip(columns, COLUMNS)), 6)
+
+
+def unpack_boxes(data: bytes, count: int) -> dict[str, Any]:
+    raw = zlib.decompress(data)
+    out: dict[str, Any] = {}
+    offset = 0
+    for name, dtype in COLUMNS:
+        column = np.frombuffer(raw, dtype=dtype, count=count, offset=offset)
+        out[name] = column
+        offset += column.nbytes
+    return out
+
+
+class DetectionTracks:
+    """Buffers detector output per camera and persists it in compact form; answers range queries."""
+
+    def __init__(self, cfg: DetectionConfig | None = None):
+        self.cfg = cfg or CONFIG.detection
+        self.db_path = CONFIG.buffer.metadata_db
+        self._lock = threading.Lock()
+        self._pending: dict[str, _Pending] = {}
+        self._last_prune = 0.0
+        self._ensure_db()
+
+    def _ensure_db(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executescript(TRACK_SCHEMA)
+        finally:
+            conn.close()
+
+    def record(self, camera_id: str, ts: float, boxes: list[tuple[int, int, int, int]], scores: list[float], frame_size: tuple[int, int]) -> None:
+        """Note one analyzed frame; ``boxes`` may be empty. Cheap enough for the detection loop."""
+        flush_first = None
+        with self._lock:
+            pending = self._pending.get(camera_id)
+            if pending is not None and pending.frame_size != frame_size and pending.boxes:
+                # Box coordinates only make sense against one frame size per chunk.
+                flush_first = self._pending.pop(camera_id)
+                pending = None
+            if pending is None:
+                pending = self._pending[camera_id] = _Pending(frame_size=frame_size, start_ts=ts)
+            pending.end_ts = ts
+            minute = pending.minutes.setdefault(int(ts // MINUTE) * MINUTE, _Minute())
+            minute.frames += 1
+            if boxes:
+                minute.people_frames += 1
+                minute.boxes += len(boxes)
+                minute.max_people = max(minute.max_people, len(boxes))
+                pending.ts.extend([ts] * len(boxes))
+                pending.boxes.extend(boxes)
+                pending.scores.extend(scores if len(scores) == len(boxes) else [0.0] * len(boxes))
+        if flush_first is not None:
+            self._write({camera_id: flush_first})
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self._write(pending)
+        if time.time() - self._last_prune >= PRUNE_INTERVAL_S:
+            self.prune()
+
+    def _write(self, pending: dict[str, _Pending]) -> None:
+        columns, rows = self.cfg.heatmap_grid
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                for camera_id, chunk in pending.items():
+                    heat = self._heat_by_minute(chunk, columns, rows)
+                    if chunk.boxes:
+                        width, height = chunk.frame_size
+                        conn.execute(
+                            "INSERT INTO detection_tracks (camera, start_ts, end_ts, boxes, frame_width, frame_height, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (camera_id, chunk.start_ts, chunk.end_ts, len(chunk.boxes), width, height, pack_boxes(chunk.start_ts, chunk.ts, chunk.boxes, chunk.scores)),
+                        )
+                    for minute_ts, minute in chunk.minutes.items():
+                        self._merge(conn, "detection_activity", camera_id, minute_ts, minute, heat.get(minute_ts))
+                        self._merge(conn, "detection_activity_hourly", camera_id, minute_ts // HOUR * HOUR, minute, heat.get(minute_ts))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _heat_by_minute(chunk: _Pending, columns: int, rows: int) -> dict[int, Any]:
+        if not chunk.boxes:
+            return {}
+        width, height = chunk.frame_size
+        xywh = np.asarray(chunk.boxes, dtype=np.float64)
+        col = np.clip(((xywh[:, 0] + xywh[:, 2] / 2) * columns // max(width, 1)).astype(np.int64), 0, columns - 1)
+        row = np.clip(((xywh[:, 1] + xywh[:, 3] / 2) * rows // max(height, 1)).astype(np.int64), 0, rows - 1)
+        minutes = (np.asarray(chunk.ts) // MINUTE * MINUTE).astype(np.int64)
+        heat = {}
+        for minute_ts in np.unique(minutes):
+            grid = np.zeros(columns * rows, dtype=np.uint32)
+            mask = minutes == minute_ts
+            np.add.at(grid, row[mask] * columns + col[mask], 1)
+            heat[int(minute_ts)] = grid
+        return heat
+
+    @staticmethod
+    def _merge(conn: sqlite3.Connection, table: str, camera_id: str, bucket_ts: int, minute: _Minute, heat: Any) -> None:
+        # Buckets span several flushes; fold this minute into whatever is stored.
+        existing = conn.execute(
+            f"SELECT frames, people_frames, boxes, max_people, heat FROM {table} WHERE camera = ? AND bucket_ts = ?",
+            (camera_id, bucket_ts),
+        ).fetchone()
+        frames, people_frames, boxes, max_people = minute.frames, minute.people_frames, minute.boxes, minute.max_people
+        if existing is not None:
+            frames += existing[0]
+            people_frames += existing[1]
+            boxes += existing[2]
+            max_people = max(max_people, existing[3])
+            if existing[4] is not None:
+                stored = np.frombuffer(existing[4], dtype="<u2").astype(np.uint32)
+                heat = stored if heat is None else (heat + stored if stored.size == heat.size else heat)
+        blob = np.minimum(heat, 0xFFFF).astype("<u2").tobytes() if heat is not None else None
+        conn.execute(
+            f"INSERT OR REPLACE INTO {table} (camera, bucket_ts, frames, people_frames, boxes, max_people, heat) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (camera_id, bucket_ts, frames, people_frames, boxes, max_people, blob),
+        )
+
+    def prune(self) -> None:
+        self._last_prune = time.time()
+        cutoff = time.time() - self.cfg.track_retention_days * 86400
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM detection_tracks WHERE start_ts < ?", (cutoff,))
+                conn.execute("DELETE FROM detection_activity WHERE bucket_ts < ?", (cutoff,))
+                conn.execute("DELETE FROM detection_activity_hourly WHERE bucket_ts < ?", (cutoff - HOUR,))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _spans(since: int, until: float, hourly: bool) -> list[tuple[str, float, float]]:
+        """Cover ``[since, until)`` with whole hours from the hourly table and minutes at the ends."""
+        # This is what keeps a query over months in the milliseconds.
+        first_hour = -(-since // HOUR) * HOUR
+        last_hour = int(until // HOUR * HOUR)
+        if not hourly or first_hour >= last_hour:
+            return [("detection_activity", since, until)]
+        spans = [("detection_activity_hourly", first_hour, last_hour)]
+        if since < first_hour:
+            spans.insert(0, ("detection_activity", since, first_hour))
+        if last_hour < until:
+            spans.append(("detection_activity", last_hour, until))
+        return spans
+
+    def _select(self, columns: str, since: int, until: float, camera: str | None, hourly: bool, extra: str = "") -> tuple[str, list[Any]]:
+        parts = []
+        params: list[Any] = []
+        for table, lo, hi in self._spans(since, until, hourly):
+            parts.append(f"SELECT {columns} FROM {table} WHERE bucket_ts >= ? AND bucket_ts < ?{' AND camera = ?' if camera is not None else ''}{extra}")
+            params.extend([lo, hi] if camera is None else [lo, hi, camera])
+        return " UNION ALL ".join(parts), params
+
+    def timeline(self, since: float, until: float, bucket_s: int = 3600, camera: str | None = None) -> list[dict[str, Any]]:
+        """Activity per ``bucket_s`` (a multiple of a minute) counted from ``since``; empty buckets are omitted."""
+        origin = int(since // MINUTE * MINUTE)
+        bucket_s = max(MINUTE, int(bucket_s) // MINUTE * MINUTE)
+        # Hourly rows can only be used when every hour falls inside a single bucket.
+        hourly = origin % HOUR == 0 and bucket_s % HOUR == 0
+        inner, params = self._select("bucket_ts, frames, people_frames, boxes, max_people", origin, until, camera, hourly)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                f"SELECT ? + ((bucket_ts - ?) / ?) * ? AS bucket, SUM(frames), SUM(people_frames), SUM(boxes), MAX(max_people) "
+                f"FROM ({inner}) GROUP BY bucket ORDER BY bucket",
+                [origin, origin, bucket_s, bucket_s, *params],
+            ).fetchall()
+        finally:
+            conn.close()
+        return [
+            {"ts": bucket, "frames": frames, "people_frames": people_frames, "boxes": boxes, "max_people": max_people}
+            for bucket, frames, people_frames, boxes, max_people in rows
+        ]
+
+    def presence(self, since: float, until: float, camera: str | None = None, gap_s: float = 120.0) -> list[list[float]]:
+        """``[start, end]`` intervals, at minute resolution, in which someone was detected."""
+        inner, params = self._select("bucket_ts", int(since // MINUTE * MINUTE), until, camera, hourly=False, extra=" AND people_frames > 0")
+        conn = sqlite3.connect(self.db_path)
+        try:
+            minutes = [row[0] for row in conn.execute(f"SELECT DISTINCT bucket_ts FROM ({inner}) ORDER BY bucket_ts", params)]
+        finally:
+            conn.close()
+        intervals: list[list[float]] = []
+        for minute_ts in minutes:
+            if intervals and minute_ts - intervals[-1][1] <= gap_s:
+                intervals[-1][1] = minute_ts + MINUTE
+            else:
+                intervals.append([minute_ts, minute_ts + MINUTE])
+        return intervals
+
+    def heatmap(self, since: float, until: float, camera: str | None = None) -> dict[str, Any]:
+        """Box-centre counts on the ``heatmap_grid``, summed over the range (minute resolution)."""
+        columns, rows = self.cfg.heatmap_grid
+        inner, params = self._select("heat", int(since // MINUTE * MINUTE), until, camera, hourly=True, extra=" AND heat IS NOT NULL")
+        conn = sqlite3.connect(self.db_path)
+        try:
+            blobs = [row[0] for row in conn.execute(inner, params)]
+        finally:
+            conn.close()
+        cells = columns * rows
+        # Grids recorded under a different heatmap_grid setting are skipped.
+        blobs = [blob for blob in blobs if len(blob) == cells * 2]
+        grid = np.frombuffer(b"".join(blobs), dtype="<u2").reshape(-1, cells).sum(axis=0, dtype=np.uint64) if blobs else np.zeros(cells, dtype=np.uint64)
+        return {"columns": columns, "rows": rows, "max": int(grid.max(initial=0)), "grid": grid.reshape(rows, columns).tolist()}
+
+    def track(self, camera: str, since: float, until: float) -> dict[str, Any]:
+        """Every stored box for ``camera`` in the range, as ``[ts, x, y, w, h, score]`` rows."""
+        with self._lock:
+            # Include what has not been flushed yet, so a just-finished clip is complete.
+            pending = self._pending.get(camera)
+            unflushed = (list(pending.ts), list(pending.boxes), list(pending.scores), pending.frame_size) if pending is not None else None
+        conn = sqlite3.connect(self.db_path)
+        try:
+            chunks = conn.execute(
+                "SELECT start_ts, boxes, frame_width, frame_height, data FROM detection_tracks WHERE camera = ? AND start_ts < ? AND end_ts >= ? ORDER BY start_ts",
+                (camera, until, since),
+            ).fetchall()
+        finally:
+            conn.close()
+        detections: list[list[float]] = []
+        frame_size = None
+        for start_ts, count, width, height, data in chunks:
+            columns = unpack_boxes(data, count)
+            ts = columns["dt"].astype(np.float64) + start_ts
+            mask = (ts >= since) & (ts < until)
+            if mask.any():
+                frame_size = [width, height]
+                stacked = np.column_stack([ts[mask].round(3), *(columns[name][mask] for name in ("x", "y", "w", "h")), columns["score"][mask].astype(np.float64).round(3)])
+                detections.extend(stacked.tolist())
+        if unflushed is not None:
+            for ts, (x, y, w, h), score in zip(*unflushed[:3]):
+                if since <= ts < until:
+                    frame_size = list(unflushed[3])
+                    detections.append([round(ts, 3), x, y, w, h, round(score, 3)])
+        return {"camera": camera, "frame_size": frame_size, "detections": detections}
+
+
+TRACKS = lazy("tracks", DetectionTracks)
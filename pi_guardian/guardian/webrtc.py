@@ -4,116 +4,346 @@ import asyncio
 import contextlib
 import fractions
 import logging
+import time
+import uuid
+from dataclasses import dataclass, field
 from typing import Any
 
+import cv2
 import numpy as np
 
 import av
-from aiortc import MediaStreamTrack, RTCPeerConnection, RTCSessionDescription, RTCRtpSender
-from aiortc.contrib.media import MediaPlayer, MediaRecorder
+from aiortc import MediaStreamTrack, RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCRtpSender, RTCRtpTransceiver, RTCSessionDescription
+from aiortc.contrib.media import MediaPlayer, MediaRelay
+from aiortc.sdp import candidate_from_sdp
 
 from .config import CONFIG
-from .hardware import CAMERA
+from .cameras import CAMERAS
+from .frame_bus import reader_for
+from .webrtc_audio import OpusMicTrack, TalkbackMixer
+from .webrtc_quality import PeerQualityController, QualityLevel
 
 
 LOGGER = logging.getLogger(__name__)
 
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+
 
 class CameraVideoTrack(MediaStreamTrack):
     kind = "video"
 
-    def __init__(self):
+    def __init__(self, camera_id: str = "main"):
         super().__init__()
-        self._fps = CONFIG.hardware.camera_fps
-        self._ts = 0
+        self._unit = CAMERAS.get(camera_id) or CAMERAS.primary
+        self._fps = self._unit.spec.fps
+        self._max_width: int | None = None
+        self._start: float | None = None
+        self._next_at = 0.0
         self._logged = 0
+        self._seq = 0
+
+    def set_level(self, level: QualityLevel) -> None:
+        self._fps = min(level.fps, self._unit.spec.fps)
+        self._max_width = level.max_width
+
+    async def _pace(self) -> None:
+        # Sleep until the next frame is due at the current level's rate, so frames the
+        # viewer cannot take are never captured or encoded.
+        now = time.monotonic()
+        if self._next_at > now:
+            await asyncio.sleep(self._next_at - now)
+            now = self._next_at
+        self._next_at = max(now, self._next_at) + 1 / self._fps
+
+    def _scale(self, frame_array: np.ndarray) -> np.ndarray:
+        height, width = frame_array.shape[:2]
+        if not self._max_width or width <= self._max_width:
+            return frame_array
+        # Encoders want even dimensions.
+        target_h = max(2, round(height * self._max_width / width / 2) * 2)
+        target_w = self._max_width - self._max_width % 2
+        return cv2.resize(frame_array, (target_w, target_h), interpolation=cv2.INTER_AREA)
 
     async def recv(self) -> av.VideoFrame:
-        frame_array = await asyncio.to_thread(CAMERA.capture_frame)
+        await self._pace()
+        if CONFIG.process.split:
+            self._seq, frame_array = await asyncio.to_thread(reader_for(self._unit.id).next_frame, self._seq)
+        else:
+            frame_array = await asyncio.to_thread(self._unit.camera.capture_frame)
         if frame_array.mean() < 1:
             LOGGER.warning("WebRTC captured black frame (mean<1); substituting gray test frame")
             frame_array = np.full_like(frame_array, 64)
+        frame_array = self._scale(frame_array)
         frame = av.VideoFrame.from_ndarray(frame_array, format="rgb24")
-        frame.pts = self._ts
-        self._ts += 1
-        frame.time_base = fractions.Fraction(1, self._fps)
+        # Wall-clock timestamps keep playback speed right while the frame rate adapts.
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now
+        frame.pts = int((now - self._start) * VIDEO_CLOCK_RATE)
+        frame.time_base = VIDEO_TIME_BASE
         if self._logged < 3:
             LOGGER.info("WebRTC send frame %s shape=%s mean=%.2f", self._logged, frame_array.shape, float(frame_array.mean()))
             self._logged += 1
         return frame
 
 
+@dataclass(slots=True)
+class PeerSession:
+    id: str
+    pc: RTCPeerConnection
+    camera_id: str
+    created_ts: float = field(default_factory=time.time)
+    quality: PeerQualityController | None = None
+    warm: bool = False
+    setup_ms: float | None = None
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "camera": self.camera_id,
+            "state": self.pc.connectionState,
+            "age_s": round(time.time() - self.created_ts, 1),
+            "warm": self.warm,
+            "setup_ms": self.setup_ms,
+            "quality": self.quality.summary() if self.quality else None,
+        }
+
+
+def _rtc_configuration() -> RTCConfiguration:
+    servers = [
+        RTCIceServer(urls=server["urls"], username=server.get("username"), credential=server.get("credential"))
+        for server in CONFIG.rtc.ice_servers
+    ]
+    return RTCConfiguration(iceServers=servers)
+
+
+def _new_peer() -> tuple[RTCPeerConnection, RTCRtpTransceiver]:
+    pc = RTCPeerConnection(configuration=_rtc_configuration())
+    # The video transceiver exists before the offer is applied so aiortc binds it to the
+    # offer's video m-line and honours the codec preference (H264, then VP8).
+    video = pc.addTransceiver("video", direction="sendonly")
+    try:
+        codecs = [c for c in RTCRtpSender.getCapabilities("video").codecs if c.mimeType.lower().startswith("video/")]
+        h264 = [c for c in codecs if c.mimeType.lower() == "video/h264"]
+        vp8 = [c for c in codecs if c.mimeType.lower() == "video/vp8"]
+        preferred = h264 or vp8
+        if preferred:
+            video.setCodecPreferences(preferred)
+    except Exception:
+        pass
+    if CONFIG.rtc.mic_device or CONFIG.rtc.audio_device:
+        # Opus only: the microphone is sent as packets encoded once for every viewer.
+        audio = pc.addTransceiver("audio", direction="sendrecv")
+        audio.setCodecPreferences([c for c in RTCRtpSender.getCapabilities("audio").codecs if c.mimeType.lower() == "audio/opus"])
+    return pc, video
+
+
+@dataclass(slots=True)
+class _WarmPeer:
+    pc: RTCPeerConnection
+    video: RTCRtpTransceiver
+    created: float
+
+
+class PeerPool:
+    """A few idle peer connections with DTLS certificates made and ICE candidates gathered.
+
+    Gathering includes the STUN round trip, which dominated session setup; a pooled
+    connection's server-reflexive candidate is that cached STUN result. Entries are
+    discarded after ``prewarm_ttl_s`` because the NAT binding behind it goes stale.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._idle: list[_WarmPeer] = []
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self.hits = 0
+        self.misses = 0
+
+    async def start(self) -> None:
+        if self.size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._refill_loop(), name="webrtc-prewarm")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(warm.pc.close() for warm in idle), return_exceptions=True)
+
+    def take(self) -> _WarmPeer | None:
+        now = time.monotonic()
+        warm = None
+        while self._idle:
+            candidate = self._idle.pop(0)
+            if now - candidate.created < self.ttl:
+                warm = candidate
+                break
+            asyncio.create_task(candidate.pc.close())
+        if warm is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self._wake.set()
+        return warm
+
+    async def _warm_one(self) -> _WarmPeer:
+        pc, video = _new_peer()
+        # Public ORTC handle on the transport aiortc will reuse when answering.
+        await video.sender.transport.transport.iceGatherer.gather()
+        return _WarmPeer(pc=pc, video=video, created=time.monotonic())
+
+    async def _refill_loop(self) -> None:
+        while True:
+            now = time.monotonic()
+            fresh = [warm for warm in self._idle if now - warm.created < self.ttl]
+            for stale in (warm for warm in self._idle if warm not in fresh):
+                await stale.pc.close()
+            self._idle = fresh
+            while len(self._idle) < self.size:
+                try:
+                    self._idle.append(await self._warm_one())
+                except Exception as exc:
+                    LOGGER.warning("WebRTC pre-warm failed: %s", exc)
+                    break
+            self._wake.clear()
+            oldest = min((warm.created for warm in self._idle), default=now)
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), max(1.0, oldest + self.ttl - time.monotonic()))
+
+
 class WebRTCManager:
     def __init__(self):
-        self._pcs: set[RTCPeerConnection] = set()
+        self._sessions: dict[str, PeerSession] = {}
+        self._pool = PeerPool(CONFIG.rtc.prewarm_pool_size, CONFIG.rtc.prewarm_ttl_s)
+        # One microphone capture, Opus-encoded once and shared by every viewer.
+        self._mic: MediaPlayer | None = None
+        self._mic_opus: OpusMicTrack | None = None
+        self._relay = MediaRelay()
+        self._talkback = TalkbackMixer(CONFIG.rtc.audio_device, CONFIG.rtc.talkback_max_delay_ms)
+
+    async def start(self) -> None:
+        await self._pool.start()
+
+    def _mic_track(self) -> MediaStreamTrack | None:
+        if not CONFIG.rtc.mic_device:
+            return None
+        if self._mic is None:
+            self._mic = MediaPlayer(CONFIG.rtc.mic_device)
+            if self._mic.audio is not None:
+                self._mic_opus = OpusMicTrack(self._mic.audio, CONFIG.rtc.mic_bitrate)
+        return self._relay.subscribe(self._mic_opus) if self._mic_opus else None
 
-    async def handle_offer(self, offer: dict[str, Any]) -> dict[str, Any]:
-        pc = RTCPeerConnection()
-        self._pcs.add(pc)
-        player = MediaPlayer(CONFIG.rtc.mic_device) if CONFIG.rtc.mic_device else None
-        recorder = MediaRecorder(CONFIG.rtc.audio_device) if CONFIG.rtc.audio_device else None
+    def sessions(self) -> list[dict[str, Any]]:
+        return [session.summary() for session in self._sessions.values()]
+
+    def session(self, session_id: str) -> dict[str, Any] | None:
+        session = self._sessions.get(session_id)
+        return session.summary() if session else None
+
+    async def handle_offer(self, offer: dict[str, Any], camera_id: str = "main") -> dict[str, Any]:
+        started = time.monotonic()
+        warm = self._pool.take()
+        pc, video = (warm.pc, warm.video) if warm else _new_peer()
+        session = PeerSession(id=uuid.uuid4().hex, pc=pc, camera_id=camera_id, warm=warm is not None)
+        self._sessions[session.id] = session
+        try:
+            await self._answer(session, video, offer)
+        except BaseException:
+            # A rejected offer must not leave the session registered or its peer open.
+            await self._cleanup(session)
+            raise
+        session.setup_ms = round((time.monotonic() - started) * 1000, 1)
+        LOGGER.info("WebRTC session %s answered in %.0f ms (warm=%s)", session.id, session.setup_ms, session.warm)
+        return {
+            "sdp": pc.localDescription.sdp,
+            "type": pc.localDescription.type,
+            "iceServers": CONFIG.rtc.ice_servers,
+            "session_id": session.id,
+        }
+
+    async def _answer(self, session: PeerSession, video: RTCRtpTransceiver, offer: dict[str, Any]) -> None:
+        pc = session.pc
+        mic_track = self._mic_track()
 
         @pc.on("connectionstatechange")
         async def _on_state_change():
             LOGGER.info("WebRTC pc state=%s", pc.connectionState)
             if pc.connectionState in {"failed", "closed", "disconnected"}:
-                await self._cleanup_pc(pc)
+                await self._cleanup(session)
 
         @pc.on("iceconnectionstatechange")
         async def _on_ice_change():
             LOGGER.info("WebRTC ice state=%s", pc.iceConnectionState)
 
-        rtc_offer = RTCSessionDescription(sdp=offer["sdp"], type=offer["type"])
-        await pc.setRemoteDescription(rtc_offer)
-
-        # Video: send track; prefer H264 if available.
-        video_track = CameraVideoTrack()
-        video_sender = pc.addTrack(video_track)
-        try:
-            video_codecs = [c for c in RTCRtpSender.getCapabilities("video").codecs if c.mimeType.lower().startswith("video/")]
-            h264 = [c for c in video_codecs if c.mimeType.lower() == "video/h264"]
-            vp8 = [c for c in video_codecs if c.mimeType.lower() == "video/vp8"]
-            preferred = h264 or vp8 or video_codecs
-            if preferred:
-                video_sender.setCodecPreferences(preferred)
-        except Exception:
-            pass
-
-        # Audio (optional): mirror send if mic configured; receive audio into recorder if configured.
-        if player and player.audio:
-            audio_sender = pc.addTrack(player.audio)
-            try:
-                audio_codecs = [c for c in RTCRtpSender.getCapabilities("audio").codecs if c.mimeType.lower().startswith("audio/")]
-                opus = [c for c in audio_codecs if c.mimeType.lower() == "audio/opus"]
-                preferred = opus or audio_codecs
-                if preferred:
-                    audio_sender.setCodecPreferences(preferred)
-            except Exception:
-                pass
-
-        if recorder:
+        # Remote tracks are announced while the offer is applied, so listen first.
+        if CONFIG.rtc.audio_device:
             @pc.on("track")
             async def _on_track(track):
                 if track.kind == "audio":
-                    recorder.addTrack(track)
-                    await recorder.start()
+                    await self._talkback.add(session.id, track)
+
+        rtc_offer = RTCSessionDescription(sdp=offer["sdp"], type=offer["type"])
+        await pc.setRemoteDescription(rtc_offer)
+
+        video_track = CameraVideoTrack(session.camera_id)
+        video.sender.replaceTrack(video_track)
+        if CONFIG.rtc.abr_enabled:
+            session.quality = PeerQualityController(video.sender, video_track)
+
+        if mic_track is not None:
+            audio = next(transceiver for transceiver in pc.getTransceivers() if transceiver.kind == "audio")
+            audio.sender.replaceTrack(mic_track)
 
         answer = await pc.createAnswer()
         await pc.setLocalDescription(answer)
-        await self._wait_for_ice_gathering(pc)
-        return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type, "iceServers": CONFIG.rtc.ice_servers}
+        # Candidates are normally all gathered by now (and always for a pre-warmed peer);
+        # anything slower is left out and the client's trickled candidates carry the session.
+        await self._wait_for_ice_gathering(pc, CONFIG.rtc.ice_gather_timeout_s)
+        if session.quality is not None:
+            session.quality.start()
 
-    async def _cleanup_pc(self, pc: RTCPeerConnection) -> None:
-        if pc in self._pcs:
-            self._pcs.remove(pc)
-        await pc.close()
+    async def add_candidate(self, session_id: str, candidate: dict[str, Any]) -> bool:
+        """Apply a trickled remote ICE candidate. Returns False for an unknown session."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        line = candidate.get("candidate") or ""
+        if not line:
+            # End-of-candidates marker; aiortc needs nothing further.
+            return True
+        ice = candidate_from_sdp(line.split(":", 1)[1] if line.startswith("candidate:") else line)
+        ice.sdpMid = candidate.get("sdpMid")
+        ice.sdpMLineIndex = candidate.get("sdpMLineIndex")
+        await session.pc.addIceCandidate(ice)
+        return True
+
+    async def _cleanup(self, session: PeerSession) -> None:
+        self._sessions.pop(session.id, None)
+        if session.quality is not None:
+            session.quality.stop()
+        await self._talkback.remove(session.id)
+        await session.pc.close()
 
     async def close_all(self) -> None:
-        await asyncio.gather(*(pc.close() for pc in list(self._pcs)), return_exceptions=True)
-        self._pcs.clear()
+        await asyncio.gather(*(self._cleanup(session) for session in list(self._sessions.values())), return_exceptions=True)
+        self._sessions.clear()
+        await self._pool.close()
+        await self._talkback.close()
+        self._mic_opus = None
+        if self._mic is not None:
+            for track in (self._mic.audio, self._mic.video):
+                if track is not None:
+                    track.stop()
+            self._mic = None
 
     @staticmethod
-    async def _wait_for_ice_gathering(pc: RTCPeerConnection) -> None:
+    async def _wait_for_ice_gathering(pc: RTCPeerConnection, timeout: float) -> None:
         if pc.iceGatheringState == "complete":
             return
 
@@ -126,7 +356,5 @@ class WebRTCManager:
                 done.set_result(True)
 
         with contextlib.suppress(asyncio.TimeoutError):
-            await asyncio.wait_for(done, timeout=8)
-
+            await asyncio.wait_for(done, timeout=timeout)
 
-WEBRTC = WebRTCManager()
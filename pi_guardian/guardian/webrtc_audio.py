@@ -0,0 +1,157 @@
+"""Shared microphone and talkback audio for every WebRTC viewer."""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import fractions
+import logging
+import time
+
+import av
+import numpy as np
+from aiortc import MediaStreamTrack
+from aiortc.contrib.media import MediaRecorder
+from aiortc.mediastreams import MediaStreamError
+
+LOGGER = logging.getLogger(__name__)
+
+SAMPLE_RATE = 48000
+# 20 ms, the Opus frame duration aiortc itself uses.
+FRAME_SAMPLES = 960
+TIME_BASE = fractions.Fraction(1, SAMPLE_RATE)
+
+
+def _resampler() -> av.AudioResampler:
+    return av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE, frame_size=FRAME_SAMPLES)
+
+
+class OpusMicTrack(MediaStreamTrack):
+    """Encodes one microphone track to Opus packets for all subscribers.
+
+    aiortc passes pre-encoded ``av.Packet``s through, so each peer's sender only packetizes them.
+    """
+
+    kind = "audio"
+
+    def __init__(self, source: MediaStreamTrack, bitrate: int):
+        super().__init__()
+        self._source = source
+        self._codec = av.CodecContext.create("libopus", "w")
+        self._codec.bit_rate = bitrate
+        self._codec.format = "s16"
+        self._codec.layout = "mono"
+        self._codec.sample_rate = SAMPLE_RATE
+        self._codec.time_base = TIME_BASE
+        self._codec.options = {"application": "voip"}
+        self._resampler = _resampler()
+        self._pending: collections.deque[av.Packet] = collections.deque()
+        self._first_pts: int | None = None
+
+    async def recv(self) -> av.Packet:
+        while not self._pending:
+            frame = await self._source.recv()
+            for chunk in self._resampler.resample(frame):
+                for packet in self._codec.encode(chunk):
+                    # libopus starts at a negative pts (encoder pre-skip).
+                    if self._first_pts is None:
+                        self._first_pts = packet.pts
+                    packet.pts -= self._first_pts
+                    packet.time_base = TIME_BASE
+                    self._pending.append(packet)
+        return self._pending.popleft()
+
+
+class MixedAudioTrack(MediaStreamTrack):
+    """Real-time paced sum of every talkback source, silence when nobody talks."""
+
+    kind = "audio"
+
+    def __init__(self, mixer: TalkbackMixer):
+        super().__init__()
+        self._mixer = mixer
+        self._started: float | None = None
+        self._pts = 0
+
+    async def recv(self) -> av.AudioFrame:
+        if self._started is None:
+            self._started = time.monotonic()
+        else:
+            self._pts += FRAME_SAMPLES
+            delay = self._started + self._pts / SAMPLE_RATE - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        frame = av.AudioFrame.from_ndarray(self._mixer.mix().reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = SAMPLE_RATE
+        frame.pts = self._pts
+        frame.time_base = TIME_BASE
+        return frame
+
+
+class TalkbackMixer:
+    """Plays every viewer's talkback through one ``MediaRecorder``, open while anyone is connected."""
+
+    def __init__(self, device: str | None, max_delay_ms: int):
+        self.device = device
+        # Frames a source may run ahead of playback before its oldest audio is dropped.
+        self._depth = max(1, max_delay_ms * SAMPLE_RATE // 1000 // FRAME_SAMPLES)
+        self._sources: dict[str, collections.deque[np.ndarray]] = {}
+        self._readers: dict[str, asyncio.Task[None]] = {}
+        self._recorder: MediaRecorder | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def talkers(self) -> int:
+        return len(self._sources)
+
+    async def add(self, key: str, track: MediaStreamTrack) -> None:
+        if not self.device:
+            return
+        queue: collections.deque[np.ndarray] = collections.deque(maxlen=self._depth)
+        self._sources[key] = queue
+        self._readers[key] = asyncio.create_task(self._read(key, track, queue), name=f"talkback-{key[:8]}")
+        async with self._lock:
+            if self._recorder is None:
+                recorder = MediaRecorder(self.device)
+                recorder.addTrack(MixedAudioTrack(self))
+                await recorder.start()
+                self._recorder = recorder
+
+    async def _read(self, key: str, track: MediaStreamTrack, queue: collections.deque[np.ndarray]) -> None:
+        resampler = _resampler()
+        try:
+            while True:
+                frame = await track.recv()
+                for chunk in resampler.resample(frame):
+                    queue.append(chunk.to_ndarray().reshape(-1))
+        except MediaStreamError:
+            pass
+        except Exception as exc:
+            LOGGER.warning("Talkback source %s failed: %s", key, exc)
+        finally:
+            self._readers.pop(key, None)
+            await self.remove(key)
+
+    def mix(self) -> np.ndarray:
+        total = np.zeros(FRAME_SAMPLES, dtype=np.int32)
+        for queue in list(self._sources.values()):
+            if queue:
+                samples = queue.popleft()
+                total[: len(samples)] += samples[:FRAME_SAMPLES]
+        return np.clip(total, -32768, 32767).astype(np.int16)
+
+    async def remove(self, key: str) -> None:
+        self._sources.pop(key, None)
+        reader = self._readers.pop(key, None)
+        if reader is not None:
+            reader.cancel()
+        async with self._lock:
+            if not self._sources and self._recorder is not None:
+                recorder, self._recorder = self._recorder, None
+                with contextlib.suppress(Exception):
+                    await recorder.stop()
+
+    async def close(self) -> None:
+        for key in list(self._sources):
+            await self.remove(key)
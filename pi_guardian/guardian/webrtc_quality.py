@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import re
+import time
+from dataclasses import dataclass
+from importlib import metadata
+from typing import Any, Protocol
+
+from .config import CONFIG, WebRTCConfig
+
+LOGGER = logging.getLogger(__name__)
+
+# aiortc keeps each sender's encoder private; this is its mangled name on RTCRtpSender.
+ENCODER_ATTR = "_RTCRtpSender__encoder"
+# aiortc releases (major, minor) the attribute has been checked against.
+VERIFIED_AIORTC = ((1, 7), (1, 15))
+
+_warned: set[str] = set()
+
+
+def _warn_once(key: str, message: str, *args: Any) -> None:
+    if key not in _warned:
+        _warned.add(key)
+        LOGGER.warning(message, *args)
+
+
+@functools.lru_cache(maxsize=1)
+def _aiortc_version() -> tuple[int, ...] | None:
+    try:
+        return tuple(int(part) for part in re.findall(r"\d+", metadata.version("aiortc"))[:2])
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def sender_encoder(sender: Any) -> tuple[bool, Any]:
+    """(supported, encoder) for an aiortc sender; the encoder is None until the first frame."""
+    version = _aiortc_version()
+    low, high = VERIFIED_AIORTC
+    if version is not None and not low <= version <= high:
+        _warn_once("version", "Per-viewer ABR was checked against aiortc 1.7 to 1.15, not %s", ".".join(map(str, version)))
+    if not hasattr(sender, ENCODER_ATTR):
+        _warn_once("missing", "This aiortc has no %s; per-viewer ABR is turned off", ENCODER_ATTR)
+        return False, None
+    return True, getattr(sender, ENCODER_ATTR)
+
+
+@dataclass(slots=True, frozen=True)
+class QualityLevel:
+    max_width: int
+    fps: int
+    bitrate: int
+
+
+class ScalableTrack(Protocol):
+    def set_level(self, level: QualityLevel) -> None: ...
+
+
+class PeerQualityController:
+    """Adapts one viewer's video track to its link, from RTCP feedback seen by the sender.
+
+    Receiver reports (loss fraction, RTT) arrive through ``sender.getStats()``. aiortc
+    applies REMB estimates straight to the encoder's ``target_bitrate``, so an encoder
+    target that differs from the last value set here is taken as the viewer's REMB.
+    Congestion steps down the ladder at once; stepping up needs ``abr_hold_up_s`` of
+    clean reports and enough REMB headroom for the next level.
+    """
+
+    def __init__(self, sender: Any, track: ScalableTrack, cfg: WebRTCConfig | None = None):
+        self.cfg = cfg or CONFIG.rtc
+        self.sender = sender
+        self.track = track
+        self.levels = [QualityLevel(*level) for level in self.cfg.abr_ladder]
+        self.index = 0
+        self.loss = 0.0
+        self.rtt_ms: float | None = None
+        self.remb_bps: int | None = None
+        self.send_bps = 0.0
+        self.changes = 0
+        # Cleared for good when the sender's encoder cannot be reached.
+        self.enabled = True
+        self._applied_bitrate: int | None = None
+        self._last_bytes: tuple[float, int] | None = None
+        self._last_change = 0.0
+        self._good_since: float | None = None
+        self._task: asyncio.Task[None] | None = None
+        self.track.set_level(self.level)
+
+    @property
+    def level(self) -> QualityLevel:
+        return self.levels[self.index]
+
+    def start(self) -> None:
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run(), name="webrtc-quality")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.cfg.abr_interval_s)
+            try:
+                report = await self.sender.getStats()
+            except Exception as exc:
+                LOGGER.debug("WebRTC stats unavailable: %s", exc)
+                continue
+            self.update(report.values(), time.monotonic())
+
+    def update(self, stats: Any, now: float) -> None:
+        supported, encoder = sender_encoder(self.sender)
+        if not supported:
+            self._disable()
+            return
+        for stat in stats:
+            kind = getattr(stat, "type", None)
+            if kind == "remote-inbound-rtp":
+                # aiortc passes on the raw RTCP field: loss as an 8-bit fraction of 256.
+                self.loss = (getattr(stat, "fractionLost", 0) or 0) / 256
+                rtt = getattr(stat, "roundTripTime", None)
+                self.rtt_ms = rtt * 1000 if rtt is not None else None
+            elif kind == "outbound-rtp":
+                sent = int(getattr(stat, "bytesSent", 0))
+                if self._last_bytes is not None and now > self._last_bytes[0]:
+                    self.send_bps = (sent - self._last_bytes[1]) * 8 / (now - self._last_bytes[0])
+                self._last_bytes = (now, sent)
+        target = getattr(encoder, "target_bitrate", None)
+        if target is not None and self._applied_bitrate is not None and target != self._applied_bitrate:
+            self.remb_bps = int(target)
+        self._decide(now)
+        self._apply_bitrate(encoder)
+
+    def _decide(self, now: float) -> None:
+        rtt_high = self.rtt_ms is not None and self.rtt_ms > self.cfg.abr_rtt_down_ms
+        remb_low = self.remb_bps is not None and self.remb_bps < self.level.bitrate * 0.8
+        if self.loss > self.cfg.abr_loss_down or rtt_high or remb_low:
+            self._good_since = None
+            if self.index < len(self.levels) - 1 and now - self._last_change >= 2 * self.cfg.abr_interval_s:
+                self._step(self.index + 1, now)
+            return
+        if self.loss > self.cfg.abr_loss_up or self.index == 0:
+            self._good_since = None
+            return
+        if self.remb_bps is not None and self.remb_bps < self.levels[self.index - 1].bitrate:
+            self._good_since = None
+            return
+        self._good_since = self._good_since or now
+        if now - self._good_since >= self.cfg.abr_hold_up_s:
+            self._good_since = None
+            self._step(self.index - 1, now)
+
+    def _step(self, index: int, now: float) -> None:
+        LOGGER.info("WebRTC viewer quality %s -> %s (loss=%.3f rtt=%s remb=%s)", self.level, self.levels[index], self.loss, self.rtt_ms, self.remb_bps)
+        self.index = index
+        self.changes += 1
+        self._last_change = now
+        self.track.set_level(self.level)
+
+    def _disable(self) -> None:
+        # Without the encoder the bitrate cannot follow the level, so stay at full quality.
+        self.enabled = False
+        self.stop()
+        if self.index:
+            self.index = 0
+            self.track.set_level(self.level)
+
+    def _apply_bitrate(self, encoder: Any) -> None:
+        if encoder is None or not hasattr(encoder, "target_bitrate"):
+            return
+        wanted = self.level.bitrate if self.remb_bps is None else min(self.level.bitrate, self.remb_bps)
+        if wanted != self._applied_bitrate:
+            encoder.target_bitrate = wanted
+            # Encoders clamp the target; remember what stuck so it is not mistaken for REMB.
+            self._applied_bitrate = int(encoder.target_bitrate)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "level": self.index,
+            "max_width": self.level.max_width,
+            "fps": self.level.fps,
+            "bitrate": self._applied_bitrate or self.level.bitrate,
+            "loss": round(self.loss, 4),
+            "rtt_ms": round(self.rtt_ms, 1) if self.rtt_ms is not None else None,
+            "remb_bps": self.remb_bps,
+            "send_bps": round(self.send_bps),
+            "changes": self.changes,
+        }
@@ -0,0 +1,283 @@
+"""Streaming, resumable ZIP export of stored clips."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator
+
+from .media_crypto import media_size, open_media
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+ZIP32_LIMIT = 0xFFFFFFFF  # also the "see zip64 record" marker value
+ZIP64_THRESHOLD = ZIP32_LIMIT
+FLAGS = 0x0008 | 0x0800  # data descriptor follows, UTF-8 names
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+DATA_DESCRIPTOR = struct.Struct("<IIII")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+ZIP64_OFFSET_EXTRA = struct.Struct("<HHQ")
+ZIP64_EOCD = struct.Struct("<IQHHIIQQQQ")
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+EOCD = struct.Struct("<IHHHHIIH")
+
+_CRC_CACHE: OrderedDict[tuple[str, int, int], int] = OrderedDict()
+_CRC_CACHE_SIZE = 4096
+_CRC_LOCK = threading.Lock()
+
+
+def _dos_datetime(ts: float) -> tuple[int, int]:
+    t = time.localtime(max(ts, 315532800))  # DOS dates start in 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+@dataclass(slots=True)
+class ZipEntry:
+    name: bytes
+    size: int
+    mtime: float
+    path: Path | None = None
+    data: bytes | None = None
+    offset: int = 0
+    crc: int | None = None
+
+    @property
+    def cache_key(self) -> tuple[str, int, int]:
+        return (str(self.path), int(self.mtime * 1e9), self.size)
+
+    def local_header(self) -> bytes:
+        dos_time, dos_date = _dos_datetime(self.mtime)
+        return LOCAL_HEADER.pack(0x04034B50, 20, FLAGS, 0, dos_time, dos_date, 0, 0, 0, len(self.name), 0) + self.name
+
+    def descriptor(self) -> bytes:
+        assert self.crc is not None
+        return DATA_DESCRIPTOR.pack(0x08074B50, self.crc, self.size, self.size)
+
+    def central_header(self) -> bytes:
+        assert self.crc is not None
+        dos_time, dos_date = _dos_datetime(self.mtime)
+        zip64 = self.offset >= ZIP64_THRESHOLD
+        extra = ZIP64_OFFSET_EXTRA.pack(0x0001, 8, self.offset) if zip64 else b""
+        return (
+            CENTRAL_HEADER.pack(
+                0x02014B50,
+                (3 << 8) | 45,  # made by: unix, spec 4.5
+                45 if zip64 else 20,
+                FLAGS,
+                0,
+                dos_time,
+                dos_date,
+                self.crc,
+                self.size,
+                self.size,
+                len(self.name),
+                len(extra),
+                0,
+                0,
+                0,
+                0o100644 << 16,
+                ZIP32_LIMIT if zip64 else self.offset,
+            )
+            + self.name
+            + extra
+        )
+
+    @property
+    def central_size(self) -> int:
+        return CENTRAL_HEADER.size + len(self.name) + (ZIP64_OFFSET_EXTRA.size if self.offset >= ZIP64_THRESHOLD else 0)
+
+
+class ZipPlan:
+    """Byte-exact layout of a stored ZIP built from files on disk and small in-memory members."""
+
+    def __init__(self) -> None:
+        self.entries: list[ZipEntry] = []
+        self._names: set[bytes] = set()
+
+    def add_bytes(self, name: str, data: bytes, mtime: float | None = None) -> None:
+        entry = ZipEntry(name=name.encode(), size=len(data), mtime=mtime or time.time(), data=data, crc=zlib.crc32(data))
+        self._add(entry)
+
+    def add_file(self, name: str, path: Path) -> bool:
+        try:
+            stat = path.stat()
+            # Members hold plaintext; encrypted clips are decrypted while streaming.
+            size = media_size(path)
+        except (OSError, ValueError):
+            return False
+        if size >= ZIP32_LIMIT:
+            LOGGER.warning("Skipping %s in export: entries over 4 GiB are not supported", path)
+            return False
+        self._add(ZipEntry(name=name.encode(), size=size, mtime=stat.st_mtime, path=path))
+        return True
+
+    def _add(self, entry: ZipEntry) -> None:
+        if entry.name in self._names:
+            raise ValueError(f"Duplicate archive member {entry.name!r}")
+        self._names.add(entry.name)
+        self.entries.append(entry)
+
+    def finalize(self) -> None:
+        # Members are stored uncompressed with data descriptors, so every offset follows from
+        # names and sizes alone: the total length is known before any file is read.
+        offset = 0
+        for entry in self.entries:
+            entry.offset = offset
+            offset += LOCAL_HEADER.size + len(entry.name) + entry.size + DATA_DESCRIPTOR.size
+        self.cd_offset = offset
+        self.cd_size = sum(entry.central_size for entry in self.entries)
+        self.zip64 = self.cd_offset >= ZIP64_THRESHOLD or self.cd_size >= ZIP64_THRESHOLD or len(self.entries) >= 0xFFFF
+        tail = EOCD.size + (ZIP64_EOCD.size + ZIP64_LOCATOR.size if self.zip64 else 0)
+        self.total_size = self.cd_offset + self.cd_size + tail
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(entry.name + b"\0" + str(entry.size).encode() + b"\0" + str(entry.mtime).encode() + b"\0")
+            if entry.data is not None:
+                digest.update(entry.data)
+        self.etag = f'"{digest.hexdigest()[:32]}"'
+
+    def _tail(self) -> bytes:
+        count = len(self.entries)
+        out = bytearray()
+        if self.zip64:
+            zip64_offset = self.cd_offset + self.cd_size
+            out += ZIP64_EOCD.pack(0x06064B50, ZIP64_EOCD.size - 12, (3 << 8) | 45, 45, 0, 0, count, count, self.cd_size, self.cd_offset)
+            out += ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_offset, 1)
+        out += EOCD.pack(
+            0x06054B50,
+            0,
+            0,
+            0xFFFF if self.zip64 else count,
+            0xFFFF if self.zip64 else count,
+            ZIP32_LIMIT if self.zip64 else self.cd_size,
+            ZIP32_LIMIT if self.zip64 else self.cd_offset,
+            0,
+        )
+        return bytes(out)
+
+    @staticmethod
+    def _ensure_crc(entry: ZipEntry) -> None:
+        # The central directory needs the CRC of members a resumed range skipped.
+        if entry.crc is not None:
+            return
+        with _CRC_LOCK:
+            cached = _CRC_CACHE.get(entry.cache_key)
+        if cached is not None:
+            entry.crc = cached
+            return
+        assert entry.path is not None
+        crc = 0
+        with open_media(entry.path) as f:
+            while chunk := f.read(CHUNK_SIZE):
+                crc = zlib.crc32(chunk, crc)
+        _remember_crc(entry, crc)
+
+    def iter_range(self, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        """Yield archive bytes ``start``..``end`` inclusive."""
+        end = self.total_size - 1 if end is None else end
+        pos = 0
+
+        def clip(data: bytes) -> bytes:
+            lo = max(start - pos, 0)
+            hi = min(end - pos + 1, len(data))
+            return data[lo:hi] if lo < hi else b""
+
+        for entry in self.entries:
+            if pos > end:
+                return
+            header = entry.local_header()
+            if piece := clip(header):
+                yield piece
+            pos += len(header)
+            data_end = pos + entry.size
+            if data_end > start:
+                if entry.data is not None:
+                    if piece := clip(entry.data):
+                        yield piece
+                else:
+                    yield from self._stream_file(entry, pos, start, end)
+            pos = data_end
+            if pos > end:
+                return
+            if pos + DATA_DESCRIPTOR.size > start:
+                self._ensure_crc(entry)
+                if piece := clip(entry.descriptor()):
+                    yield piece
+            pos += DATA_DESCRIPTOR.size
+        if pos > end:
+            return
+        for entry in self.entries:
+            self._ensure_crc(entry)
+        central = b"".join(entry.central_header() for entry in self.entries) + self._tail()
+        if piece := clip(central):
+            yield piece
+
+    @staticmethod
+    def _stream_file(entry: ZipEntry, pos: int, start: int, end: int) -> Iterator[bytes]:
+        assert entry.path is not None
+        crc = 0
+        read = 0
+        with open_media(entry.path) as f:
+            while read < entry.size:
+                chunk = f.read(min(CHUNK_SIZE, entry.size - read))
+                if not chunk:
+                    raise OSError(f"{entry.path} shrank during export")
+                crc = zlib.crc32(chunk, crc)
+                lo = max(start - pos - read, 0)
+                hi = min(end - pos - read + 1, len(chunk))
+                read += len(chunk)
+                if lo < hi:
+                    yield chunk[lo:hi]
+                elif pos + read > end:
+                    return
+        _remember_crc(entry, crc)
+
+
+def _remember_crc(entry: ZipEntry, crc: int) -> None:
+    entry.crc = crc
+    if entry.path is None:
+        return
+    with _CRC_LOCK:
+        _CRC_CACHE[entry.cache_key] = crc
+        _CRC_CACHE.move_to_end(entry.cache_key)
+        while len(_CRC_CACHE) > _CRC_CACHE_SIZE:
+            _CRC_CACHE.popitem(last=False)
+
+
+def forget_crcs(paths: list[str]) -> None:
+    """Drop cached CRCs for deleted files."""
+    doomed = set(paths)
+    with _CRC_LOCK:
+        for key in [key for key in _CRC_CACHE if key[0] in doomed]:
+            del _CRC_CACHE[key]
+
+
+def plan_event_export(events: list[dict[str, Any]], include_thumbnails: bool = True) -> ZipPlan:
+    plan = ZipPlan()
+    manifest = []
+    for event in events:
+        clip_path = Path(event["clip_path"])
+        if not plan.add_file(f"clips/{clip_path.name}", clip_path):
+            continue
+        item = {key: event[key] for key in ("id", "created_ts", "label", "duration")}
+        item["clip"] = f"clips/{clip_path.name}"
+        if include_thumbnails and event["thumbnail_path"]:
+            thumb = Path(event["thumbnail_path"])
+            if plan.add_file(f"thumbnails/{thumb.name}", thumb):
+                item["thumbnail"] = f"thumbnails/{thumb.name}"
+        manifest.append(item)
+    # The manifest goes last and carries the newest event time so its bytes, and the
+    # whole layout, stay identical across a resumed download.
+    newest = max((event["created_ts"] for event in events), default=0.0)
+    plan.add_bytes("manifest.json", json.dumps(manifest, indent=1).encode(), mtime=newest)
+    plan.finalize()
+    return plan
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+av = pytest.importorskip("av")
+
+from guardian.clip_trim import gop_range, plan_trim
+from guardian.config import CONFIG
+from guardian.media_crypto import encrypt_file
+from guardian.mp4 import read_video_index
+
+FPS = 10
+GOP = 10
+FRAMES = 40
+
+
+def _encode(path: Path, codec: str, options: dict[str, str], container_options: dict[str, str] | None = None) -> Path:
+    with av.open(str(path), "w", options=container_options or {}) as out:
+        stream = out.add_stream(codec, rate=FPS, options=options)
+        stream.width, stream.height, stream.pix_fmt = 64, 48, "yuv420p"
+        stream.codec_context.gop_size = GOP
+        for i in range(FRAMES):
+            image = np.zeros((48, 64, 3), dtype=np.uint8)
+            image[:, :, 0] = (np.arange(64) * 4 + i * 6) % 256
+            image[: i + 1, :, 1] = 200
+            for packet in stream.encode(av.VideoFrame.from_ndarray(image, format="rgb24")):
+                out.mux(packet)
+        for packet in stream.encode():
+            out.mux(packet)
+    return path
+
+
+@pytest.fixture(scope="module", params=["mp4v", "h264"])
+def clip(request: pytest.FixtureRequest, tmp_path_factory: pytest.TempPathFactory) -> Path:
+    root = tmp_path_factory.mktemp(request.param)
+    if request.param == "mp4v":
+        # What OpenCV writes: MPEG-4 Part 2, moov after mdat.
+        return _encode(root / "clip.mp4", "mpeg4", {})
+    # What tiering writes: x264 with B-frames (composition offsets), moov first.
+    params = f"keyint={GOP}:min-keyint={GOP}:scenecut=0:bframes=2"
+    return _encode(root / "clip.mp4", "libx264", {"preset": "veryfast", "x264-params": params}, {"movflags": "faststart"})
+
+
+def _frames(path: Path) -> list[np.ndarray]:
+    with av.open(str(path)) as container:
+        return [frame.to_ndarray(format="rgb24") for frame in container.decode(video=0)]
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "first", "stop"),
+    [
+        (0.0, 0.5, 0, 10),
+        (1.0, 2.0, 10, 20),  # both ends on keyframes
+        (1.5, 2.01, 10, 30),  # widened to whole GOPs on both sides
+        (3.5, 99.0, 30, 40),  # runs to the end of the clip
+        (0.0, 99.0, 0, 40),
+    ],
+)
+def test_gop_range(clip: Path, start: float, end: float, first: int, stop: int) -> None:
+    index = read_video_index(clip)
+    assert index.sync == list(range(0, FRAMES, GOP))
+    assert gop_range(index, start, end) == (first, stop)
+
+
+@pytest.mark.parametrize(("start", "end"), [(0.0, 0.5), (1.5, 2.01), (3.5, 99.0), (0.0, 99.0)])
+def test_trim_decodes_to_the_source_frames(clip: Path, start: float, end: float) -> None:
+    index = read_video_index(clip)
+    first, stop = gop_range(index, start, end)
+    plan = plan_trim(clip, start, end)
+    assert (plan.start_s, plan.end_s) == (first / FPS, stop / FPS)
+    out = clip.with_name(f"trim-{start}-{end}.mp4")
+    data = b"".join(plan.iter_range())
+    assert len(data) == plan.total_size
+    out.write_bytes(data)
+    trimmed = _frames(out)
+    source = _frames(clip)
+    assert len(trimmed) == stop - first
+    assert all(np.array_equal(a, b) for a, b in zip(trimmed, source[first:stop]))
+    with av.open(str(out)) as container:
+        stream = container.streams.video[0]
+        assert float(stream.duration * stream.time_base) == pytest.approx((stop - first) / FPS)
+
+
+def test_ranges_and_etags(clip: Path) -> None:
+    plan = plan_trim(clip, 1.5, 2.5)
+    whole = b"".join(plan.iter_range())
+    size = plan.total_size
+    for lo, hi in [(0, 9), (len(plan.header) - 3, len(plan.header) + 3), (100, size - 1), (size - 1, size - 1)]:
+        assert b"".join(plan.iter_range(lo, hi)) == whole[lo : hi + 1]
+    assert plan_trim(clip, 1.2, 2.9).etag == plan.etag  # same GOPs
+    assert plan_trim(clip, 0.5, 2.9).etag != plan.etag
+
+
+def test_encrypted_clip_trims_to_the_same_bytes(clip: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    pytest.importorskip("cryptography")
+    monkeypatch.setattr(CONFIG, "storage_key", b"k" * 32)
+    sealed = clip.with_name("sealed.mp4")
+    encrypt_file(clip, sealed)
+    expected = b"".join(plan_trim(clip, 1.5, 2.5).iter_range())
+    assert b"".join(plan_trim(sealed, 1.5, 2.5).iter_range()) == expected
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+from guardian import file_reaper
+from guardian.config import BufferConfig
+
+
+class FlakyStore:
+    def __init__(self, paths: list[str]) -> None:
+        self.pending = list(paths)
+        self.failures = 1
+
+    def pending_deletions(self, limit: int) -> list[str]:
+        return self.pending[:limit]
+
+    def complete_deletions(self, paths: list[str]) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        self.pending = [path for path in self.pending if path not in paths]
+
+
+def _wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_reaper_survives_a_failed_completion(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    files = [tmp_path / f"clip{i}.mp4" for i in range(3)]
+    for path in files:
+        path.write_bytes(b"x")
+    store = FlakyStore([str(path) for path in files])
+    monkeypatch.setattr(file_reaper, "STORE", store)
+    reaper = file_reaper.FileReaper(BufferConfig(media_root=tmp_path, metadata_db=tmp_path / "events.db", delete_pause_seconds=0))
+    reaper.start()
+    try:
+        _wait_for(lambda: store.failures == 0)
+        assert not any(path.exists() for path in files)
+        assert store.pending
+        # The thread is still alive and finishes the batch on the next kick.
+        reaper.kick()
+        _wait_for(lambda: not store.pending)
+        assert reaper._thread is not None and reaper._thread.is_alive()
+    finally:
+        reaper.stop()
+
+
+def test_reaper_polls_without_a_kick(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"x")
+    store = FlakyStore([str(path)])
+    monkeypatch.setattr(file_reaper, "STORE", store)
+    reaper = file_reaper.FileReaper(BufferConfig(media_root=tmp_path, metadata_db=tmp_path / "events.db", delete_pause_seconds=0, delete_poll_seconds=0.05))
+    reaper.start()
+    try:
+        # The first completion fails; the next poll finishes the batch with nobody kicking.
+        _wait_for(lambda: not store.pending)
+    finally:
+        reaper.stop()
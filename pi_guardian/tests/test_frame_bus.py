@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import threading
+import uuid
+from typing import Callable, Iterator
+
+import numpy as np
+import pytest
+
+from guardian.config import ProcessConfig
+from guardian.frame_bus import SharedFrameReader, SharedFrameWriter
+
+SHAPE = (4, 6, 3)
+
+
+def _frame(seq: int) -> np.ndarray:
+    return np.full(SHAPE, seq % 256, dtype=np.uint8)
+
+
+@pytest.fixture
+def ring() -> Iterator[tuple[SharedFrameWriter, SharedFrameReader]]:
+    cfg = ProcessConfig(shm_name=f"guardian-test-{uuid.uuid4().hex[:8]}", shm_slots=4)
+    writer = SharedFrameWriter(cfg)
+    reader = SharedFrameReader(cfg)
+    try:
+        yield writer, reader
+    finally:
+        reader.close()
+        writer.close()
+
+
+class _CopyHook(np.ndarray):
+    """Slot view whose copy lets the writer run mid-copy, as a concurrent publisher would."""
+
+    hook: Callable[[], None]
+
+    def copy(self, *args, **kwargs):  # type: ignore[override]
+        out = np.ndarray.copy(self, *args, **kwargs)
+        type(self).hook()
+        return out
+
+
+def _publish(writer: SharedFrameWriter, seqs: range) -> None:
+    for seq in seqs:
+        writer.publish(_frame(seq), float(seq))
+
+
+def test_reads_latest_and_specific_frames(ring) -> None:
+    writer, reader = ring
+    assert reader.read() is None
+    _publish(writer, range(1, 7))
+    seq, record = reader.read()
+    assert seq == 6 and record.ts == 6.0 and (record.frame == 6).all()
+    assert reader.read(5)[1].ts == 5.0
+    # Seq 2 was overwritten by seq 6 in a 4-slot ring.
+    assert reader.read(2) is None
+
+
+def test_slot_being_written_is_not_returned(ring) -> None:
+    writer, reader = ring
+    _publish(writer, range(1, 4))
+    reader.read()
+    reader._ring._seq[3 % 4][0] = 0  # writer has started on this slot
+    assert reader.read(3) is None
+
+
+def test_torn_read_is_detected(ring) -> None:
+    writer, reader = ring
+    _publish(writer, range(1, 6))
+    assert reader.read(5) is not None
+    slot_ring = reader._ring
+    slot = 5 % slot_ring.slots
+    # Lap the ring while the reader copies seq 5 out of its slot.
+    _CopyHook.hook = lambda: _publish(writer, range(6, 10))
+    slot_ring._frames[slot] = slot_ring._frames[slot].view(_CopyHook)
+    assert reader.read(5) is None
+    # Reading the newest frame retries and returns a consistent one.
+    _CopyHook.hook = lambda: None
+    seq, record = reader.read()
+    assert seq == 9 and record.ts == 9.0 and (record.frame == 9).all()
+
+
+def test_close_waits_for_a_read_in_progress(ring) -> None:
+    writer, reader = ring
+    _publish(writer, range(1, 3))
+    assert reader.read(2) is not None
+    slot_ring = reader._ring
+    closer = threading.Thread(target=reader.close)
+    blocked: list[bool] = []
+
+    def close_mid_copy() -> None:
+        closer.start()
+        closer.join(0.1)
+        blocked.append(closer.is_alive())
+
+    _CopyHook.hook = close_mid_copy
+    slot_ring._frames[2 % slot_ring.slots] = slot_ring._frames[2 % slot_ring.slots].view(_CopyHook)
+    seq, record = reader.read(2)
+    closer.join()
+    assert blocked == [True]
+    assert seq == 2 and (record.frame == 2).all()
+    assert reader._ring is None
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from guardian.config import HLSConfig
+from guardian.llhls import LowLatencyHLSRing
+
+
+def _ring() -> LowLatencyHLSRing:
+    return LowLatencyHLSRing(HLSConfig(segment_seconds=1, part_seconds=0.25, list_size=3))
+
+
+def test_reset_keeps_served_parts_and_never_reuses_names() -> None:
+    ring = _ring()
+    for index in range(6):
+        ring.add_part(b"a%d" % index, 0.25)
+    # Segment 1 is half written when the encoder restarts; part_1_1 was already served.
+    assert ring.get(1, 1) == b"a5"
+    ring.reset()
+    ring.add_part(b"b0", 0.25)
+    assert ring.get(1, 1) == b"a5"
+    assert ring.get(1, None) == b"a4a5"
+    assert ring.get(2, 0) == b"b0"
+    playlist = ring.playlist()
+    assert "#EXTINF:0.500,\nseg_1.ts\n#EXT-X-DISCONTINUITY\n" in playlist
+    assert "part_2_0.ts" in playlist
+
+
+def test_discontinuity_sequence_survives_the_tagged_segment_sliding_out() -> None:
+    ring = _ring()
+    for _ in range(4):
+        ring.add_part(b"a", 0.25)
+    ring.reset()
+    for _ in range(4 * 5):
+        ring.add_part(b"b", 0.25)
+    playlist = ring.playlist()
+    assert "#EXT-X-DISCONTINUITY\n" not in playlist
+    assert "#EXT-X-DISCONTINUITY-SEQUENCE:1\n" in playlist
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("cryptography")
+from cryptography.exceptions import InvalidTag
+
+from guardian import media_crypto
+from guardian.config import CONFIG, EncryptionConfig
+from guardian.media_crypto import HEADER, TAG_SIZE, EncryptedWriter, is_encrypted, media_size, open_media, read_media_bytes
+
+CHUNK = 1024
+
+
+@pytest.fixture(autouse=True)
+def storage_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(CONFIG, "storage_key", b"k" * 32)
+
+
+def _seal(path: Path, data: bytes, cipher: str = "aes-gcm") -> Path:
+    writer = EncryptedWriter(path, EncryptionConfig(cipher=cipher, chunk_size=CHUNK))
+    writer.write(data)
+    writer.close()
+    return path
+
+
+@pytest.mark.parametrize("cipher", ["aes-gcm", "chacha20-poly1305"])
+@pytest.mark.parametrize("size", [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, 5 * CHUNK + 17])
+def test_round_trip(tmp_path: Path, cipher: str, size: int) -> None:
+    data = os.urandom(size)
+    path = _seal(tmp_path / "clip.mp4", data, cipher)
+    assert is_encrypted(path)
+    assert media_size(path) == size
+    assert read_media_bytes(path) == data
+
+
+def test_plaintext_files_pass_through(tmp_path: Path) -> None:
+    path = tmp_path / "old.mp4"
+    path.write_bytes(b"plain clip")
+    assert not is_encrypted(path)
+    assert read_media_bytes(path) == b"plain clip"
+
+
+def test_ranges_across_chunk_boundaries(tmp_path: Path) -> None:
+    data = os.urandom(4 * CHUNK + 300)
+    path = _seal(tmp_path / "clip.mp4", data)
+    with open_media(path) as f:
+        for start, length in [(0, 10), (CHUNK - 5, 10), (CHUNK, CHUNK), (CHUNK - 1, 2 * CHUNK + 2), (4 * CHUNK + 250, 100), (len(data) - 1, 5)]:
+            f.seek(start)
+            assert f.read(length) == data[start : start + length]
+
+
+def test_tampered_chunk_is_rejected_but_others_still_read(tmp_path: Path) -> None:
+    # CHUNK is far below the configured chunk_size, so this also checks that reads are
+    # buffered by the file's own chunk size.
+    data = os.urandom(3 * CHUNK)
+    path = _seal(tmp_path / "clip.mp4", data)
+    raw = bytearray(path.read_bytes())
+    raw[HEADER.size + (CHUNK + TAG_SIZE) + 7] ^= 0x01  # inside chunk 1
+    path.write_bytes(raw)
+    with open_media(path) as f:
+        assert f.read(100) == data[:100]
+        f.seek(CHUNK + 10)
+        with pytest.raises(InvalidTag):
+            f.read(10)
+
+
+@pytest.mark.parametrize("cut", [1, TAG_SIZE + 100])
+def test_truncated_final_chunk_is_rejected(tmp_path: Path, cut: int) -> None:
+    data = os.urandom(2 * CHUNK + 200)
+    path = _seal(tmp_path / "clip.mp4", data)
+    path.write_bytes(path.read_bytes()[:-cut])
+    with pytest.raises(InvalidTag):
+        read_media_bytes(path)
+
+
+def test_dropping_the_whole_final_chunk_is_rejected(tmp_path: Path) -> None:
+    # What remains ends on a full chunk sealed as "not last", so it cannot pass for a shorter file.
+    data = os.urandom(2 * CHUNK + 200)
+    path = _seal(tmp_path / "clip.mp4", data)
+    path.write_bytes(path.read_bytes()[: -(200 + TAG_SIZE)])
+    with pytest.raises(InvalidTag):
+        read_media_bytes(path)
+
+
+def test_fallback_key_never_seals(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(CONFIG, "storage_key", media_crypto.DEV_STORAGE_KEY)
+    path = tmp_path / "thumb.jpg"
+    media_crypto.write_media_bytes(path, b"jpeg")
+    assert not is_encrypted(path)
+    assert path.read_bytes() == b"jpeg"
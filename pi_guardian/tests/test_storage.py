@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+from guardian.config import BufferConfig
+from guardian.storage import EventStore
+
+
+def test_concurrent_metadata_patches_keep_every_key(tmp_path: Path) -> None:
+    store = EventStore(BufferConfig(media_root=tmp_path, metadata_db=tmp_path / "events.db"))
+    store.add_event("e1", tmp_path / "e1.mp4", duration=10, label="person", metadata={"camera": "main"})
+    writers = 8
+    barrier = threading.Barrier(writers)
+
+    def patch(n: int) -> None:
+        barrier.wait()
+        for i in range(25):
+            assert store.update_metadata("e1", {f"writer{n}": i})
+
+    threads = [threading.Thread(target=patch, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metadata = store.get_event("e1")["metadata"]
+    assert metadata == {"camera": "main", **{f"writer{n}": 24 for n in range(writers)}}
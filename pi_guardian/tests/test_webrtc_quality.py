@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import logging
+
+import pytest
+
+from guardian import webrtc_quality
+from guardian.config import WebRTCConfig
+from guardian.webrtc_quality import ENCODER_ATTR, PeerQualityController, QualityLevel
+
+
+class FakeTrack:
+    def __init__(self) -> None:
+        self.level: QualityLevel | None = None
+
+    def set_level(self, level: QualityLevel) -> None:
+        self.level = level
+
+
+def _controller(sender: SimpleNamespace | None = None) -> PeerQualityController:
+    # Stands in for an RTCRtpSender before its first frame: the encoder slot exists but is empty.
+    sender = SimpleNamespace(**{ENCODER_ATTR: None}) if sender is None else sender
+    return PeerQualityController(sender, FakeTrack(), WebRTCConfig())
+
+
+def _report(fraction_lost: int) -> list[SimpleNamespace]:
+    return [SimpleNamespace(type="remote-inbound-rtp", fractionLost=fraction_lost, roundTripTime=0.05)]
+
+
+@pytest.mark.parametrize(
+    ("fraction_lost", "loss", "first_level", "settled_level"),
+    [
+        (0, 0.0, 0, 0),
+        # 1/256 is about 0.4% loss: well under abr_loss_down, so the top rung stays.
+        (1, 1 / 256, 0, 0),
+        # About 10% loss steps down one rung per report until the bottom.
+        (26, 26 / 256, 1, 3),
+        (255, 255 / 256, 1, 3),
+    ],
+)
+def test_fraction_lost_is_a_fraction_of_256(fraction_lost: int, loss: float, first_level: int, settled_level: int) -> None:
+    controller = _controller()
+    now = 100.0
+    controller.update(_report(fraction_lost), now)
+    assert controller.loss == pytest.approx(loss)
+    assert controller.index == first_level
+    for _ in range(10):
+        now += controller.cfg.abr_interval_s * 2
+        controller.update(_report(fraction_lost), now)
+    assert controller.index == settled_level
+    assert controller.track.level == controller.levels[settled_level]
+
+
+def test_abr_turns_off_once_when_the_encoder_attribute_is_missing(monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture) -> None:
+    monkeypatch.setattr(webrtc_quality, "_warned", set())
+    caplog.set_level(logging.WARNING, logger=webrtc_quality.__name__)
+    controllers = [_controller(SimpleNamespace()) for _ in range(2)]
+    now = 100.0
+    for controller in controllers:
+        for _ in range(5):
+            now += controller.cfg.abr_interval_s * 2
+            controller.update(_report(255), now)
+        assert not controller.enabled
+        assert controller.index == 0
+        assert controller.track.level == controller.levels[0]
+        assert controller.summary()["enabled"] is False
+    assert sum(ENCODER_ATTR in record.getMessage() for record in caplog.records) == 1
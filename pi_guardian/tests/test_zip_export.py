@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import io
+import os
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from guardian import zip_export
+from guardian.zip_export import CHUNK_SIZE, ZipPlan
+
+
+def _cold_start() -> None:
+    # A resume is a fresh request: nothing remembered from the first attempt but what is on disk.
+    with zip_export._CRC_LOCK:
+        zip_export._CRC_CACHE.clear()
+
+
+def _plan(files: dict[str, Path]) -> ZipPlan:
+    plan = ZipPlan()
+    for name, path in files.items():
+        assert plan.add_file(name, path)
+    plan.add_bytes("manifest.json", b'{"clips": 2}', mtime=1_700_000_000.0)
+    plan.finalize()
+    return plan
+
+
+@pytest.fixture
+def files(tmp_path: Path) -> dict[str, Path]:
+    contents = {"clips/a.mp4": os.urandom(CHUNK_SIZE + 1234), "clips/b.mp4": os.urandom(5000), "thumbnails/a.jpg": b""}
+    paths = {}
+    for name, data in contents.items():
+        path = tmp_path / name.replace("/", "_")
+        path.write_bytes(data)
+        paths[name] = path
+    return paths
+
+
+def test_archive_is_valid_and_sized_up_front(files: dict[str, Path]) -> None:
+    plan = _plan(files)
+    archive = b"".join(plan.iter_range())
+    assert len(archive) == plan.total_size
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == [*files, "manifest.json"]
+        for name, path in files.items():
+            assert zf.read(name) == path.read_bytes()
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+
+def test_layout_and_etag_are_stable(files: dict[str, Path]) -> None:
+    first, second = _plan(files), _plan(files)
+    assert (first.total_size, first.etag) == (second.total_size, second.etag)
+
+
+def test_range_resume_matches_full_download(files: dict[str, Path]) -> None:
+    archive = b"".join(_plan(files).iter_range())
+    cuts = [1, 29, CHUNK_SIZE // 2, CHUNK_SIZE + 1300, CHUNK_SIZE + 3000, len(archive) - 40, len(archive) - 1]
+    for cut in cuts:
+        _cold_start()
+        resumed = _plan(files)
+        assert b"".join(resumed.iter_range(cut)) == archive[cut:]
+    for start, end in [(0, 99), (100, CHUNK_SIZE + 2000), (CHUNK_SIZE, len(archive) - 1)]:
+        _cold_start()
+        assert b"".join(_plan(files).iter_range(start, end)) == archive[start : end + 1]